@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Customer, Product, Order, Tag
+from .models import Customer, Product, Order, Tag, Job
 
 
 # @admin.register()  must be used only when you intend creating an adminModel class
@@ -8,3 +8,4 @@ admin.site.register(Customer)
 admin.site.register(Product)
 admin.site.register(Order)
 admin.site.register(Tag)
+admin.site.register(Job)
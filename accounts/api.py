@@ -0,0 +1,392 @@
+"""
+a JSON API over the customers, products, tags and orders, for the internal tools(rather than scraping the pages).
+
+    GET    /api/                          the resources and their URLs
+    POST   /api/                          a batch: {"operations": [{"resource": "orders", "data": {...}}, ...]}
+    GET    /api/<resource>/               a page of rows: {"data": [...], "next": <URL of the next page>|null}
+    POST   /api/<resource>/               creates a row -> 201 {"data": {...}}
+    GET    /api/<resource>/<id>/          one row
+    PATCH  /api/<resource>/<id>/          changes the fields sent
+    DELETE /api/<resource>/<id>/          -> 204
+
+resources: customers, products, tags and orders(see RESOURCES). The GETs take:
+    ?fields=status,note         only these fields(and the id): the SELECT is narrowed with only()
+    ?include=product,customer   the related rows nested in place of their ids, with prefetch_related(): a query per
+                                relation loads each related row once(a join, select_related(), would repeat a
+                                product in each of its 10 000 orders), and so does its serialization
+    ?after=<id>&limit=100       keyset pagination on the id, oldest first(see pagination.paginate_by_id), at most
+                                MAX_LIMIT rows a page
+    orders also take the query string of OrderFilter(?status=Pending&start_date=2020-11-01&note=...) and ?customer=<id>
+
+A page costs the same queries however many rows it has: the rows, plus one per prefetched relation. The serializers
+are built once per request(a getter per field asked for) and read the attributes of the loaded rows only.
+
+A batch holds at most MAX_BATCH creates(no "id") and updates(with an "id": only the fields sent change). It is
+validated as a whole, with one query per resource for the rows updated and one per ForeignKey for the rows pointed
+to(the tags of a product: a query per product), then saved in one transaction, the new orders with a single
+bulk_create(see forms.create_orders); any invalid operation saves nothing:
+400 {"errors": {"operations": {<index>: {<field>: [...]}}}}.
+
+The API is for admins, with the session cookie of a login. The requests with a body must be 'application/json':
+a cross-site page can't send those without a CORS preflight, so the views are exempt from the CSRF token check.
+"""
+import json
+from functools import wraps
+from operator import attrgetter
+
+from django.db import transaction
+from django.db.models import DecimalField, FileField
+from django.forms import modelform_factory
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+
+from .decorators import get_user_roles
+from .filters import ApiOrderFilter
+from .forms import ApiModelForm, create_orders
+from .models import Customer, Order, Product, Tag
+from .pagination import paginate_by_id
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+MAX_BATCH = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, errors, status=400):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+class Resource:
+    """
+    a model served by the API. fields: the fields serialized, in order; form_fields: the ones a client writes;
+    includes: {relation: the resource of its rows} for ?include=
+    """
+
+    def __init__(self, model, fields, form_fields, includes=None, filterset=None):
+        self.model = model
+        self.fields = {name: model._meta.get_field(name) for name in fields}
+        self.form = modelform_factory(model, form=ApiModelForm, fields=form_fields)
+        self.includes = includes or {}
+        self.filterset = filterset
+
+    def getters(self, fields=None, includes=()):
+        """
+        [(name, a function returning the field's JSON value of a row), ...] of fields(default: all)
+        """
+        getters = []
+        for name in fields or self.fields:
+            nested = RESOURCES[self.includes[name]].getters() if name in includes else None
+            getters.append((name, getter(self.fields[name], nested)))
+        return getters
+
+    def many_to_many(self):
+        return [name for name, field in self.fields.items() if field.many_to_many]
+
+    def narrow(self, queryset, fields, includes):
+        """
+        loads the fields and includes of queryset's rows, and nothing else
+        """
+        queryset = queryset.only(*[name for name in fields if not self.fields[name].many_to_many])
+        for name in fields:
+            if self.fields[name].many_to_many or name in includes:
+                # a ForeignKey too: prefetched rather than joined, each related row is loaded(and serialized) once
+                # however many rows point to it, and so are its own to-many relations
+                queryset = queryset.prefetch_related(name)
+            if name in includes:
+                nested = RESOURCES[self.includes[name]].many_to_many()
+                queryset = queryset.prefetch_related(*[f'{name}__{relation}' for relation in nested])
+        return queryset
+
+
+def getter(field, nested=None):
+    """
+    the function serializing field; nested: the getters of the related rows, to nest them instead of their ids
+    """
+    if nested:
+        serialized = {}  # pk: the related row's JSON, shared by the rows pointing to it
+
+        def serialize_related(related):
+            if related.pk not in serialized:
+                serialized[related.pk] = serialize(related, nested)
+            return serialized[related.pk]
+
+    if field.many_to_many:
+        if nested:
+            return lambda obj: [serialize_related(related) for related in getattr(obj, field.name).all()]
+        return lambda obj: [related.pk for related in getattr(obj, field.name).all()]
+    if field.is_relation and nested:
+        def get_related(obj):
+            related = getattr(obj, field.name)
+            return None if related is None else serialize_related(related)
+        return get_related
+    if isinstance(field, FileField):
+        return lambda obj: getattr(obj, field.attname).name or None
+    if isinstance(field, DecimalField):  # '25.00' however it was written
+        places = field.decimal_places
+        return lambda obj: None if getattr(obj, field.attname) is None else f'{getattr(obj, field.attname):.{places}f}'
+    return attrgetter(field.attname)  # a ForeignKey: the id
+
+
+def serialize(obj, getters):
+    return {name: get(obj) for name, get in getters}
+
+
+RESOURCES = {
+    'customers': Resource(Customer, ['id', 'user', 'name', 'phone', 'email', 'profile_picture', 'total_orders',
+                                     'pending_orders', 'out_for_delivery_orders', 'delivered_orders', 'date_created',
+                                     'updated_at'],
+                          ['name', 'phone', 'email']),
+    'products': Resource(Product, ['id', 'name', 'price', 'category', 'description', 'tags', 'date_created',
+                                   'updated_at'],
+                         ['name', 'price', 'category', 'description', 'tags'], includes={'tags': 'tags'}),
+    'tags': Resource(Tag, ['id', 'name'], ['name']),
+    'orders': Resource(Order, ['id', 'customer', 'product', 'status', 'note', 'date_created', 'updated_at'],
+                       ['customer', 'product', 'status', 'note'],
+                       includes={'customer': 'customers', 'product': 'products'}, filterset=ApiOrderFilter),
+}
+
+
+def api_view(*methods):
+    """
+    view decorator: admins only, the HTTP methods allowed, ApiErrors answered as JSON
+    """
+    def decorator(view_func):
+        @csrf_exempt
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'errors': {'user': ['Log in first.']}}, status=401)
+            if 'admin' not in get_user_roles(request):
+                return JsonResponse({'errors': {'user': ['Admins only.']}}, status=403)
+            if request.method not in methods:
+                response = JsonResponse({'errors': {'method': [f'{request.method} is not allowed.']}}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            try:
+                return view_func(request, *args, **kwargs)
+            except ApiError as error:
+                return JsonResponse({'errors': error.errors}, status=error.status)
+        return wrapper
+    return decorator
+
+
+def get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise ApiError({'resource': [f"Unknown resource '{name}', use one of: {', '.join(RESOURCES)}."]}, 404)
+
+
+def json_body(request):
+    if request.content_type != 'application/json':
+        raise ApiError({'body': ['Send application/json.']}, 415)
+    try:
+        body = json.loads(request.body)
+    except ValueError as error:
+        raise ApiError({'body': [f'Invalid JSON: {error}']})
+    if not isinstance(body, dict):
+        raise ApiError({'body': ['Send a JSON object.']})
+    return body
+
+
+def names(params, param, allowed):
+    """
+    the names of the comma separated list of query string param, all in allowed
+    """
+    values = [value.strip() for value in params.get(param, '').split(',') if value.strip()]
+    unknown = [value for value in values if value not in allowed]
+    if unknown:
+        raise ApiError({param: [f"Unknown: {', '.join(unknown)}; use any of: {', '.join(allowed)}."]})
+    return values
+
+
+def fieldset(resource, params):
+    """
+    (the fields, the included relations) asked for by ?fields= and ?include=; the id and the included relations are
+    always among the fields
+    """
+    includes = names(params, 'include', resource.includes)
+    fields = names(params, 'fields', resource.fields) or list(resource.fields)
+    fields = ['id'] + [name for name in fields if name != 'id'] + [name for name in includes if name not in fields]
+    return fields, includes
+
+
+def integer(params, param, default=None, minimum=0, maximum=None):
+    value = params.get(param)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = None
+    if value is None or value < minimum or (maximum is not None and value > maximum):
+        limit = f' to {maximum}' if maximum is not None else ''
+        raise ApiError({param: [f'Expected a whole number from {minimum}{limit}.']})
+    return value
+
+
+def errors_of(form):
+    return {name: list(errors) for name, errors in form.errors.items()}
+
+
+def form_data(resource, instance, data):
+    """
+    instance's current values of the form fields, overridden by data: a PATCH only sends what changes
+    """
+    current = {}
+    for name in resource.form._meta.fields:
+        field = resource.model._meta.get_field(name)
+        if field.many_to_many:
+            current[name] = [related.pk for related in getattr(instance, name).all()]
+        else:
+            current[name] = field.value_from_object(instance)  # a ForeignKey: the id
+    return {**current, **data}
+
+
+def save(form):
+    if not form.is_valid():
+        raise ApiError(errors_of(form))
+    return form.save()
+
+
+@api_view('GET', 'POST')
+def collection(request, resource):
+    resource = get_resource(resource)
+    if request.method == 'POST':
+        obj = save(resource.form(json_body(request)))
+        return JsonResponse({'data': serialize(obj, resource.getters())}, status=201)
+
+    fields, includes = fieldset(resource, request.GET)
+    queryset = resource.model.objects.all()
+    if resource.filterset:
+        filterset = resource.filterset(request.GET, queryset=queryset)
+        if not filterset.is_valid():
+            raise ApiError(errors_of(filterset.form))
+        queryset = filterset.qs
+    after = integer(request.GET, 'after')
+    limit = integer(request.GET, 'limit', DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT)
+
+    rows, after = paginate_by_id(resource.narrow(queryset, fields, includes), after, limit)
+    getters = resource.getters(fields, includes)
+    next_url = None
+    if after is not None:
+        params = request.GET.copy()
+        params['after'] = after
+        next_url = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({'data': [serialize(row, getters) for row in rows], 'next': next_url})
+
+
+@api_view('GET', 'PATCH', 'DELETE')
+def item(request, resource, pk):
+    resource = get_resource(resource)
+    fields, includes = fieldset(resource, request.GET) if request.method == 'GET' else (None, ())
+    queryset = resource.model.objects.filter(pk=pk)
+    obj = (resource.narrow(queryset, fields, includes) if fields else queryset).first()
+    if obj is None:
+        raise ApiError({'id': [f'No {resource.model._meta.verbose_name} {pk}.']}, 404)
+
+    if request.method == 'DELETE':
+        obj.delete()
+        return HttpResponse(status=204)
+    if request.method == 'PATCH':
+        obj = save(resource.form(form_data(resource, obj, json_body(request)), instance=obj))
+    return JsonResponse({'data': serialize(obj, resource.getters(fields, includes))})
+
+
+def batch_operations(body):
+    operations = body.get('operations')
+    if not isinstance(operations, list) or not 0 < len(operations) <= MAX_BATCH:
+        raise ApiError({'operations': [f'Send a list of 1 to {MAX_BATCH} operations.']})
+    errors = {}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('resource') not in RESOURCES:
+            errors[index] = {'resource': [f"Expected an object with a resource: {', '.join(RESOURCES)}."]}
+        elif not isinstance(operation.get('data'), dict):
+            errors[index] = {'data': ['Expected an object.']}
+        elif 'id' in operation and (not isinstance(operation['id'], int) or isinstance(operation['id'], bool)):
+            errors[index] = {'id': ['Expected a whole number.']}
+    if errors:
+        raise ApiError({'operations': errors})
+    return operations
+
+
+def batch_forms(operations):
+    """
+    the bound form of every operation; the rows updated, and the rows their ForeignKeys point to, are loaded with one
+    query per resource and per ForeignKey
+    """
+    instances = {}
+    for name in {operation['resource'] for operation in operations if 'id' in operation}:
+        resource = RESOURCES[name]
+        ids = [operation['id'] for operation in operations if operation['resource'] == name and 'id' in operation]
+        relations = [field for field in resource.form._meta.fields if field in resource.many_to_many()]
+        rows = resource.model.objects.filter(pk__in=ids).prefetch_related(*relations)
+        instances[name] = {row.pk: row for row in rows}
+
+    errors = {}
+    data = []
+    for index, operation in enumerate(operations):
+        resource = RESOURCES[operation['resource']]
+        if 'id' not in operation:
+            data.append(operation['data'])
+        elif operation['id'] in instances[operation['resource']]:
+            data.append(form_data(resource, instances[operation['resource']][operation['id']], operation['data']))
+        else:
+            data.append(None)
+            errors[index] = {'id': [f"No {resource.model._meta.verbose_name} {operation['id']}."]}
+
+    preloaded = {}
+    for name in {operation['resource'] for operation in operations}:
+        resource = RESOURCES[name]
+        preloaded[name] = {}
+        for field_name in resource.form._meta.fields:
+            field = resource.model._meta.get_field(field_name)
+            if field.many_to_many or not field.is_relation:
+                continue
+            ids = {str(values.get(field_name)) for operation, values in zip(operations, data)
+                   if values is not None and operation['resource'] == name}
+            ids = [int(pk) for pk in ids if pk.isdigit()]
+            preloaded[name][field_name] = list(field.related_model.objects.filter(pk__in=ids))
+
+    forms = []
+    for index, (operation, values) in enumerate(zip(operations, data)):
+        if values is None:
+            forms.append(None)
+            continue
+        name = operation['resource']
+        instance = instances[name][operation['id']] if 'id' in operation else None
+        form = RESOURCES[name].form(values, instance=instance, preloaded=preloaded[name])
+        forms.append(form)
+        if not form.is_valid():
+            errors[index] = errors_of(form)
+    if errors:
+        raise ApiError({'operations': errors})
+    return forms, preloaded
+
+
+@api_view('GET', 'POST')
+def root(request):
+    if request.method == 'GET':
+        return JsonResponse({'resources': {name: request.build_absolute_uri(reverse('api_collection', args=[name]))
+                                           for name in RESOURCES}})
+
+    operations = batch_operations(json_body(request))
+    forms, preloaded = batch_forms(operations)
+    new_orders = []
+    saved = []
+    with transaction.atomic():
+        for operation, form in zip(operations, forms):
+            if operation['resource'] == 'orders' and form.instance.pk is None:
+                order = form.save(commit=False)
+                new_orders.append(order)
+                saved.append(order)
+            else:
+                saved.append(form.save())
+        if new_orders:
+            products = preloaded['orders'].get('product', [])
+            create_orders(new_orders, categories={product.pk: product.category for product in products})
+    return JsonResponse({'data': [{'resource': operation['resource'], 'id': obj.pk}
+                                  for operation, obj in zip(operations, saved)]})
@@ -6,3 +6,4 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signals
+        import accounts.images  # registers its background job(see jobs.py)
@@ -0,0 +1,116 @@
+"""
+serves the WSGI application to an ASGI server(see cms/asgi.py), for the deployments behind one, e.g.
+'uvicorn cms.asgi:application --workers 4'.
+
+Django 2.2 has no ASGI handler(Django 3.0) nor async views(3.1): WsgiToAsgi runs each request through the WSGI
+application in a thread pool of `threads`, so a request still holds a thread while it waits on the database or S3.
+What the event loop takes over is the connection handling: slow clients, keep-alive and request bodies don't hold a
+thread. The request body is read whole before the application is called; a response is sent chunk by chunk as the
+application yields it(streamed exports too).
+
+Within a request, the independent queries of the read views run side by side(see concurrent.py); the slow calls to
+SMTP and to S3 for the image variants already run in the background jobs(see jobs.py).
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+THREADS = 16
+
+
+def environ(scope, body=b''):
+    """
+    the WSGI environ of the ASGI http scope(see PEP 3333: the strings are bytes decoded as latin-1)
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        if key in environ:  # repeated: one value, like HTTP/1.1 sends them; HTTP/2 sends a cookie header per cookie
+            value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+        environ[key] = value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class WsgiToAsgi:
+    def __init__(self, wsgi_application, threads=THREADS):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'")
+
+        body = await read_body(receive)
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(self.executor, self.respond, environ(scope, body), send_from_thread)
+
+    def respond(self, environ, send):
+        """
+        calls the WSGI application(in a thread of the pool) and sends its response as ASGI messages
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def start():
+            if not response.get('started'):
+                send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                response['started'] = True
+
+        chunks = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in chunks:  # start_response() may be called by the first iteration
+                start()
+                if chunk:
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            start()
+            send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()  # the WSGI handler's request_finished: the database connections are released
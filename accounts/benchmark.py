@@ -0,0 +1,190 @@
+"""
+helpers shared by the benchmark management commands (manage.py bench_*).
+
+Benchmarks seed their own data inside a transaction that is rolled back at the end, so they can be pointed at any
+database without leaving rows behind.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .models import Customer, Order, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rollback():
+    """
+    runs the block inside a transaction that is always rolled back
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def seed(customers=100, orders=1000, products=20, batch_size=5000):
+    """
+    bulk inserts products, customers and orders(spread randomly over products, customers and statuses)
+
+    orders are built `batch_size` at a time to bound memory; bulk_create() picks the backend's own insert batch size
+    """
+    product_objs = Product.objects.bulk_create(
+        [Product(name=f'Product {i}', price=i + 1, category=random.choice(Product.CATEGORY)[0])
+         for i in range(products)])
+    Customer.objects.bulk_create(
+        [Customer(name=f'Customer {i}', phone=f'{i:011d}', email=f'customer{i}@example.com')
+         for i in range(customers)])
+
+    # bulk_create only sets primary keys on PostgreSQL, so re-read them
+    product_ids = [p.id for p in product_objs] if product_objs[0].id else list(
+        Product.objects.values_list('id', flat=True))
+    customer_ids = list(Customer.objects.values_list('id', flat=True))
+    statuses = [status for status, _ in Order.STATUS]
+
+    for start in range(0, orders, batch_size):
+        Order.objects.bulk_create(
+            [Order(customer_id=random.choice(customer_ids), product_id=random.choice(product_ids),
+                   status=random.choice(statuses), note=f'note {start + i}')
+             for i in range(min(batch_size, orders - start))])
+
+
+def measure(func, repeat=5):
+    """
+    calls func() `repeat` times, returns (queries issued by one call, best wall time in milliseconds)
+    """
+    best = None
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - start) * 1000
+        queries = len(captured)
+        best = elapsed if best is None else min(best, elapsed)
+    return queries, best
+
+
+def percentile(samples, pct):
+    """
+    the pct(0-100) percentile of samples, nearest-rank
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def timings(func, repeat):
+    """
+    calls func() `repeat` times, returns the wall time of each call in milliseconds
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+# view benchmarks('manage.py bench_views')
+RELOGIN_VIEWS = {'logout'}  # views that end the session: logged in again before every request
+
+
+def view_urls():
+    """
+    {url name: (user or None, url)} for the GET requests of the views of accounts/urls.py, on the current data: an
+    admin, and the customer with the most orders
+    """
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+
+    admin = User.objects.filter(groups__name='admin').order_by('pk').first()
+    customer = Customer.objects.filter(user__isnull=False).select_related('user').order_by('-total_orders').first()
+    order = customer and customer.order_set.order_by('-pk').first()
+    user = customer and customer.user
+
+    urls = {
+        'home': (admin, reverse('home')),
+        'products': (admin, reverse('products')),
+        'export_orders': (admin, reverse('export_orders') + '?status=Pending'),
+        'search': (admin, reverse('search') + '?q=order'),
+        'metrics': (admin, reverse('metrics')),
+        'db_metrics': (admin, reverse('db_metrics')),
+        'order_reports': (admin, reverse('order_reports')),
+        'api_root': (admin, reverse('api_root')),
+        'api_collection': (admin, reverse('api_collection', args=['orders']) + '?include=customer,product'),
+        'register': (None, reverse('register')),
+        'login': (None, reverse('login')),
+        'password_reset': (None, reverse('password_reset')),
+        'password_reset_done': (None, reverse('password_reset_done')),
+        'password_reset_confirm': (None, reverse('password_reset_confirm', args=['MQ', 'set-password'])),
+        'password_reset_complete': (None, reverse('password_reset_complete')),
+    }
+    if customer:
+        urls.update({
+            'customer': (admin, reverse('customer', args=[customer.pk])),
+            'create_order': (admin, reverse('create_order', args=[customer.pk])),
+            'user_page': (user, reverse('user_page')),
+            'account': (user, reverse('account')),
+            'logout': (user, reverse('logout')),
+        })
+    if order:
+        urls.update({
+            'update_order': (admin, reverse('update_order', args=[order.pk])),
+            'delete_order': (admin, reverse('delete_order', args=[order.pk])),
+            'api_item': (admin, reverse('api_item', args=['orders', order.pk])),
+        })
+    return urls
+
+
+def bench_view(client, name, user, url, repeat=20, warmup=2):
+    """
+    GETs url `warmup` + `repeat` times through the test client(the whole middleware/WSGI handler stack, without a
+    socket), returns {'url', 'status', 'requests', 'throughput'(requests/s), 'latency_ms': {p50, p95, p99, mean},
+    'queries'(per request, the last one)}
+    """
+    def login():
+        client.logout()
+        if user:
+            client.force_login(user)
+
+    def get():
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)  # a streamed response is only done once read
+        return response
+
+    login()
+    for _ in range(warmup):
+        get()
+        if name in RELOGIN_VIEWS:
+            login()
+
+    samples = []
+    for _ in range(repeat):
+        if name in RELOGIN_VIEWS:
+            login()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = get()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'url': url,
+        'status': response.status_code,
+        'requests': repeat,
+        'throughput': round(repeat / (sum(samples) / 1000), 1) if sum(samples) else 0,
+        'latency_ms': {'p50': round(percentile(samples, 50), 2), 'p95': round(percentile(samples, 95), 2),
+                       'p99': round(percentile(samples, 99), 2), 'mean': round(sum(samples) / len(samples), 2)},
+        'queries': len(captured),
+    }
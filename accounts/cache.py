@@ -0,0 +1,122 @@
+"""
+caching of the product catalogue(the products page) in Django's cache framework.
+
+Keys are versioned: every cached value's key contains the current catalogue version, and any change to a Product,
+a Tag or a product's tags bumps the version(see signals.py), so stale entries are never read again and simply expire.
+The version is a row in the database(DataVersion, read with a primary key lookup), so a change made by one worker
+is seen by all of them whatever the cache backend, and a bump rolls back with its transaction. If the row is lost,
+a new one is started from the clock so old keys can't be reused.
+
+Hits and misses are counted per cached item, in the cache; see 'manage.py cache_stats'. They are only shared by the
+workers if the cache is(settings.CACHES): with the default LocMemCache each worker process counts its own.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.template.loader import render_to_string
+
+from .models import DataVersion, Product
+
+CATALOGUE_VERSION = 'catalogue'  # DataVersion.name
+CATALOGUE_TIMEOUT = 60 * 60 * 24
+
+STATS_KEY = 'accounts:cache-stats:{name}:{outcome}'
+CACHED_ITEMS = ['products', 'products_table']
+
+# the backends that keep the entries in the process: every worker has its own copy
+LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """
+    whether the workers share the cache(settings.CACHES): an entry deleted by one is gone for all of them
+    """
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_BACKENDS
+
+
+def stored_version(name):
+    """
+    the version counter name(a DataVersion row), shared by the workers through the primary database
+    """
+    versions = DataVersion.objects.using(DEFAULT_DB_ALIAS)  # a replica may lag behind the rows it versions
+    version = versions.filter(name=name).values_list('version', flat=True).first()
+    if version is None:  # first use, or the row was lost: started from the clock, so it doesn't repeat an old one
+        version = versions.get_or_create(name=name, defaults={'version': int(time.time() * 1000)})[0].version
+    return version
+
+
+def bump_stored_version(name):
+    """
+    changes the version counter name; in the caller's transaction, so it commits(or rolls back) with the change
+    """
+    if not DataVersion.objects.using(DEFAULT_DB_ALIAS).filter(name=name).update(version=F('version') + 1):
+        stored_version(name)
+
+
+def catalogue_version():
+    return stored_version(CATALOGUE_VERSION)
+
+
+def bump_catalogue_version(**kwargs):
+    """
+    invalidates every cached catalogue value; connected to the Product/Tag signals
+    """
+    bump_stored_version(CATALOGUE_VERSION)
+
+
+def count(name, outcome):
+    key = STATS_KEY.format(name=name, outcome=outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cache_stats():
+    """
+    {'products': {'hits': 10, 'misses': 2, 'hit_rate': 0.83, 'miss_rate': 0.17}, ...}
+    """
+    stats = {}
+    for name in CACHED_ITEMS:
+        hits = cache.get(STATS_KEY.format(name=name, outcome='hits'), 0)
+        misses = cache.get(STATS_KEY.format(name=name, outcome='misses'), 0)
+        total = hits + misses
+        stats[name] = {'hits': hits, 'misses': misses,
+                       'hit_rate': hits / total if total else 0, 'miss_rate': misses / total if total else 0}
+    return stats
+
+
+def get_or_build(name, build, version=None):
+    """
+    returns the cached value of name for the catalogue version(default: the current one); on a miss, build() and cache
+    it
+    """
+    key = f'accounts:catalogue:{version or catalogue_version()}:{name}'
+    value = cache.get(key)
+    if value is None:
+        count(name, 'misses')
+        value = build()
+        cache.set(key, value, CATALOGUE_TIMEOUT)
+    else:
+        count(name, 'hits')
+    return value
+
+
+def cached_products(version=None):
+    """
+    the products with their tags(a list, not a lazy queryset, so it can be cached)
+    """
+    return get_or_build('products', lambda: list(Product.objects.prefetch_related('tags')), version)
+
+
+def cached_products_table(version=None):
+    """
+    the rendered product table of the products page, for the catalogue version(default: the current one)
+    """
+    version = version or catalogue_version()
+    return get_or_build('products_table', lambda: render_to_string(
+        '_partials/_products_table.html', {'products': cached_products(version)}), version)
@@ -0,0 +1,54 @@
+"""
+the independent queries of a read view, run side by side: a page waiting on a remote database pays the round trip of
+its slowest query rather than the sum of them.
+
+Django 2.2 has no async views or ORM, so gather() runs the queries in a thread pool of settings.CONCURRENT_QUERIES
+threads, each query on its thread's own database connection(persistent or pooled like the request's, see
+settings.DATABASES), with the request's context(the replica routing, see db/routers.py). The first function runs in
+the request's thread.
+
+The pool is shared by the requests of a process: each of its threads holds a connection, so a web worker opens up to
+CONCURRENT_QUERIES connections more than its request threads; keep the total under the database's limit. 0 turns it
+off: the functions run one after the other, as they do inside a transaction(its rows are only visible to its own
+connection) and in the tests. The queries run by the threads are not counted by the request's instrumentation(see
+middleware.py).
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executors = {}  # threads: ThreadPoolExecutor
+_lock = threading.Lock()
+
+
+def executor(threads):
+    with _lock:
+        if threads not in _executors:
+            _executors[threads] = ThreadPoolExecutor(threads, thread_name_prefix='queries')
+        return _executors[threads]
+
+
+def run(func, context):
+    close_old_connections()  # like a request: drop the obsolete or broken connection of this thread
+    try:
+        return context.run(func)
+    finally:
+        close_old_connections()  # CONN_MAX_AGE = 0(or pooled): closed/returned now
+
+
+def gather(*funcs):
+    """
+    [func() for func in funcs], run concurrently if settings.CONCURRENT_QUERIES; the exception of a function is raised
+    """
+    threads = getattr(settings, 'CONCURRENT_QUERIES', 0)
+    if threads < 1 or len(funcs) < 2 or connection.in_atomic_block:
+        return [func() for func in funcs]
+    futures = [executor(threads).submit(run, func, contextvars.copy_context()) for func in funcs[1:]]
+    try:
+        first = funcs[0]()
+    finally:
+        wait(futures)  # never leave one running past the request
+    return [first, *[future.result() for future in futures]]
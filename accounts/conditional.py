@@ -0,0 +1,108 @@
+"""
+conditional GET for the pages staff keep open and refresh: an unchanged page is answered 304 Not Modified before its
+lists are queried or its template rendered.
+
+A page's ETag hashes its fingerprint: the user(id, name, roles: the pages differ per user and role), the latest
+updated_at of the rows it shows(one indexed MAX() per table) and the data version, a counter bumped when an order,
+customer or product is deleted(a delete doesn't change any MAX(updated_at)). Last-Modified is the latest updated_at.
+The responses are 'Cache-Control: private, no-cache': browsers keep them but revalidate each time.
+
+The data version is a row in the database(DataVersion), read with a primary key lookup: every worker sees a delete
+made by another, whatever the cache backend. QuerySet.update() doesn't set updated_at: set it along with the fields
+a page shows.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import bump_stored_version, catalogue_version, stored_version
+from .concurrent import gather
+from .decorators import get_user_roles
+from .models import Customer, Order, Product
+
+DATA_VERSION = 'pages'  # DataVersion.name
+
+
+def data_version():
+    return stored_version(DATA_VERSION)
+
+
+def bump_data_version(**kwargs):
+    """
+    changes the ETag of every conditional page; connected to the Order/Customer/Product post_delete signals, so it
+    commits(or rolls back) with the delete
+    """
+    bump_stored_version(DATA_VERSION)
+
+
+def latest_update(queryset):
+    return queryset.order_by().aggregate(latest=Max('updated_at'))['latest']
+
+
+def conditional_page(fingerprint):
+    """
+    view decorator, below the access checks: fingerprint(request, *args, **kwargs) -> (values, latest updated_at)
+    of what the page shows; computed once per request
+    """
+    def decorator(view_func):
+        def page_version(request, *args, **kwargs):
+            if not hasattr(request, '_page_version'):
+                request._page_version = None, None
+                # pending messages are shown by the next page rendered: not a 304
+                if request.method in ('GET', 'HEAD') and not len(messages.get_messages(request)):
+                    values, last_modified = fingerprint(request, *args, **kwargs)
+                    user = request.user
+                    key = repr((user.pk, user.get_username(), sorted(get_user_roles(request)), data_version(), values))
+                    request._page_version = hashlib.md5(key.encode()).hexdigest(), last_modified
+            return request._page_version
+
+        conditional_view = condition(etag_func=lambda *args, **kwargs: page_version(*args, **kwargs)[0],
+                                     last_modified_func=lambda *args, **kwargs: page_version(*args, **kwargs)[1])(
+            view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def latest(*updates):
+    updates = [update for update in updates if update is not None]
+    return max(updates) if updates else None
+
+
+# the fingerprints of the pages(the query string needn't be part of them: an ETag is only compared for its own URL);
+# their MAX() queries are independent, run side by side(see concurrent.py)
+def dashboard_fingerprint(request):
+    # orders with their product and customer, customers, and the totals of both
+    updates = gather(lambda: latest_update(Order.objects.all()), lambda: latest_update(Customer.objects.all()),
+                     lambda: latest_update(Product.objects.all()))
+    return updates, latest(*updates)
+
+
+def products_fingerprint(request):
+    # the cached product table: it changes with the catalogue version(in the database, the same for every worker);
+    # the view renders the table of this version, so the ETag always names what is sent
+    request.catalogue_version, updated = gather(catalogue_version, lambda: latest_update(Product.objects.all()))
+    return request.catalogue_version, updated
+
+
+def customer_fingerprint(request, pk):
+    updates = gather(lambda: latest_update(Customer.objects.filter(pk=pk)),
+                     lambda: latest_update(Order.objects.filter(customer=pk)),
+                     lambda: latest_update(Product.objects.all()))
+    return updates, latest(*updates)
+
+
+def user_page_fingerprint(request):
+    customer = request.user.customer  # loaded once, the view uses it too
+    updates = [customer.updated_at, *gather(lambda: latest_update(Order.objects.filter(customer=customer)),
+                                            lambda: latest_update(Product.objects.all()))]
+    return updates, latest(*updates)
@@ -0,0 +1,217 @@
+"""
+database connection reuse: health checks and an optional in-process connection pool.
+
+Django 2.2 reuses a connection across requests when CONN_MAX_AGE is set, but doesn't check it before use: a
+connection dropped by the server(RDS failover, idle timeout) fails the next request. With CONN_HEALTH_CHECKS, the
+first query of each request is preceded by a ping(SELECT 1) of the reused connection, which is replaced if dead.
+
+Persistent connections are per thread, so a threaded WSGI server keeps one open connection per thread. With POOL,
+threads share at most MAX_SIZE connections instead: a connection is checked out when a request first needs the
+database and checked back in when Django closes it at the end of the request(so CONN_MAX_AGE must be 0).
+
+DATABASES = {'default': {
+    'ENGINE': 'accounts.db.postgresql',
+    'CONN_MAX_AGE': 0,  # with a POOL; or e.g. 600 for persistent connections without one
+    'CONN_HEALTH_CHECKS': True,
+    'POOL': {'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_AGE': 600},  # or None
+}}
+    MAX_SIZE: open connections(idle + in use); TIMEOUT: seconds to wait for one before PoolTimeout
+    MAX_AGE: seconds after which a connection is closed instead of reused(None: never)
+
+Counters(see db_stats()): connections opened, checkouts, waits(a checkout that had to wait for a connection),
+wait time, timeouts, reconnections(dead connections replaced) and discarded connections, per database alias.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db.utils import OperationalError
+
+POOL_DEFAULTS = {'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_AGE': None}
+
+_pools = {}  # {alias: ConnectionPool}, shared by the threads
+_pools_lock = threading.Lock()
+_stats = defaultdict(Counter)  # {alias: Counter} of the connections that aren't pooled
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, max_size=10, timeout=5, max_age=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.idle = []  # last in, first out: the warm connections are reused, the others age out
+        self.opened_at = {}  # {id(connection): time.monotonic()} of every open connection
+        self.connecting = 0
+        self.condition = threading.Condition()
+        self.stats = Counter()
+
+    @property
+    def size(self):
+        return len(self.opened_at) + self.connecting
+
+    def checkout(self, connect, check=None):
+        """
+        an idle connection, or a new one from connect() if the pool isn't full; waits up to timeout seconds
+        otherwise. check(connection) -> bool: the health check of an idle connection
+        """
+        with self.condition:
+            self.stats['checkouts'] += 1
+            if not self.idle and self.size >= self.max_size:
+                self.stats['waits'] += 1
+                start = time.monotonic()
+                if not self.condition.wait_for(lambda: self.idle or self.size < self.max_size, self.timeout):
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available within {self.timeout}s '
+                                      f'({self.max_size} in use)')
+                self.stats['wait_time'] += time.monotonic() - start
+            connection = self.idle.pop() if self.idle else None
+            if connection is None:
+                self.connecting += 1  # holds the slot while connecting, outside the lock
+
+        if connection is not None:
+            if check is None or check(connection):
+                return connection
+            with self.condition:
+                self.stats['reconnections'] += 1
+                self.opened_at.pop(id(connection), None)
+                self.connecting += 1
+            close_quietly(connection)
+
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.connecting -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.connecting -= 1
+            self.opened_at[id(connection)] = time.monotonic()
+            self.stats['connections'] += 1
+        return connection
+
+    def checkin(self, connection, reusable=True):
+        """
+        returns a checked out connection; it is closed if not reusable(broken, inside a transaction) or too old
+        """
+        with self.condition:
+            opened_at = self.opened_at.get(id(connection))
+            expired = (self.max_age is not None and opened_at is not None
+                       and time.monotonic() - opened_at >= self.max_age)
+            if reusable and opened_at is not None and not expired:
+                self.idle.append(connection)
+                connection = None
+            else:
+                self.opened_at.pop(id(connection), None)
+                self.stats['discarded'] += 1
+            self.condition.notify()
+        if connection is not None:
+            close_quietly(connection)
+
+    def close(self):
+        """
+        closes the idle connections
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+            for connection in idle:
+                self.opened_at.pop(id(connection), None)
+        for connection in idle:
+            close_quietly(connection)
+
+    def snapshot(self):
+        with self.condition:
+            return {**self.stats, 'size': self.size, 'idle': len(self.idle), 'in_use': self.size - len(self.idle)}
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:  # already closed or broken: nothing to clean up
+        pass
+
+
+def get_pool(alias, options):
+    with _pools_lock:
+        if alias not in _pools:
+            options = {**POOL_DEFAULTS, **options}
+            _pools[alias] = ConnectionPool(options['MAX_SIZE'], options['TIMEOUT'], options['MAX_AGE'])
+        return _pools[alias]
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def db_stats():
+    """
+    {alias: {'connections': 3, 'reconnections': 0, ...}} including, for the pooled databases, 'checkouts', 'waits',
+    'wait_time', 'timeouts', 'discarded', 'size', 'idle' and 'in_use'. Counted per process since it started.
+    """
+    stats = {alias: dict(counter) for alias, counter in _stats.items()}
+    for alias, pool in list(_pools.items()):
+        stats[alias] = {**stats.get(alias, {}), **pool.snapshot()}
+    return stats
+
+
+class PooledConnectionMixin:
+    """
+    adds CONN_HEALTH_CHECKS and POOL(see above) to a database backend's DatabaseWrapper
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_pending = False
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL')
+        return get_pool(self.alias, options) if options else None
+
+    def ping(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        pool = self.pool
+        if pool is None:
+            _stats[self.alias]['connections'] += 1
+            return connect(conn_params)
+        check = self.ping if self.settings_dict.get('CONN_HEALTH_CHECKS') else None
+        return pool.checkout(lambda: connect(conn_params), check)
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        # a connection closed in a transaction or after an error isn't handed to another request
+        pool.checkin(self.connection, reusable=not (self.in_atomic_block or self.errors_occurred))
+
+    def close_if_unusable_or_obsolete(self):
+        # called by Django when a request starts and ends: a connection kept for the next request gets a health check
+        super().close_if_unusable_or_obsolete()
+        self.health_check_pending = self.connection is not None and bool(self.settings_dict.get('CONN_HEALTH_CHECKS'))
+
+    def ensure_connection(self):
+        if self.health_check_pending:
+            self.health_check_pending = False
+            if self.connection is not None and not self.in_atomic_block and not self.ping(self.connection):
+                _stats[self.alias]['reconnections'] += 1
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,11 @@
+"""
+Django's PostgreSQL backend with connection health checks and an optional connection pool(see accounts/db/pool.py)
+ENGINE: 'accounts.db.postgresql'
+"""
+from django.db.backends.postgresql import base
+
+from ..pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,145 @@
+"""
+read replicas for the read-only views.
+
+The GET requests to the views in settings.REPLICA_VIEWS(the dashboard, listings and exports) read the accounts
+models from one of the settings.DATABASE_REPLICAS, in turn: one replica per request, chosen before the view runs, so
+all the reads of a page see the same snapshot. Everything else goes to the primary('default'):
+    - writes, and any request that isn't a GET/HEAD of one of those views
+    - the auth and session tables, always: a login must not be lost to replication lag
+    - reads that follow a write: a request that wrote(or a POST) sets a PIN_COOKIE for PIN_SECONDS, during which
+      the client's requests read from the primary, so a user sees their own changes
+    - reads when no replica is healthy: each replica is checked at most every CHECK_INTERVAL seconds, and skipped
+      while it can't be reached or lags more than MAX_LAG seconds behind the primary
+
+DATABASE_ROUTERS = ['accounts.db.routers.ReplicaRouter'], with ReplicaMiddleware(after the auth middleware) to
+mark the requests. Counters and the replicas' state: see replica_stats().
+"""
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from itertools import count
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+ROUTED_APPS = {'accounts'}
+PIN_COOKIE = 'read_primary'
+PIN_SECONDS = 10
+MAX_LAG = 5  # seconds
+CHECK_INTERVAL = 5  # seconds
+
+# seconds since the last transaction replayed from the primary, 0 if up to date(or not a replica)
+POSTGRESQL_LAG = '''
+    SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+'''
+
+
+class Route:
+    """
+    the database routing of the current request
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # wrote recently: reads from the primary
+        self.alias = None  # the replica the reads of a read-only view go to(see ReplicaMiddleware)
+        self.wrote = False
+
+
+current_route = ContextVar('current_route', default=None)
+
+_state = {}  # {alias: {'healthy': bool, 'lag': seconds, 'error': str, 'checks': int, 'checked_at': monotonic}}
+_state_lock = threading.Lock()
+_turn = count()
+_stats = Counter()  # requests routed per replica, 'primary': sent to the primary because no replica was usable
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_lag(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRESQL_LAG if connection.vendor == 'postgresql' else 'SELECT 0')
+        return float(cursor.fetchone()[0])
+
+
+def check_replica(alias):
+    """
+    updates and returns the state of the replica alias, checked again if older than CHECK_INTERVAL
+    """
+    now = time.monotonic()
+    with _state_lock:
+        state = _state.get(alias)
+        if state is not None and now - state['checked_at'] < CHECK_INTERVAL:
+            return state
+        # the other threads keep using the last state meanwhile
+        _state[alias] = state = {'healthy': False, 'lag': None, 'error': None, 'checks': 0, **(state or {}),
+                                 'checked_at': now}
+
+    connection = connections[alias]
+    try:
+        lag = replica_lag(connection)
+    except DatabaseError as error:
+        if not connection.in_atomic_block:
+            connection.close()  # reconnects on the next check
+        update = {'healthy': False, 'lag': None, 'error': f'{type(error).__name__}: {error}'}
+    else:
+        update = {'healthy': lag <= MAX_LAG, 'lag': lag, 'error': None if lag <= MAX_LAG else 'lagging'}
+    with _state_lock:
+        state.update(update, checks=state['checks'] + 1)
+        return state
+
+
+def choose_replica():
+    """
+    the next healthy replica, in turn; None(the primary) if there is none
+    """
+    healthy = [alias for alias in replicas() if check_replica(alias)['healthy']]
+    if not healthy:
+        _stats['primary'] += 1
+        return None
+    alias = healthy[next(_turn) % len(healthy)]
+    _stats[alias] += 1
+    return alias
+
+
+def replica_stats():
+    """
+    {'reads': {'replica1': 120, 'primary': 3}, 'replicas': {'replica1': {'healthy': True, 'lag': 0.2, 'checks': 8,
+    'error': None}}}, per process since it started; reads: the requests routed
+    """
+    with _state_lock:
+        return {'reads': dict(_stats),
+                'replicas': {alias: {key: value for key, value in state.items() if key != 'checked_at'}
+                             for alias, state in _state.items()}}
+
+
+def reset():
+    with _state_lock:
+        _state.clear()
+        _stats.clear()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = current_route.get()
+        if route is None or route.alias is None or route.wrote:
+            return None
+        if model._meta.app_label not in ROUTED_APPS:
+            return None
+        return route.alias
+
+    def db_for_write(self, model, **hints):
+        route = current_route.get()
+        if route is not None and model._meta.app_label in ROUTED_APPS:
+            route.wrote = True  # the rest of the request, and the next ones for a while, read from the primary
+        return None  # the primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = {'default', *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -1,17 +1,60 @@
+from functools import wraps
+
+from django.core.cache import cache
 from django.http import HttpResponse
 from django.shortcuts import redirect
 
+from .cache import is_shared
+
 """
 decorator: is a function that takes another function as a parameter and allows extra functional to be 
 added before the parent/original function is called.
 """
 
+ROLE_CACHE_TIMEOUT = 60 * 60 * 24  # entries are also deleted when the user's groups change(see signals.py)
+# a cache per process(the default LocMemCache): the signals only clear the entry of the worker that made the change,
+# the other workers keep the old roles until the entry expires
+LOCAL_ROLE_CACHE_TIMEOUT = 10
+
+
+def role_cache_timeout():
+    return ROLE_CACHE_TIMEOUT if is_shared() else LOCAL_ROLE_CACHE_TIMEOUT
+
+
+def role_cache_key(user_id):
+    return f'accounts:roles:{user_id}'
+
+
+def get_user_roles(request):
+    """
+    returns the names of the user's groups(roles) e.g. frozenset({'admin'})
+
+    resolved once per request(memoized on the request) and cached across requests per user, so the decorators cost
+    no queries on the cached path; for seconds only unless the cache is shared by the workers(role_cache_timeout())
+    """
+    roles = getattr(request, '_user_roles', None)
+    if roles is not None:
+        return roles
+
+    if not request.user.is_authenticated:
+        roles = frozenset()
+    else:
+        key = role_cache_key(request.user.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(request.user.groups.values_list('name', flat=True))
+            cache.set(key, roles, role_cache_timeout())
+
+    request._user_roles = roles
+    return roles
+
 
 def unauthenticated_user(view_func):
     """
     stops an authenticated user from viewing the registration and login page
     """
 
+    @wraps(view_func)  # keeps the view's name and module(see middleware.PerformanceMiddleware)
     def wrapper_func(request, *args, **kwargs):
         if request.user.is_staff and request.user.is_authenticated:  # if user is logged in
             return redirect('/')  # redirect to home
@@ -27,19 +70,17 @@ def unauthenticated_user(view_func):
 def allowed_users(allowed_roles=None):
     """
     shows different pages based on the users role(group) such as admin, customer
+    a user in several groups is allowed in if any of them is an allowed role
     """
 
     if allowed_roles is None:
         allowed_roles = []
 
     def decorator(view_func):
+        @wraps(view_func)
         def wrapper_func(request, *args, **kwargs):
 
-            group = None
-            if request.user.groups.exists():
-                group = request.user.groups.all()[0].name  # grab the users group
-
-            if group in allowed_roles:
+            if get_user_roles(request).intersection(allowed_roles):  # grab the users groups
                 return view_func(request, *args, **kwargs)
             else:
                 return HttpResponse('Oops, you are not authorized to view this page.')
@@ -56,15 +97,16 @@ def admin_only(view_func):
     otherwise if the user is in the 'customer' group redirect the user to the 'user-page'
     """
 
+    @wraps(view_func)
     def wrapper_function(request, *args, **kwargs):
-        group = None
-        if request.user.groups.exists():
-            group = request.user.groups.all()[0].name
+        roles = get_user_roles(request)
+
+        if 'admin' in roles:
+            return view_func(request, *args, **kwargs)
 
-        if group == 'customer':
+        if 'customer' in roles:
             return redirect('user_page')
 
-        if group == 'admin':
-            return view_func(request, *args, **kwargs)
+        return HttpResponse('Oops, you are not authorized to view this page.')
 
     return wrapper_function
@@ -0,0 +1,81 @@
+"""
+order export(CSV or NDJSON) shared by the /orders/export/ view and 'manage.py export_orders'.
+
+The orders are filtered by OrderFilter, so the export takes the same query string filters as the customer page,
+and are read with QuerySet.iterator(chunk_size): a server-side cursor on PostgreSQL, so only one chunk of rows is
+in memory at a time. Rows are read with values_list()(no model instances) and joined to their customer and product
+in the same query. Lines are yielded as they are produced, so the first bytes go out straight away.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import OrderFilter
+from .models import Order
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (column name, Order lookup)
+COLUMNS = [
+    ('id', 'id'),
+    ('date_created', 'date_created'),
+    ('status', 'status'),
+    ('note', 'note'),
+    ('customer_id', 'customer_id'),
+    ('customer', 'customer__name'),
+    ('customer_email', 'customer__email'),
+    ('product_id', 'product_id'),
+    ('product', 'product__name'),
+    ('category', 'product__category'),
+    ('price', 'product__price'),
+]
+
+
+class Echo:
+    """
+    a file-like object that returns what is written to it, so csv.writer can produce one line at a time
+    """
+
+    def write(self, value):
+        return value
+
+
+def filter_orders(params):
+    """
+    returns the OrderFilter for params(a QueryDict or dict of query string values) over all the orders
+    """
+    return OrderFilter(params, queryset=Order.objects.all())
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    lookups = [lookup for _, lookup in COLUMNS]
+    return queryset.order_by('id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    names = [name for name, _ in COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(queryset, export_format='csv', chunk_size=CHUNK_SIZE):
+    """
+    yields the orders of queryset as CSV(with a header line) or NDJSON(one JSON object per line)
+    """
+    rows = export_rows(queryset, chunk_size)
+    if export_format == 'ndjson':
+        return ndjson_lines(rows)
+    return csv_lines(rows)
@@ -1,5 +1,5 @@
 import django_filters
-from django_filters import DateFilter, CharFilter
+from django_filters import DateFilter, CharFilter, NumberFilter
 
 from .models import *
 
@@ -12,3 +12,10 @@ class OrderFilter(django_filters.FilterSet):
     class Meta:
         model = Order
         fields = ['product', 'status']
+
+
+class ApiOrderFilter(OrderFilter):
+    """
+    OrderFilter, and the orders of one customer(?customer=<id>), for the JSON API(see api.py)
+    """
+    customer = NumberFilter(field_name='customer')
@@ -1,9 +1,18 @@
-from django.forms import ModelForm
-from django.contrib.auth.forms import UserCreationForm
+from datetime import timedelta
+
+from django.forms import ModelForm, BaseInlineFormSet
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth.models import User
 from django import forms
+from django.db import transaction
+from django.template import loader
+from django.utils import timezone
 
-from .models import Order, Customer
+from .models import Order, Customer, Product
+from .jobs import enqueue
+from .stats import update_order_counters
+from .rollups import update_rollups
+from . import search
 
 
 # ModelForm: is a class that converts a model into a Django form.
@@ -15,6 +24,110 @@ class OrderModelForm(ModelForm):
         fields = ['customer', 'product', 'status', 'note']
         # fields = '__all__'  # create a form with all the fields
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Customer.__str__ returns the username: load the users with the customers for the dropdown
+        self.fields['customer'].queryset = Customer.objects.select_related('user')
+
+
+class PreloadedModelChoiceField(forms.ModelChoiceField):
+    """
+    a ModelChoiceField over objects loaded once and shared by every form of a formset: rendering the dropdown and
+    validating the choice don't query the database per form
+    """
+
+    def __init__(self, objects, *args, **kwargs):
+        self.objects = {str(obj.pk): obj for obj in objects}
+        super().__init__(Product.objects.none(), *args, **kwargs)
+
+    def _get_choices(self):
+        choices = [(obj.pk, self.label_from_instance(obj)) for obj in self.objects.values()]
+        if self.empty_label is not None:
+            choices.insert(0, ('', self.empty_label))
+        return choices
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects[str(value)]
+        except KeyError:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class OrderLineForm(ModelForm):
+    """
+    a line of OrderFormSet; its product is validated by PreloadedModelChoiceField
+    """
+
+    def _get_validation_exclusions(self):
+        # skip the model's ForeignKey check(a SELECT per line): the product was already picked from the loaded ones
+        return list(super()._get_validation_exclusions()) + ['product']
+
+
+class OrderFormSet(BaseInlineFormSet):
+    """
+    create_order's formset: the products are loaded once for all the forms, and the new orders are saved with a
+    single bulk_create() inside one transaction(see save())
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.products = list(Product.objects.all())
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        form.fields['product'] = PreloadedModelChoiceField(self.products, label='Product')
+
+    def save(self, commit=True):
+        """
+        bulk_create() doesn't call save() or send the Order signals, so the customer's order counters(one UPDATE for
+        the whole formset), the daily rollups and the search index are updated here, in the same transaction
+        """
+        if not commit:
+            return super().save(commit=False)
+
+        with transaction.atomic():
+            super().save(commit=False)  # builds new_objects/changed_objects/deleted_objects
+            for order in self.deleted_objects:
+                order.delete()
+            for order, _ in self.changed_objects:
+                order.save()
+            create_orders(self.new_objects, categories={product.pk: product.category for product in self.products})
+        return self.new_objects + [order for order, _ in self.changed_objects]
+
+
+def create_orders(orders, categories=None):
+    """
+    inserts the new orders with a single bulk_create() and does what the Order signals would have: the customers'
+    order counters, the daily rollups(categories: see update_rollups()) and the search index, all in one transaction
+    (the caller's if it has one: no savepoint, its rollback undoes them all)
+    """
+    with transaction.atomic(savepoint=False):
+        Order.objects.bulk_create(orders)
+        update_order_counters((order.customer_id, order.status, 1) for order in orders)
+        update_rollups(((order.date_created, order.status, order.product_id, 1) for order in orders), categories)
+        search.index_objects('order', orders, created=True)
+
+
+class ApiModelForm(ModelForm):
+    """
+    the forms of the JSON API(see api.py). preloaded: {ForeignKey field name: the objects it may point to}, loaded
+    once for all the forms of a batch, so validating a form doesn't query the database per ForeignKey
+    """
+
+    def __init__(self, *args, preloaded=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preloaded = preloaded or {}
+        for name, objects in self.preloaded.items():
+            field = self.fields[name]
+            self.fields[name] = PreloadedModelChoiceField(objects, required=field.required, label=field.label)
+
+    def _get_validation_exclusions(self):
+        return list(super()._get_validation_exclusions()) + list(self.preloaded)
+
 
 class CreateUserForm(UserCreationForm):
     class Meta:
@@ -22,6 +135,21 @@ class CreateUserForm(UserCreationForm):
         fields = ['username', 'email', 'password1', 'password2']
 
 
+class QueuedPasswordResetForm(PasswordResetForm):
+    """
+    the password reset form, with the email queued for 'manage.py run_jobs' rather than sent during the request
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        html_message = None
+        if html_email_template_name is not None:
+            html_message = loader.render_to_string(html_email_template_name, context)
+        enqueue('send_email', subject=subject, message=loader.render_to_string(email_template_name, context),
+                from_email=from_email, recipient_list=[to_email], html_message=html_message)
+
+
 class CustomerForm(ModelForm):
     class Meta:
         model = Customer
@@ -34,3 +162,26 @@ class CustomerForm(ModelForm):
 #     email = forms.EmailField()
 #     to = forms.EmailField()
 #     comments = forms.CharField(required=False, widget=forms.Textarea)
+
+
+class OrderTrendForm(forms.Form):
+    """
+    the period and product category of the order trend report(all optional: the last DEFAULT_DAYS, every category)
+    """
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    category = forms.ChoiceField(required=False, choices=[('', 'All categories')] + list(Product.CATEGORY))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        end = cleaned_data.get('end') or timezone.localdate()
+        start = cleaned_data.get('start') or end - timedelta(days=self.DEFAULT_DAYS - 1)
+        if start > end:
+            raise forms.ValidationError('The start date is after the end date.')
+        if (end - start).days >= self.MAX_DAYS:
+            raise forms.ValidationError(f'Choose a period of at most {self.MAX_DAYS} days.')
+        cleaned_data.update(start=start, end=end, category=cleaned_data.get('category') or None)
+        return cleaned_data
@@ -0,0 +1,110 @@
+"""
+resized variants of Customer.profile_picture, so pages don't serve the full uploaded image.
+
+Every picture gets a JPEG and a WebP variant in each of SIZES(the longest side, in pixels), saved next to the
+original in the same storage(S3 in production) as variants/<name>_<size>.<ext>. They are generated in the
+background: account_settings queues an 'image_variants' job(see jobs.py) when a new picture is uploaded, and
+'manage.py generate_image_variants' backfills the existing pictures.
+
+Customer.picture_variants_of is the name of the picture the variants were made from: until it matches the current
+profile_picture(just uploaded, job pending) the templates fall back to the original, so variant URLs never point at
+missing files and no storage request is made while rendering. See the {% profile_picture %} template tag.
+"""
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from .jobs import task
+from .models import Customer
+from .storage import save_many
+
+SIZES = (64, 160, 400)
+# format: (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, size, image_format):
+    """
+    'uploads/ann.png', 160, 'webp' -> 'variants/uploads/ann_160.webp'
+    """
+    stem, _ = posixpath.splitext(name)
+    return f'variants/{stem}_{size}.{FORMATS[image_format][0]}'
+
+
+def has_variants(customer):
+    picture = customer.profile_picture
+    return bool(picture) and customer.picture_variants_of == picture.name
+
+
+def resize(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)  # keeps the aspect ratio, never enlarges
+    if image_format == 'jpeg' and variant.mode != 'RGB':
+        # no transparency in JPEG: flatten onto white
+        background = Image.new('RGB', variant.size, 'white')
+        variant = variant.convert('RGBA')
+        background.paste(variant, mask=variant.getchannel('A'))
+        variant = background
+    output = BytesIO()
+    variant.save(output, **FORMATS[image_format][1])
+    return output.getvalue()
+
+
+def generate_variants(storage, name):
+    """
+    reads the picture `name` from storage and saves its variants there, replacing older ones. returns their names
+    """
+    with storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)  # phone photos: apply the EXIF rotation before it is dropped
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    variants = [(variant_name(name, size, image_format), ContentFile(resize(image, size, image_format)))
+                for size in SIZES for image_format in FORMATS]
+    return save_many(storage, variants)  # uploaded side by side
+
+
+@task('image_variants')
+def make_customer_variants(customer_id, picture):
+    """
+    the variants of a customer's picture(its name), unless the customer has changed it since
+    """
+    customer = Customer.objects.filter(pk=customer_id, profile_picture=picture).first()
+    if customer is None:
+        return
+    generate_variants(customer.profile_picture.storage, picture)
+    Customer.objects.filter(pk=customer_id, profile_picture=picture).update(picture_variants_of=picture)
+
+
+def backfill(customers=None, force=False, log=None):
+    """
+    generates the missing variants(all of them with force) of the customers' pictures(default: every customer), each
+    distinct picture once: the default picture is shared by most customers. returns the number of pictures processed
+    """
+    if customers is None:
+        customers = Customer.objects.all()
+    storage = Customer._meta.get_field('profile_picture').storage
+    customers = customers.exclude(profile_picture='').exclude(profile_picture=None)
+    if not force:
+        customers = customers.exclude(picture_variants_of=F('profile_picture'))
+    names = customers.values_list('profile_picture', flat=True).distinct().order_by('profile_picture')
+
+    done = 0
+    for name in list(names):  # a few distinct pictures; the loop updates the table
+        try:
+            generate_variants(storage, name)
+        except (OSError, Image.DecompressionBombError) as error:  # missing or not an image
+            if log:
+                log(f'{name}: {error}')
+            continue
+        Customer.objects.filter(profile_picture=name).update(picture_variants_of=name)
+        done += 1
+    return done
@@ -0,0 +1,218 @@
+"""
+bulk CSV import of customers, products and orders(see 'manage.py import_cms').
+Imported rows are added to the search index(see search.py) batch by batch.
+
+Files are read row by row and inserted batch_size rows at a time with bulk_create(), one transaction(savepoint) per
+batch. Orders reference their customer(by email) and product(by name) through in-memory lookups that are loaded once
+and extended with every inserted batch, so an import costs a few queries per batch rather than one per row.
+
+A bad row(missing value, unknown status/product/customer, duplicate) is reported with its line number and skipped;
+the rest of the file is still imported. If a batch is refused by the database, its rows are retried one by one so
+only the offending rows are lost.
+
+Columns(a header line is required):
+    customers: name, email, phone
+    products:  name, price, category, description, tags(separated by ';')
+    orders:    customer(email), product(name), status, note
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+
+from .cache import bump_catalogue_version
+from .models import Customer, Order, Product, Tag
+from .stats import rebuild_order_counters
+from .rollups import local_day, rebuild_rollups
+from . import search
+
+BATCH_SIZE = 1000
+
+
+class RowError(Exception):
+    pass
+
+
+def read_batches(file, batch_size=BATCH_SIZE):
+    """
+    yields lists of (line number, row dict) from an open CSV file, without reading the whole file
+    """
+    rows = enumerate(csv.DictReader(file), start=2)  # line 1 is the header
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def required(row, column):
+    value = (row.get(column) or '').strip()
+    if not value:
+        raise RowError(f"'{column}' is required")
+    return value
+
+
+class Importer:
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.created = {'customers': 0, 'products': 0, 'orders': 0}
+        self.errors = []  # 'orders.csv:12: unknown product 'Ball''
+        self.customer_ids = None  # {email: id}
+        self.product_ids = None  # {name: id}
+        self.tag_ids = None  # {name: id}
+        self.ordered_customers = set()  # customers whose order counters need rebuilding
+        self.ordered_days = set()  # days whose rollups need rebuilding
+        self.catalogue_changed = False  # products or tags inserted: the cached catalogue is stale
+
+    # lookups, loaded on first use
+    def customers(self):
+        if self.customer_ids is None:
+            self.customer_ids = dict(Customer.objects.exclude(email=None).values_list('email', 'id'))
+        return self.customer_ids
+
+    def products(self):
+        if self.product_ids is None:
+            self.product_ids = dict(Product.objects.exclude(name=None).values_list('name', 'id'))
+        return self.product_ids
+
+    def tags(self):
+        if self.tag_ids is None:
+            self.tag_ids = dict(Tag.objects.exclude(name=None).values_list('name', 'id'))
+        return self.tag_ids
+
+    def import_file(self, kind, file):
+        """
+        imports an open CSV file of kind 'customers', 'products' or 'orders'
+        """
+        build, insert = {
+            'customers': (self.build_customer, self.insert_customers),
+            'products': (self.build_product, self.insert_products),
+            'orders': (self.build_order, self.insert_orders),
+        }[kind]
+        name = getattr(file, 'name', kind)
+
+        for batch in read_batches(file, self.batch_size):
+            objs = []
+            for line, row in batch:
+                try:
+                    objs.append((line, build(row)))
+                except RowError as error:
+                    self.errors.append(f'{name}:{line}: {error}')
+            if objs:
+                self.insert(name, kind, insert, objs)
+
+    def insert(self, name, kind, insert, objs):
+        try:
+            with transaction.atomic():
+                insert([obj for _, obj in objs])
+            self.created[kind] += len(objs)
+        except DatabaseError:
+            # the ids remembered for the rolled back batch are gone: reload the lookups, then find the offending rows
+            self.customer_ids = self.product_ids = self.tag_ids = None
+            for line, obj in objs:
+                try:
+                    with transaction.atomic():
+                        insert([obj])
+                    self.created[kind] += 1
+                except DatabaseError as error:
+                    self.errors.append(f'{name}:{line}: {error}')
+
+    def finish(self):
+        """
+        bulk_create() doesn't send the signals: recount the order counters of the customers that got orders, and the
+        rollups of the days they were created on; drop the cached catalogue if products were imported
+        """
+        if self.catalogue_changed:
+            bump_catalogue_version()
+            self.catalogue_changed = False
+        ids = sorted(self.ordered_customers)
+        for start in range(0, len(ids), 500):
+            rebuild_order_counters(Customer.objects.filter(pk__in=ids[start:start + 500]))
+        self.ordered_customers.clear()
+        if self.ordered_days:
+            rebuild_rollups(min(self.ordered_days), max(self.ordered_days))
+        self.ordered_days.clear()
+
+    # customers
+    def build_customer(self, row):
+        name, email = required(row, 'name'), required(row, 'email')
+        if email in self.customers():
+            raise RowError(f"customer '{email}' already exists")
+        self.customers()[email] = None  # reserved, the id is set once inserted
+        return Customer(name=name, email=email, phone=(row.get('phone') or '').strip() or None)
+
+    def insert_customers(self, customers):
+        created = Customer.objects.bulk_create(customers)
+        self.remember_ids(self.customers(), created, 'email', Customer)
+        search.index_objects('customer', created, created=True)
+
+    # products
+    def build_product(self, row):
+        name = required(row, 'name')
+        if name in self.products():
+            raise RowError(f"product '{name}' already exists")
+        try:
+            price = Decimal(required(row, 'price'))
+        except InvalidOperation:
+            raise RowError(f"invalid price '{row['price']}'")
+        category = required(row, 'category')
+        if category not in dict(Product.CATEGORY):
+            raise RowError(f"unknown category '{category}'")
+
+        self.products()[name] = None
+        product = Product(name=name, price=price, category=category, description=(row.get('description') or ''))
+        product.tag_names = [tag.strip() for tag in (row.get('tags') or '').split(';') if tag.strip()]
+        return product
+
+    def insert_products(self, products):
+        created = Product.objects.bulk_create(products)
+        self.remember_ids(self.products(), created, 'name', Product)
+
+        # create the missing tags, then the product <-> tag rows, in bulk
+        new_tags = {name for product in products for name in product.tag_names if name not in self.tags()}
+        if new_tags:
+            created = Tag.objects.bulk_create([Tag(name=name) for name in new_tags])
+            self.remember_ids(self.tags(), created, 'name', Tag)
+        Product.tags.through.objects.bulk_create([
+            Product.tags.through(product_id=self.products()[product.name], tag_id=self.tags()[name])
+            for product in products for name in set(product.tag_names)
+        ])
+        product_ids = [self.products()[product.name] for product in products]
+        products = Product.objects.filter(pk__in=product_ids).prefetch_related('tags')
+        search.index_objects('product', list(products), created=True)
+        self.catalogue_changed = True
+
+    # orders
+    def build_order(self, row):
+        email, name = required(row, 'customer'), required(row, 'product')
+        customer_id, product_id = self.customers().get(email), self.products().get(name)
+        if customer_id is None:
+            raise RowError(f"unknown customer '{email}'")
+        if product_id is None:
+            raise RowError(f"unknown product '{name}'")
+        status = (row.get('status') or '').strip() or 'Pending'
+        if status not in dict(Order.STATUS):
+            raise RowError(f"unknown status '{status}'")
+        return Order(customer_id=customer_id, product_id=product_id, status=status,
+                     note=(row.get('note') or '').strip() or None)
+
+    def insert_orders(self, orders):
+        Order.objects.bulk_create(orders)
+        self.ordered_customers.update(order.customer_id for order in orders)
+        self.ordered_days.update(local_day(order.date_created) for order in orders)
+        search.index_objects('order', orders, created=True)
+
+    @staticmethod
+    def remember_ids(lookup, created, key, model):
+        """
+        adds the ids of the inserted objects to lookup; bulk_create() only sets them on PostgreSQL, elsewhere they
+        are read back with one query per batch
+        """
+        keys = [getattr(obj, key) for obj in created]
+        if all(obj.pk for obj in created):
+            lookup.update(zip(keys, (obj.pk for obj in created)))
+            return
+        for start in range(0, len(keys), 500):  # stay under SQLite's limit of query parameters
+            chunk = keys[start:start + 500]
+            lookup.update(model.objects.filter(**{f'{key}__in': chunk}).values_list(key, 'id'))
@@ -0,0 +1,175 @@
+"""
+request level performance instrumentation of the accounts views(see middleware.PerformanceMiddleware).
+
+For every request to a view of accounts.views it measures:
+    total:    the wall time of the request, the other middleware included
+    queries:  the number of queries, and db: the time spent running them(connection.execute_wrapper, every database)
+    template: the time spent rendering templates(queries run from a template are included)
+    size:     the size of the response body(unknown for streamed responses)
+
+The timings are sent back in a Server-Timing header(shown in the browser's dev tools), and the last SAMPLES requests
+of each view are kept in memory to compute p50/p95/p99. Every worker publishes its samples to the cache at most every
+PUBLISH_INTERVAL seconds, so /metrics/ and 'manage.py perf_stats' report on all the workers when the cache is shared
+(memcached, redis); with the default local memory cache they only see their own process.
+
+Django only sends the template_rendered signal under the test runner, so templates are timed by a template backend,
+TimedDjangoTemplates(settings.TEMPLATES). Recording a request costs a few perf_counter() calls and a deque append.
+"""
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .benchmark import percentile
+
+SAMPLES = 1000  # requests kept per view
+PUBLISH_INTERVAL = 30  # seconds
+METRICS_TIMEOUT = 60 * 10  # a worker that stopped publishing is forgotten after 10 minutes
+METRICS_KEY = 'accounts:metrics:{worker}'
+WORKERS_KEY = 'accounts:metrics:workers'
+
+# a sample is a tuple of these, in this order
+FIELDS = ('total', 'queries', 'db', 'template', 'size')
+PERCENTILES = (50, 95, 99)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+_samples = {}  # {view name: deque of samples}
+_lock = threading.Lock()
+_published = {'at': 0.0}
+
+
+class RequestMetrics:
+    """
+    the counters of one request; also the execute wrapper installed on the database connections
+    """
+    __slots__ = ('queries', 'db_time', 'template_time', 'rendering')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.rendering:  # not instrumented, or already timed by the outer template
+            return super().render(context, request)
+
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    the Django template backend, with the rendering time of each template added to the current request's metrics
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'  # computed on use: the pid changes when a server forks workers
+
+
+def record(view, total, metrics, size):
+    """
+    keeps the sample of a request to view; times in seconds, recorded in milliseconds
+    """
+    samples = _samples.get(view)
+    if samples is None:
+        samples = _samples.setdefault(view, deque(maxlen=SAMPLES))
+    samples.append((total * 1000, metrics.queries, metrics.db_time * 1000, metrics.template_time * 1000, size))
+
+    if time.monotonic() - _published['at'] >= PUBLISH_INTERVAL:
+        publish()
+
+
+def publish():
+    """
+    copies this worker's samples to the cache and registers the worker
+    """
+    with _lock:
+        _published['at'] = time.monotonic()
+        worker = worker_id()
+        cache.set(METRICS_KEY.format(worker=worker), local_samples(), METRICS_TIMEOUT)
+
+        now = time.time()
+        workers = {name: seen for name, seen in (cache.get(WORKERS_KEY) or {}).items()
+                   if now - seen < METRICS_TIMEOUT}
+        workers[worker] = now
+        cache.set(WORKERS_KEY, workers, None)
+
+
+def local_samples():
+    return {view: list(samples) for view, samples in list(_samples.items())}
+
+
+def collect():
+    """
+    {view name: [samples]} of every worker that published recently, this worker's samples being read live
+    """
+    worker = worker_id()
+    workers = [name for name in cache.get(WORKERS_KEY) or {} if name != worker]
+    published = cache.get_many([METRICS_KEY.format(worker=name) for name in workers])
+
+    merged = local_samples()
+    for samples_by_view in published.values():
+        for view, samples in samples_by_view.items():
+            merged.setdefault(view, []).extend(samples)
+    return merged
+
+
+def summarize(samples_by_view=None):
+    """
+    {'accounts.views.home': {'requests': 120, 'total': {'p50': 12.5, 'p95': 30.1, 'p99': 41.0}, 'queries': {...},
+                             'db': {...}, 'template': {...}, 'size': {...}}, ...}; times in milliseconds
+    """
+    if samples_by_view is None:
+        samples_by_view = collect()
+
+    summary = {}
+    for view, samples in sorted(samples_by_view.items()):
+        columns = dict(zip(FIELDS, zip(*samples)))
+        view_summary = {'requests': len(samples)}
+        for field in FIELDS:
+            values = [value for value in columns.get(field, ()) if value is not None]
+            view_summary[field] = {f'p{pct}': percentile(values, pct) for pct in PERCENTILES}
+        summary[view] = view_summary
+    return summary
+
+
+def reset():
+    """
+    forgets this worker's samples(the tests use it)
+    """
+    _samples.clear()
+    _published['at'] = 0.0
@@ -0,0 +1,100 @@
+"""
+a small background job queue backed by the Job table, for the slow side effects of a request(sending emails through
+SMTP): the view enqueue()s a job, a single INSERT in the request's transaction(so the job only exists if the
+request's changes were committed), and 'manage.py run_jobs' workers run it.
+
+A failing job is retried up to max_attempts times, RETRY_DELAY * 2 ** (attempt - 1) seconds apart, then kept as
+'failed' with its last error. A job left 'running' by a worker that died is picked up again after LOCK_TIMEOUT.
+On PostgreSQL workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so several can run side by side.
+
+Tasks are functions registered with @task('name') and called with the job's JSON payload as keyword arguments.
+"""
+import json
+from datetime import timedelta
+
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30  # seconds before the first retry, doubled for each one after
+LOCK_TIMEOUT = 60 * 10  # seconds
+BATCH_SIZE = 10  # jobs claimed at a time by a worker
+
+TASKS = {}
+
+
+def task(name):
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, max_attempts=MAX_ATTEMPTS, **kwargs):
+    """
+    queues TASKS[name](**kwargs); kwargs must be JSON serializable
+    """
+    if name not in TASKS:
+        raise KeyError(f"Unknown task '{name}'")
+    return Job.objects.create(task=name, payload=json.dumps(kwargs), max_attempts=max_attempts)
+
+
+def claim(limit=BATCH_SIZE):
+    """
+    marks up to limit due jobs as running(for this worker) and returns them, oldest first
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=LOCK_TIMEOUT)  # claimed by a worker that died
+    due = Q(status='pending', run_at__lte=now) | Q(status='running', locked_at__lt=stale)
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update(skip_locked=True).filter(due).order_by('run_at', 'id')[:limit])
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status='running', locked_at=now, attempts=F('attempts') + 1)
+    for job in jobs:
+        job.status, job.locked_at, job.attempts = 'running', now, job.attempts + 1
+    return jobs
+
+
+def run(job):
+    """
+    runs a claimed job: deleted when done, rescheduled or failed otherwise. returns True if it succeeded
+    """
+    try:
+        TASKS[job.task](**json.loads(job.payload))
+    except Exception as error:
+        if job.attempts >= job.max_attempts:
+            status, run_at = 'failed', job.run_at
+        else:
+            status, run_at = 'pending', timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        Job.objects.filter(pk=job.pk).update(status=status, run_at=run_at, locked_at=None,
+                                             last_error=f'{type(error).__name__}: {error}')
+        return False
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def run_pending(limit=BATCH_SIZE):
+    """
+    claims and runs the due jobs, limit at a time. returns (succeeded, failed)
+    """
+    succeeded = failed = 0
+    while True:
+        jobs = claim(limit)
+        if not jobs:
+            return succeeded, failed
+        for job in jobs:
+            if run(job):
+                succeeded += 1
+            else:
+                failed += 1
+
+
+# tasks
+@task('send_email')
+def send_email(subject, message, recipient_list, from_email=None, html_message=None):
+    send_mail(subject, message, from_email, recipient_list, html_message=html_message)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+
+from accounts.asgi import WsgiToAsgi, environ
+from accounts.benchmark import percentile, view_urls
+
+
+class Command(BaseCommand):
+    help = ("Compares the throughput of the WSGI application and of the ASGI entry point(cms/asgi.py) on a view, "
+            "with its queries run one after the other and side by side(CONCURRENT_QUERIES, see accounts/concurrent.py)"
+            ", every query delayed by --latency ms to simulate a remote database. Run it on a database the threads "
+            "can share(a file or a server, filled with seed_cms first) e.g. bench_asgi home --latency 20 --clients 8")
+
+    def add_arguments(self, parser):
+        parser.add_argument('view', nargs='?', default='home', help='url name(see accounts/urls.py)')
+        parser.add_argument('--latency', type=float, default=20, help='ms added to every query')
+        parser.add_argument('--clients', type=int, default=8, help='concurrent requests(and server threads)')
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--concurrent-queries', type=int, default=4, help='CONCURRENT_QUERIES of the 2nd run')
+
+    def handle(self, *args, **options):
+        urls = view_urls()
+        if options['view'] not in urls:
+            raise CommandError(f"Unknown view '{options['view']}'; choose from {', '.join(urls)}")
+        if options['clients'] < 1 or options['requests'] < 1:
+            raise CommandError('--clients and --requests must be at least 1.')
+
+        user, url = urls[options['view']]
+        client = Client()
+        if user:
+            client.force_login(user)  # a session row: committed, the server threads read it
+        url = urlsplit(url)
+        headers = [(b'host', b'localhost')]
+        if client.cookies:
+            cookies = '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+            headers.append((b'cookie', cookies.encode()))
+        scope = {'type': 'http', 'method': 'GET', 'path': url.path, 'query_string': url.query.encode(),
+                 'headers': headers, 'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+
+        self.latency = options['latency'] / 1000
+        connection_created.connect(self.delay_queries)  # the connections of the server threads
+        application = get_wsgi_application()
+        try:
+            for queries in (0, options['concurrent_queries']):
+                with override_settings(CONCURRENT_QUERIES=queries):
+                    for server, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                        start = time.perf_counter()
+                        samples = run(application, scope, options['clients'], options['requests'])
+                        elapsed = time.perf_counter() - start
+                        self.stdout.write(f'{server} concurrent_queries={queries:<3} '
+                                          f'{options["requests"] / elapsed:8.1f} req/s  '
+                                          f'p50={percentile(samples, 50):8.2f}ms p95={percentile(samples, 95):8.2f}ms')
+        finally:
+            self.latency = 0  # the pooled threads keep their connections
+            connection_created.disconnect(self.delay_queries)
+            if user:
+                client.logout()
+
+    def delay_queries(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self.delay)
+
+    def delay(self, execute, sql, params, many, context):
+        if self.latency:
+            time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def run_wsgi(application, scope, clients, requests):
+        """
+        `clients` threads calling the WSGI application, like the threads of a WSGI server
+        """
+        def request(_):
+            start = time.perf_counter()
+            status = []
+
+            def start_response(status_line, headers, exc_info=None):
+                status.append(status_line)
+            chunks = application(environ(scope), start_response)
+            try:
+                b''.join(chunks)
+            finally:
+                chunks.close()
+            if not status[0].startswith(('2', '3')):
+                raise CommandError(f"{scope['path']}: {status[0]}")
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(clients) as pool:
+            return list(pool.map(request, range(requests)))
+
+    @staticmethod
+    def run_asgi(application, scope, clients, requests):
+        """
+        `clients` connections to the ASGI application, on one event loop, served by as many threads
+        """
+        app = WsgiToAsgi(application, threads=clients)
+        samples = []
+        remaining = iter(range(requests))
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def connection():
+            for _ in remaining:
+                start = time.perf_counter()
+                messages = []
+
+                async def send(message):
+                    messages.append(message)
+                await app(scope, receive, send)
+                if messages[0]['status'] >= 400:
+                    raise CommandError(f"{scope['path']}: {messages[0]['status']}")
+                samples.append((time.perf_counter() - start) * 1000)
+
+        async def main():
+            await asyncio.gather(*(connection() for _ in range(clients)))
+
+        try:
+            asyncio.run(main())
+        finally:
+            app.executor.shutdown()
+        return samples
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.forms import inlineformset_factory
+
+from accounts.benchmark import measure, rollback, seed
+from accounts.forms import OrderFormSet, OrderLineForm
+from accounts.models import Customer, Order, Product
+
+
+class Command(BaseCommand):
+    help = 'Compares saving an N-line create_order formset with formset.save() vs OrderFormSet(bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        lines = options['lines']
+        fields = ('product', 'status', 'note')
+        formsets = {
+            'formset.save()': inlineformset_factory(Customer, Order, fields=fields),
+            'OrderFormSet': inlineformset_factory(Customer, Order, form=OrderLineForm, formset=OrderFormSet,
+                                                  fields=fields),
+        }
+
+        with rollback():
+            seed(customers=1, orders=0, products=50)
+            customer = Customer.objects.first()
+            product_ids = list(Product.objects.values_list('id', flat=True))
+
+            data = {'order_set-TOTAL_FORMS': lines, 'order_set-INITIAL_FORMS': 0}
+            for i in range(lines):
+                data.update({f'order_set-{i}-product': product_ids[i % len(product_ids)],
+                             f'order_set-{i}-status': 'Pending', f'order_set-{i}-note': f'line {i}'})
+
+            for label, order_form_set in formsets.items():
+                def submit():
+                    formset = order_form_set(data, queryset=Order.objects.none(), instance=customer)
+                    assert formset.is_valid(), formset.errors
+                    formset.save()
+
+                queries, ms = measure(submit, repeat=options['repeat'])
+                self.stdout.write(f'{label:<15} lines={lines} queries={queries:<4} best={ms:.1f}ms')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from accounts.benchmark import measure, rollback, seed
+from accounts.models import Customer, Order
+from accounts.stats import dashboard_stats
+
+
+def count_per_query():
+    """
+    the dashboard totals as they were computed before accounts.stats: one COUNT query per number
+    """
+    orders = Order.objects.all()
+    return {
+        'total_customers': Customer.objects.count(),
+        'total_orders': orders.count(),
+        'delivered': orders.filter(status='Delivered').count(),
+        'pending': orders.filter(status='Pending').count(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compares the query count and time of the dashboard totals: one COUNT per card vs one aggregate query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rollback():
+            seed(customers=options['customers'], orders=options['orders'])
+
+            for label, func in (('count per card', count_per_query), ('dashboard_stats', dashboard_stats)):
+                queries, ms = measure(func, repeat=options['repeat'])
+                self.stdout.write(f'{label:<16} queries={queries:<3} best={ms:.1f}ms')
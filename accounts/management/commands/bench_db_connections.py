@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from accounts.benchmark import percentile
+from accounts.db.pool import PooledConnectionMixin, close_pools, db_stats
+
+# mode: the settings of the default database it runs with
+MODES = {
+    'new connection per request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'POOL': None},
+    'persistent + health checks': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'POOL': None},
+    'pooled + health checks': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'POOL': {'MAX_SIZE': 4}},
+}
+
+
+class Command(BaseCommand):
+    help = ('Measures the database cost of a cheap request(request started, SELECT 1, request finished) with a new '
+            'connection per request, persistent connections and the connection pool. Point it at the real database '
+            'server: against a local SQLite file, connecting costs next to nothing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        original = {key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'POOL')}
+        try:
+            for mode, settings in MODES.items():
+                if settings['POOL'] and not isinstance(connection, PooledConnectionMixin):
+                    self.stdout.write(f'{mode:<28} skipped: ENGINE {connection.settings_dict["ENGINE"]} has no pool')
+                    continue
+                connection.close()
+                connection.settings_dict.update(settings)
+                samples = self.run(options['requests'])
+                self.stdout.write(f'{mode:<28} p50={percentile(samples, 50):7.2f}ms '
+                                  f'p95={percentile(samples, 95):7.2f}ms  {db_stats().get(connection.alias, {})}')
+                connection.close()
+                close_pools()
+        finally:
+            connection.settings_dict.update(original)
+
+    @staticmethod
+    def run(requests):
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            request_started.send(sender=None)  # like the WSGI handler: closes obsolete connections
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            request_finished.send(sender=None)
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
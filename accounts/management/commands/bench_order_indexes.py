@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from accounts.benchmark import measure, rollback, seed
+from accounts.models import Customer, Order
+
+INDEXES = ['order_customer_status_idx', 'order_customer_created_idx', 'order_status_created_idx',
+           'order_created_id_idx', 'order_note_trgm_idx']
+
+
+class Command(BaseCommand):
+    help = 'Seeds orders and prints the EXPLAIN plan and timing of the Order hot paths, and the index each one uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--verbose-plan', action='store_true', help='print the full EXPLAIN output')
+
+    def handle(self, *args, **options):
+        with rollback():
+            seed(customers=options['customers'], orders=options['orders'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')  # fresh planner statistics for the seeded rows
+
+            customer = Customer.objects.order_by('id').first()
+            week_ago = timezone.now() - timedelta(days=7)
+            queries = {
+                'customer orders page': Order.objects.filter(customer=customer).order_by('-date_created', '-id')[:26],
+                'customer + status': Order.objects.filter(customer=customer, status='Pending'),
+                'status + date range': Order.objects.filter(status='Delivered', date_created__gte=week_ago),
+                'dashboard page': Order.objects.order_by('-date_created', '-id')[:26],
+                'note icontains': Order.objects.filter(note__icontains='note 4242'),
+            }
+
+            for label, queryset in queries.items():
+                plan = queryset.explain()
+                used = [name for name in INDEXES if name in plan] or ['no accounts index']
+                _, ms = measure(lambda: list(queryset.all()), repeat=3)
+                self.stdout.write(f'{label:<22} {ms:8.1f}ms  {", ".join(used)}')
+                if options['verbose_plan']:
+                    self.stdout.write(plan + '\n')
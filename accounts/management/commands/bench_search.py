@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from accounts.benchmark import percentile, rollback, seed, timings
+from accounts.search import rebuild_index, search, uses_tsvector
+
+
+class Command(BaseCommand):
+    help = 'Seeds and indexes orders, then reports the p50/p95 latency of search queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('queries', nargs='*', default=['note 4242', 'customer 17', 'product', 'example com'])
+
+    def handle(self, *args, **options):
+        backend = 'tsvector' if uses_tsvector() else 'inverted index'
+        with rollback():
+            seed(customers=options['customers'], orders=options['orders'])
+            counts = rebuild_index()
+            self.stdout.write(f'indexed {sum(counts.values())} documents({backend})')
+
+            for query in options['queries']:
+                samples = timings(lambda: search(query), options['repeat'])
+                self.stdout.write(f'{query!r:<16} p50={percentile(samples, 50):7.1f}ms '
+                                  f'p95={percentile(samples, 95):7.1f}ms  page 1: {len(search(query))} results')
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.benchmark import percentile, rollback, timings
+
+# the same(cheap) password hashing in every mode: it would otherwise dwarf the session costs
+HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class Command(BaseCommand):
+    help = ('Measures a login(POST, redirect) followed by a dashboard GET, each round a new browser, in every '
+            'SESSION_MODE(see settings.py): latency percentiles, queries per round and the ones on the session '
+            'table. Point it at the real database and cache servers: locally, a query costs next to nothing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('modes', nargs='*', help=f"session modes(default: {', '.join(settings.SESSION_ENGINES)})")
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def handle(self, *args, **options):
+        unknown = set(options['modes']) - set(settings.SESSION_ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        if options['rounds'] < 1:
+            raise CommandError('--rounds must be at least 1.')
+
+        with rollback(), override_settings(PASSWORD_HASHERS=HASHERS):
+            user = User.objects.create_user(username='bench-sessions', password='pass', is_staff=True)
+            user.groups.add(Group.objects.get_or_create(name='admin')[0])
+            for mode in options['modes'] or settings.SESSION_ENGINES:
+                with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode]):
+                    self.stdout.write(self.bench(mode, user, options['rounds']))
+
+    @staticmethod
+    def bench(mode, user, rounds):
+        login, home = reverse('login'), reverse('home')
+        queries = []
+
+        def round_trip():
+            client = Client()  # no cookies: a new login
+            with CaptureQueriesContext(connection) as captured:
+                response = client.post(login, {'username': user.username, 'password': 'pass'})
+                assert response.status_code == 302, f'login failed: {response.status_code}'
+                response = client.get(home)
+                assert response.status_code == 200, f'dashboard failed: {response.status_code}'
+            queries.append(captured.captured_queries)
+
+        round_trip()  # warm up
+        samples = timings(round_trip, rounds)
+        last = queries[-1]
+        session = sum('django_session' in query['sql'] for query in last)
+        return (f'{mode:<16} p50={percentile(samples, 50):8.2f}ms p95={percentile(samples, 95):8.2f}ms  '
+                f'queries/round={len(last)} session queries/round={session}')
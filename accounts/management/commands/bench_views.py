@@ -0,0 +1,60 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from accounts.benchmark import bench_view, view_urls
+from accounts.models import Customer, Order, Product
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks every view of accounts/urls.py on the current database(fill it with seed_cms first) through '
+            'the test client and prints the throughput, latency percentiles and query counts as JSON, to compare '
+            'commits e.g. bench_views --requests 50 -o before.json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('views', nargs='*', help='url names(default: all)')
+        parser.add_argument('--requests', type=int, default=20, help='timed requests per view')
+        parser.add_argument('--warmup', type=int, default=2, help='untimed requests per view first')
+        parser.add_argument('-o', '--output', help='write the JSON to this file rather than stdout')
+
+    def handle(self, *args, **options):
+        urls = view_urls()
+        unknown = set(options['views']) - set(urls)
+        if unknown:
+            raise CommandError(f"Unknown view(s): {', '.join(sorted(unknown))}; choose from {', '.join(urls)}")
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1.')
+
+        client = Client()
+        results = {}
+        for name in options['views'] or urls:
+            user, url = urls[name]
+            results[name] = bench_view(client, name, user, url, options['requests'], options['warmup'])
+            if options['output']:
+                self.stderr.write(f"{name:<24} p50={results[name]['latency_ms']['p50']:>8.1f}ms "
+                                  f"queries={results[name]['queries']}")
+
+        report = {
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'rows': {'customers': Customer.objects.count(), 'products': Product.objects.count(),
+                     'orders': Order.objects.count()},
+            'views': results,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+    @staticmethod
+    def commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from accounts.cache import cache_stats, is_shared
+
+
+class Command(BaseCommand):
+    help = 'Prints the hit and miss counters of the cached catalogue(products queryset and rendered product table)'
+
+    def handle(self, *args, **options):
+        if not is_shared():
+            self.stderr.write(self.style.WARNING(
+                "CACHES['default'] is local to each process: these are this command's own counters, not the "
+                "workers'(see accounts/cache.py)."))
+        for name, stats in cache_stats().items():
+            self.stdout.write(f"{name:<15} hits={stats['hits']:<8} misses={stats['misses']:<8} "
+                              f"hit rate={stats['hit_rate']:.1%} miss rate={stats['miss_rate']:.1%}")
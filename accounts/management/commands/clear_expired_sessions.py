@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.sessions import BATCH_SIZE, clear_expired
+
+
+class Command(BaseCommand):
+    help = ('Deletes the expired sessions in batches, each its own short transaction, stopping after --max-batches '
+            'or --max-seconds(the rest is left to the next run), e.g. hourly from cron: '
+            'clear_expired_sessions --max-seconds 60 --pause 0.1')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='sessions deleted per transaction')
+        parser.add_argument('--max-batches', type=int, help='stop after this many batches(default: no limit)')
+        parser.add_argument('--max-seconds', type=float, help='stop after this long(default: no limit)')
+        parser.add_argument('--pause', type=float, default=0, help='seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if settings.SESSION_ENGINE.endswith('signed_cookies'):
+            self.stdout.write('Sessions are signed cookies: none is stored.')
+            return
+        log = self.stderr.write if options['verbosity'] > 1 else None
+        deleted, done = clear_expired(options['batch_size'], options['max_batches'], options['max_seconds'],
+                                      options['pause'], log=log)
+        left = '' if done else ', stopped before the last batch: run it again'
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired session(s){left}.'))
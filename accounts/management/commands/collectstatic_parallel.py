@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.staticfiles.management.commands import collectstatic
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from accounts.storage import COMPRESSED, MAX_WORKERS, CompressedManifestStaticFilesStorage, sync_directory
+
+
+class Command(BaseCommand):
+    help = ('Collects the static files under hashed names into STATICFILES_STAGING_ROOT, then uploads the new and '
+            'changed ones to STATICFILES_STORAGE(S3), several at a time (see accounts/storage.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='parallel uploads')
+        parser.add_argument('--force', action='store_true', help='upload every file, changed or not')
+        parser.add_argument('--dry-run', action='store_true', help='list the files to upload, upload nothing')
+
+    def handle(self, *args, **options):
+        staging = settings.STATICFILES_STAGING_ROOT
+        # hashing, rewriting the CSS urls and compressing is done on local files: it reads every file back
+        collect = collectstatic.Command(stdout=self.stdout, stderr=self.stderr)
+        collect.storage = CompressedManifestStaticFilesStorage(location=staging, base_url=settings.STATIC_URL)
+        call_command(collect, interactive=False, verbosity=max(options['verbosity'] - 1, 0))
+
+        # S3 serves the gzipped content under the original name: the .gz/.br siblings would never be requested
+        exclude = () if getattr(staticfiles_storage, 'precompressed', True) else tuple(COMPRESSED)
+        uploaded, unchanged = sync_directory(staging, staticfiles_storage, max_workers=options['workers'],
+                                             force=options['force'], dry_run=options['dry_run'], exclude=exclude)
+        if options['verbosity'] > 1 or options['dry_run']:
+            for name in uploaded:
+                self.stdout.write(name)
+        verb = 'To upload' if options['dry_run'] else 'Uploaded'
+        self.stdout.write(self.style.SUCCESS(f'{verb}: {len(uploaded)} file(s), {unchanged} unchanged.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from accounts.export import CHUNK_SIZE, FORMATS, export_lines, filter_orders
+
+
+class Command(BaseCommand):
+    help = ('Streams the orders as CSV or NDJSON, filtered with the same values as /orders/export/ e.g. '
+            'export_orders --format ndjson --filter status=Pending --filter start_date=2020-11-01 -o orders.ndjson')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help='an OrderFilter value(product, status, start_date, end_date, note); repeatable')
+        parser.add_argument('-o', '--output', help='file to write to(default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for value in options['filter']:
+            name, sep, value = value.partition('=')
+            if not sep:
+                raise CommandError(f"--filter expects NAME=VALUE, got '{name}'")
+            params.appendlist(name, value)
+
+        order_filter = filter_orders(params)
+        if not order_filter.is_valid():
+            raise CommandError(order_filter.errors.as_text())
+
+        lines = export_lines(order_filter.qs, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
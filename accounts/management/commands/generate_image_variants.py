@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.images import backfill
+from accounts.models import Customer
+
+
+class Command(BaseCommand):
+    help = ("Generates the resized JPEG/WebP variants of the customers' profile pictures that don't have them yet "
+            "(see accounts/images.py); new uploads are handled by the 'run_jobs' workers")
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_ids', nargs='*', type=int, help='only these customers(default: all)')
+        parser.add_argument('--force', action='store_true', help='regenerate existing variants too')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['customer_ids']:
+            customers = customers.filter(pk__in=options['customer_ids'])
+        done = backfill(customers, force=options['force'], log=self.stderr.write)
+        self.stdout.write(self.style.SUCCESS(f'Generated the variants of {done} picture(s).'))
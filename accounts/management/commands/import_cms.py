@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import BATCH_SIZE, Importer
+
+
+class Command(BaseCommand):
+    help = ('Bulk imports customers, products and orders from CSV files(see accounts/importer.py for the columns) '
+            'e.g. import_cms --customers customers.csv --products products.csv --orders orders.csv')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', help='CSV file: name, email, phone')
+        parser.add_argument('--products', help="CSV file: name, price, category, description, tags(';' separated)")
+        parser.add_argument('--orders', help='CSV file: customer(email), product(name), status, note')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        files = [(kind, options[kind]) for kind in ('customers', 'products', 'orders') if options[kind]]
+        if not files:
+            raise CommandError('Nothing to import: pass --customers, --products and/or --orders.')
+
+        importer = Importer(batch_size=options['batch_size'])
+        try:
+            for kind, path in files:  # customers and products first: orders refer to them
+                try:
+                    with open(path, newline='', encoding='utf-8') as file:
+                        importer.import_file(kind, file)
+                except OSError as error:
+                    raise CommandError(error)
+                self.stdout.write(f'{kind}: {importer.created[kind]} imported')
+        finally:
+            importer.finish()  # the batches imported so far are committed: counters, rollups and cache follow them
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        style = self.style.WARNING if importer.errors else self.style.SUCCESS
+        self.stdout.write(style(f'Done with {len(importer.errors)} rejected row(s).'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts.instrumentation import FIELDS, summarize
+
+
+class Command(BaseCommand):
+    help = ('Prints the p50/p95/p99 of the request time, queries, query time, template time and response size of '
+            'each view, as published to the cache by the workers(see accounts/instrumentation.py)')
+
+    def handle(self, *args, **options):
+        summary = summarize()
+        if not summary:
+            self.stdout.write('no requests recorded(is the cache shared with the web workers?)')
+        for view, stats in summary.items():
+            self.stdout.write(f"{view} ({stats['requests']} requests)")
+            for field in FIELDS:
+                values = stats[field]
+                self.stdout.write(f"    {field:<9} p50={values['p50']:<10.1f} p95={values['p95']:<10.1f} "
+                                  f"p99={values['p99']:.1f}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Customer
+from accounts.stats import rebuild_order_counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts the Customer order counters(total_orders, pending_orders, ...) from the orders, to repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_ids', nargs='*', type=int, help='only these customers(default: all)')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['customer_ids']:
+            customers = customers.filter(pk__in=options['customer_ids'])
+
+        with transaction.atomic():
+            updated = rebuild_order_counters(customers)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the order counters of {updated} customer(s).'))
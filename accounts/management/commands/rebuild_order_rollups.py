@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.rollups import REBUILD_DAYS, rebuild_rollups
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Expected a date as YYYY-MM-DD, got '{value}'")
+
+
+class Command(BaseCommand):
+    help = ('Recounts the daily order rollups(orders per day, status and product category) from the orders, e.g. '
+            'after bulk imports or to repair drift: rebuild_order_rollups --start 2020-11-01 --end 2020-11-30')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_day, help='first day, YYYY-MM-DD(default: the first order)')
+        parser.add_argument('--end', type=parse_day, help='last day, included(default: the last order)')
+        parser.add_argument('--days', type=int, default=REBUILD_DAYS, help='days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError('--start is after --end')
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        log = self.stderr.write if options['verbosity'] > 1 else None
+        written = rebuild_rollups(start, end, days=options['days'], log=log)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} rollup row(s).'))
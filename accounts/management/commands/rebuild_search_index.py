@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.search import DOCUMENTS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search documents of the customers, products and orders(e.g. after migrating or a bulk load)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help=f"only these kinds: {', '.join(DOCUMENTS)}(default: all)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(DOCUMENTS)
+        if unknown:
+            raise CommandError(f"Unknown kind(s): {', '.join(sorted(unknown))}")
+        counts = rebuild_index(options['kinds'] or None, batch_size=options['batch_size'])
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count} indexed')
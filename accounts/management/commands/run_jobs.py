@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.jobs import BATCH_SIZE, run_pending
+
+
+class Command(BaseCommand):
+    help = ('Runs the queued background jobs(emails, see accounts/jobs.py), polling for new ones until stopped; '
+            'start as many workers as needed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='run the due jobs, then exit')
+        parser.add_argument('--sleep', type=float, default=2, help='seconds between polls when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()  # like a request: drop obsolete or broken connections
+                succeeded, failed = run_pending(options['batch_size'])
+                if succeeded or failed:
+                    self.stdout.write(f'{succeeded} job(s) done, {failed} failed')
+                if options['once']:
+                    return
+                if not (succeeded or failed):
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
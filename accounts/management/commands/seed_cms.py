@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.seeding import BATCH_SIZE, DAYS, PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Bulk generates synthetic customers(with users), admins, products, tags and orders with a realistic '
+            'skew(see accounts/seeding.py) e.g. seed_cms --orders 10000000. Customers and products default to a '
+            'share of the orders.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--customers', type=int, help='default: one per 20 orders')
+        parser.add_argument('--products', type=int, help='default: one per 500 orders, at least 20')
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument('--admins', type=int, default=2)
+        parser.add_argument('--days', type=int, default=DAYS,
+                            help='the orders are dated over the last DAYS days, more of them recently; 0: now')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--seed', type=int, help='random seed, for a reproducible data set')
+        parser.add_argument('--no-index', action='store_false', dest='index',
+                            help="don't add the rows to the search index('manage.py rebuild_search_index' later)")
+
+    def handle(self, *args, **options):
+        orders = options['orders']
+        customers = options['customers'] if options['customers'] is not None else max(orders // 20, 1)
+        products = options['products'] if options['products'] is not None else max(orders // 500, 20)
+        if min(orders, customers, products, options['tags'], options['admins'], options['days']) < 0 or \
+                options['batch_size'] < 1:
+            raise CommandError('Counts must be positive.')
+
+        seeder = Seeder(batch_size=options['batch_size'], index=options['index'], random_seed=options['seed'],
+                        log=self.stdout.write if options['verbosity'] > 1 else None, days=options['days'])
+        created = seeder.seed(customers=customers, products=products, orders=orders, tags=options['tags'],
+                              admins=options['admins'])
+
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in created.items()))
+        self.stdout.write(self.style.SUCCESS(f"Done. The users' password is '{PASSWORD}'."))
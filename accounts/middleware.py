@@ -0,0 +1,102 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation
+from .db.routers import PIN_COOKIE, PIN_SECONDS, Route, choose_replica, current_route
+from .instrumentation import RequestMetrics, current_metrics
+
+INSTRUMENTED_MODULE = 'accounts.views'
+
+
+class PerformanceMiddleware:
+    """
+    times the requests to the accounts views: wall time, queries and their time, template rendering and response
+    size(see instrumentation.py). Adds a Server-Timing header e.g.
+        Server-Timing: total;dur=25.3, db;dur=4.1;desc="5 queries", tpl;dur=9.8
+
+    first in settings.MIDDLEWARE, so the total and the query count include the other middleware(sessions, auth)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - start
+
+        view = getattr(request, '_instrumented_view', None)
+        if view is None:
+            return response
+
+        size = None if response.streaming else len(response.content)
+        instrumentation.record(view, total, metrics, size)
+        response['Server-Timing'] = (f'total;dur={total * 1000:.1f}, '
+                                     f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+                                     f'tpl;dur={metrics.template_time * 1000:.1f}')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the decorators of the views keep the view's module and name(functools.wraps)
+        if view_func.__module__ == INSTRUMENTED_MODULE:
+            request._instrumented_view = f'{view_func.__module__}.{view_func.__name__}'
+
+
+class ReplicaMiddleware:
+    """
+    sends the reads of the GET requests to settings.REPLICA_VIEWS to the read replicas, unless the client wrote in
+    the last PIN_SECONDS(see db/routers.py)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        route = Route(pinned=PIN_COOKIE in request.COOKIES)
+        token = current_route.set(route)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_route.reset(token)
+
+        if response.streaming and route.alias and not route.wrote:
+            # an export's rows are read while the response is sent, after this middleware returned
+            response.streaming_content = self.routed(response.streaming_content, route)
+        if route.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(PIN_COOKIE, '1', max_age=PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = current_route.get()
+        if route is not None and not route.pinned and request.method in ('GET', 'HEAD') and \
+                request.resolver_match.url_name in getattr(settings, 'REPLICA_VIEWS', ()):
+            route.alias = choose_replica()  # for the whole request: its reads see one snapshot
+
+    @staticmethod
+    def routed(content, route):
+        # the route is set while each chunk is produced only: between chunks the server's context is left as it was
+        iterator = iter(content)
+        try:
+            while True:
+                token = current_route.set(route)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    current_route.reset(token)
+                yield chunk
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
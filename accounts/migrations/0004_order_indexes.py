@@ -0,0 +1,50 @@
+# Generated by Django 2.2 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+TRIGRAM_INDEX = 'order_note_trgm_idx'
+
+
+def create_note_trigram_index(apps, schema_editor):
+    """
+    GIN trigram index so OrderFilter's note__icontains (UPPER(note) LIKE UPPER('%...%')) can use an index.
+    PostgreSQL only: other databases(SQLite in the tests) keep the sequential scan.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON accounts_order USING gin (UPPER(note) gin_trgm_ops)')
+
+
+def drop_note_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_auto_20201122_1403'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'status'], name='order_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'date_created'], name='order_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'date_created'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date_created', 'id'], name='order_created_id_idx'),
+        ),
+        migrations.RunPython(create_note_trigram_index, drop_note_trigram_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2 on 2026-10-18 08:00
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+STATUSES = {'Pending': 'pending_orders', 'Out for delivery': 'out_for_delivery_orders',
+            'Delivered': 'delivered_orders'}
+
+
+def count_existing_orders(apps, schema_editor):
+    """
+    fills the new counters from the existing orders(the same UPDATE as stats.rebuild_order_counters)
+    """
+    Customer = apps.get_model('accounts', 'Customer')
+    Order = apps.get_model('accounts', 'Order')
+
+    def count(**filters):
+        orders = Order.objects.filter(customer=OuterRef('pk'), **filters).order_by().values('customer')
+        orders = orders.annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(orders, output_field=IntegerField()), Value(0))
+
+    counters = {'total_orders': count()}
+    for status, field in STATUSES.items():
+        counters[field] = count(status=status)
+    Customer.objects.update(**counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='delivered_orders',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='out_for_delivery_orders',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='pending_orders',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_orders',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2 on 2026-10-18 08:07
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_vector_index(apps, schema_editor):
+    """
+    GIN index for the full text search; PostgreSQL only, other databases search SearchTerm instead.
+    existing rows are indexed by 'manage.py rebuild_search_index'
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS searchdocument_vector_idx ON accounts_searchdocument USING gin (vector)')
+
+
+def drop_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS searchdocument_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_customer_order_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('customer', 'Customer'), ('product', 'Product'), ('order', 'Order')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('label', models.CharField(max_length=200)),
+                ('title', models.TextField(blank=True)),
+                ('keywords', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=100)),
+                ('weight', models.FloatField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.SearchDocument')),
+            ],
+        ),
+        migrations.RunPython(create_vector_index, drop_vector_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='picture_variants_of',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2 on 2026-10-18 08:34
+
+from django.db import migrations, models
+from django.db.models import Count, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def roll_up_existing_orders(apps, schema_editor):
+    """
+    fills the rollups from the existing orders(the GROUP BY of rollups.rebuild_rollups, in one go)
+    """
+    Order = apps.get_model('accounts', 'Order')
+    OrderDailyRollup = apps.get_model('accounts', 'OrderDailyRollup')
+    rows = (Order.objects.exclude(date_created=None).order_by()
+            .annotate(day=TruncDate('date_created'), rollup_status=Coalesce('status', Value('')),
+                      rollup_category=Coalesce('product__category', Value('')))
+            .values_list('day', 'rollup_status', 'rollup_category')
+            .annotate(orders=Count('id')))
+    OrderDailyRollup.objects.bulk_create(
+        (OrderDailyRollup(day=day, status=status, category=category, orders=orders)
+         for day, status, category, orders in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_customer_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(blank=True, max_length=25)),
+                ('category', models.CharField(blank=True, max_length=200)),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('day', 'status', 'category')},
+            },
+        ),
+        migrations.RunPython(roll_up_existing_orders, migrations.RunPython.noop),
+    ]
@@ -45,7 +45,11 @@ parent.childmodel_set.all()/parent.related_name.all()/
 variable|filter }}): allow you to modify variables for display.
 """
 from django.db import models
+from django.db.models.signals import post_init
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVectorField
 
 
 class Customer(models.Model):
@@ -58,6 +62,15 @@ class Customer(models.Model):
     profile_picture = models.ImageField(null=True, blank=True, default="profile-picture.png")
     # saves the first time&date the object was created in the DB
     date_created = models.DateTimeField(auto_now_add=True, null=True)
+    # order counters, kept up to date by the Order signals(see signals.py); repair with 'manage.py rebuild_order_counters'
+    total_orders = models.PositiveIntegerField(default=0, editable=False)
+    pending_orders = models.PositiveIntegerField(default=0, editable=False)
+    out_for_delivery_orders = models.PositiveIntegerField(default=0, editable=False)
+    delivered_orders = models.PositiveIntegerField(default=0, editable=False)
+    # the profile_picture the resized variants were made from(see images.py); blank: none yet
+    picture_variants_of = models.CharField(max_length=255, blank=True, editable=False)
+    # the last save(), for the conditional GETs of the pages showing it(see conditional.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return str(self.user)
@@ -83,6 +96,7 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     date_created = models.DateTimeField(auto_now_add=True, null=True)
     tags = models.ManyToManyField(Tag)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -100,6 +114,129 @@ class Order(models.Model):
     date_created = models.DateTimeField(auto_now_add=True, null=True)
     status = models.CharField(max_length=25, null=True, choices=STATUS, default='Pending')
     note = models.CharField(max_length=50, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # composite indexes for the dashboard/customer pages and OrderFilter(customer, status and date ranges).
+        # the trigram index for note__icontains is PostgreSQL only, see migration 0004_order_indexes
+        indexes = [
+            models.Index(fields=['customer', 'status'], name='order_customer_status_idx'),
+            models.Index(fields=['customer', 'date_created'], name='order_customer_created_idx'),
+            models.Index(fields=['status', 'date_created'], name='order_status_created_idx'),
+            models.Index(fields=['date_created', 'id'], name='order_created_id_idx'),  # keyset pagination
+        ]
 
     def __str__(self):
         return self.product.name
+
+    def refresh_from_db(self, using=None, fields=None):
+        deferred = self.get_deferred_fields()
+        super().refresh_from_db(using, fields)
+        # what the order is counted and rolled up under(see signals.remember_order) is the reloaded row; a deferred
+        # field loaded on access is left to signals.load_counted_order
+        if fields is None:
+            post_init.send(sender=type(self), instance=self)
+        elif {self._meta.get_field(name).attname for name in fields} - deferred:
+            self._counted = self._rolled_up = None  # read again on save
+
+
+class OrderDailyRollup(models.Model):
+    """
+    the number of orders created on a day, per status and product category; kept up to date by the Order signals,
+    rebuilt by 'manage.py rebuild_order_rollups'(see rollups.py). '' : no status/product
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=25, blank=True)
+    category = models.CharField(max_length=200, blank=True)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('day', 'status', 'category')]  # its index serves the date range queries too
+
+    def __str__(self):
+        return f'{self.day} {self.status or "-"} {self.category or "-"}: {self.orders}'
+
+
+class DataVersion(models.Model):
+    """
+    a counter shared by the workers through the database e.g. the version of the conditional pages, bumped when a row
+    they show is deleted(see conditional.py)
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+class SearchDocument(models.Model):
+    """
+    the searchable text of a Customer, Product or Order, kept up to date by signals(see search.py)
+    title is weighted highest, then keywords, then body
+    """
+    KINDS = (
+        ('customer', 'Customer'),
+        ('product', 'Product'),
+        ('order', 'Order'),
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    label = models.CharField(max_length=200)  # shown in the results, not searched
+    title = models.TextField(blank=True)
+    keywords = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    # PostgreSQL: to_tsvector of title/keywords/body(GIN indexed, see migration 0006_search)
+    vector = SearchVectorField(null=True)
+
+    class Meta:
+        unique_together = [('kind', 'object_id')]
+
+    def __str__(self):
+        return f'{self.kind} {self.label}'
+
+    def get_absolute_url(self):
+        if self.kind == 'customer':
+            return reverse('customer', args=[self.object_id])
+        if self.kind == 'product':
+            return reverse('products')
+        return reverse('update_order', args=[self.object_id])
+
+
+class SearchTerm(models.Model):
+    """
+    inverted index used instead of the tsvector on databases other than PostgreSQL(SQLite in the tests)
+    """
+    term = models.CharField(max_length=100, db_index=True)
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+    def __str__(self):
+        return self.term
+
+
+class Job(models.Model):
+    """
+    a background task(e.g. sending an email) queued by jobs.enqueue() and run by 'manage.py run_jobs'
+    """
+    STATUS = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),  # gave up after max_attempts; done jobs are deleted
+    )
+    task = models.CharField(max_length=100)
+    payload = models.TextField()  # the task's keyword arguments, JSON
+    status = models.CharField(max_length=10, choices=STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)  # not before; pushed back after a failed attempt
+    locked_at = models.DateTimeField(null=True, blank=True)  # when a worker claimed it
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),  # the workers' polling query
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk} ({self.status})'
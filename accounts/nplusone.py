@@ -0,0 +1,175 @@
+"""
+N+1 query detection: the same SQL statement run over and over within one request(or test), typically a lazy load
+like {{ order.product }} in a loop over a queryset that is missing a select_related()/prefetch_related().
+
+Statements are grouped once normalized(parameters, literals and IN lists replaced by '?'); when one runs more than
+the threshold, NPlusOneError is raised(or NPlusOneWarning issued) from the offending query, naming the template line
+and the line of our code that triggered it.
+
+    settings.NPLUSONE_THRESHOLD: repeats allowed per statement(default THRESHOLD)
+    settings.NPLUSONE_ACTION: 'raise', 'warn' or 'ignore'(default 'warn'); NPlusOneTestRunner raises in the tests
+
+NPlusOneMiddleware checks every request(enabled with DEBUG, see settings.MIDDLEWARE) and a view can change its
+limits with the @query_repeats decorator. Anything else can be checked with `with NPlusOneDetector(): ...`.
+"""
+import os
+import re
+import sys
+import warnings
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+THRESHOLD = 5
+ACTIONS = ('raise', 'warn', 'ignore')
+
+# frames not reported as the code that ran the queries: the detector, the template timing and the libraries
+SKIPPED_PATHS = (
+    os.path.join(os.path.dirname(__file__), 'nplusone.py'),
+    os.path.join(os.path.dirname(__file__), 'instrumentation.py'),
+    os.sep + 'site-packages' + os.sep,
+)
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+def normalize(sql):
+    """
+    'SELECT ... WHERE "id" IN (%s, %s) AND "note" = \'x\' LIMIT 21'
+        -> 'SELECT ... WHERE "id" IN (?) AND "note" = ? LIMIT ?'
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)  # string literals
+    sql = re.sub(r'%s|\b\d+(?:\.\d+)?\b', '?', sql)  # parameters and numbers
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', sql)  # IN lists of any length
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def template_location(frame):
+    """
+    'accounts/dashboard.html, line 77: {{ order.product }}' for the innermost template node being rendered, or None
+    """
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None:
+                origin = getattr(node, 'origin', None)
+                name = getattr(origin, 'template_name', None) or getattr(origin, 'name', '<string>')
+                if token.token_type.name == 'VAR':
+                    return f'{name}, line {token.lineno}: {{{{ {token.contents} }}}}'
+                return f'{name}, line {token.lineno}: {{% {token.contents} %}}'
+        frame = frame.f_back
+    return None
+
+
+def code_location(frame):
+    """
+    'accounts/views.py, line 42, in home' for the innermost frame of the project's code, or None
+    """
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(settings.BASE_DIR) and not any(path in filename for path in SKIPPED_PATHS):
+            return f'{os.path.relpath(filename, settings.BASE_DIR)}, line {frame.f_lineno}, in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class NPlusOneDetector:
+    """
+    counts the statements run on every database connection while active(a context manager), or while installed as
+    an execute wrapper by the caller
+    """
+
+    def __init__(self, threshold=None, action=None):
+        self.threshold = threshold if threshold is not None else getattr(settings, 'NPLUSONE_THRESHOLD', THRESHOLD)
+        self.action = action or getattr(settings, 'NPLUSONE_ACTION', 'warn')
+        if self.action not in ACTIONS:
+            raise ValueError(f"NPLUSONE_ACTION must be one of {', '.join(ACTIONS)}, not '{self.action}'")
+        self.counts = Counter()
+        self.reported = set()
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = normalize(sql)
+        self.counts[statement] += 1
+        if self.counts[statement] > self.threshold and statement not in self.reported and self.action != 'ignore':
+            self.reported.add(statement)
+            self.report(statement, sys._getframe(1))  # before running it, so a traceback ends at the query
+        return execute(sql, params, many, context)
+
+    def report(self, statement, frame):
+        message = f'N+1 queries: {self.counts[statement]} runs(more than {self.threshold}) of: {statement}'
+        for location in (template_location(frame), code_location(frame)):
+            if location:
+                message += f'\n    from {location}'
+        if self.action == 'raise':
+            raise NPlusOneError(message)
+        warnings.warn(message, NPlusOneWarning, stacklevel=2)
+
+
+def query_repeats(threshold=None, action=None):
+    """
+    changes the N+1 limits of a view e.g. @query_repeats(threshold=50) or @query_repeats(action='ignore');
+    put it next to the view function, under the other decorators(they keep its attributes, see functools.wraps)
+    """
+
+    def decorator(view_func):
+        view_func.nplusone = {'threshold': threshold, 'action': action}
+        return view_func
+
+    return decorator
+
+
+class NPlusOneMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with NPlusOneDetector() as detector:
+            request._nplusone = detector
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        options = getattr(view_func, 'nplusone', None)
+        detector = getattr(request, '_nplusone', None)
+        if options and detector is not None:
+            if options['threshold'] is not None:
+                detector.threshold = options['threshold']
+            if options['action'] is not None:
+                detector.action = options['action']
+
+
+class NPlusOneTestRunner(DiscoverRunner):
+    """
+    the test runner(settings.TEST_RUNNER): N+1 queries fail the tests. The static files are served from the local
+    directories, so the tests don't read the manifest from S3(see accounts/storage.py)
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._nplusone_settings = override_settings(
+            NPLUSONE_ACTION='raise', STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+        self._nplusone_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._nplusone_settings.disable()
+        super().teardown_test_environment(**kwargs)
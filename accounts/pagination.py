@@ -0,0 +1,128 @@
+"""
+keyset(cursor) pagination for the order and customer lists.
+
+Pages are ordered newest first on (date_created, id). Instead of OFFSET, which makes the database read and throw away
+every row before the page, each page starts *after* the last row of the previous one:
+
+    WHERE (date_created, id) < (<cursor date_created>, <cursor id>) ORDER BY date_created DESC, id DESC LIMIT 26
+
+so every page costs the same however deep it is. The cursor is passed in the query string, e.g. ?orders=<cursor>.
+
+date_created is always set by auto_now_add; rows with a NULL date_created (none are created by the app) are skipped.
+
+The JSON API(see api.py) pages on the primary key instead, oldest first: every model has one, and a tool walking a
+whole table sees the rows added meanwhile on its last pages.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PER_PAGE = 25
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, obj):
+    """
+    the position of obj as an opaque query string value
+    """
+    value = f'{direction}|{obj.date_created.isoformat()}|{obj.id}'
+    return urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    returns (direction, date_created, id) or None if the cursor is missing or invalid
+    """
+    if not cursor:
+        return None
+    try:
+        value = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, date_created, pk = value.split('|')
+        date_created = parse_datetime(date_created)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or date_created is None:
+        return None
+    return direction, date_created, pk
+
+
+class KeysetPage:
+    """
+    one page of rows; iterates like the queryset it replaces in the templates
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.next_cursor or self.previous_cursor)
+
+
+def paginate(queryset, cursor=None, per_page=PER_PAGE):
+    """
+    returns the KeysetPage of queryset(newest first) that starts at cursor; the first page if cursor is None/invalid
+    """
+    position = decode_cursor(cursor)
+    direction = position[0] if position else None
+    # on every page: a NULL has no place in the order(first or last depending on the database) and can't be a cursor
+    queryset = queryset.filter(date_created__isnull=False)
+
+    if direction is None:
+        queryset = queryset.order_by('-date_created', '-id')
+    elif direction == NEXT:
+        _, date_created, pk = position
+        queryset = queryset.filter(
+            Q(date_created__lt=date_created) | Q(date_created=date_created, id__lt=pk)
+        ).order_by('-date_created', '-id')
+    else:
+        # walk backwards (oldest first) from the cursor, then flip the rows back to newest first
+        _, date_created, pk = position
+        queryset = queryset.filter(
+            Q(date_created__gt=date_created) | Q(date_created=date_created, id__gt=pk)
+        ).order_by('date_created', 'id')
+
+    rows = list(queryset[:per_page + 1])  # the extra row tells us if there is another page
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == PREVIOUS:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage(rows)
+
+    has_next = direction == PREVIOUS or has_more
+    has_previous = direction == NEXT or (direction == PREVIOUS and has_more)
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(NEXT, rows[-1]) if has_next else None,
+        previous_cursor=encode_cursor(PREVIOUS, rows[0]) if has_previous else None,
+    )
+
+
+def paginate_by_id(queryset, after=None, per_page=PER_PAGE):
+    """
+    returns (the rows of queryset with an id above `after`, in id order, at most per_page; the `after` of the next
+    page, None on the last one)
+    """
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    rows = list(queryset.order_by('pk')[:per_page + 1])
+    if len(rows) > per_page:
+        return rows[:per_page], rows[per_page - 1].pk
+    return rows, None
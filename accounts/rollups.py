@@ -0,0 +1,128 @@
+"""
+daily order rollups: the number of orders per day, status and product category, for the trend reports.
+
+A trend over months reads a few hundred OrderDailyRollup rows instead of counting millions of orders. The rollups are
+kept up to date by the Order signals(see signals.py), with one UPDATE per (day, status, category) changed, and rebuilt
+from the orders by 'manage.py rebuild_order_rollups' over a date range(after bulk_create()/update(), which send no
+signals, or to repair drift).
+
+Days are local dates(settings.TIME_ZONE). An order is counted under the category its product had when the order was
+saved: a product moved to another category changes the rollups of its past orders on the next rebuild only.
+A missing status or category(no product) is counted under ''.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderDailyRollup, Product
+
+REBUILD_DAYS = 31  # days rebuilt per transaction
+
+
+def local_day(moment):
+    return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+
+def day_start(day):
+    """
+    the first moment of a local day, to filter date_created on its index rather than on a function of it
+    """
+    moment = datetime.combine(day, time.min)
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+
+def update_rollups(changes, categories=None):
+    """
+    applies rollup changes with atomic UPDATE ... SET orders = orders + n queries, creating the missing rows
+
+    changes: iterable of (date_created, status, product_id, +1/-1)
+    categories: {product_id: category} of the products, when already loaded; queried otherwise
+    """
+    changes = [change for change in changes if change[0] is not None]
+    if categories is None:
+        product_ids = {product_id for _, _, product_id, _ in changes if product_id is not None}
+        products = Product.objects.filter(pk__in=product_ids)
+        categories = dict(products.values_list('pk', 'category')) if product_ids else {}
+
+    deltas = Counter()
+    for date_created, status, product_id, delta in changes:
+        deltas[local_day(date_created), status or '', categories.get(product_id) or ''] += delta
+
+    for (day, status, category), delta in deltas.items():
+        if delta == 0:
+            continue
+        rollup = OrderDailyRollup.objects.filter(day=day, status=status, category=category)
+        # never below zero(a PositiveIntegerField), even if the rollups have drifted
+        orders = F('orders') + delta if delta > 0 else Greatest(F('orders') + delta, Value(0))
+        if rollup.update(orders=orders) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                OrderDailyRollup.objects.create(day=day, status=status, category=category, orders=delta)
+        except IntegrityError:  # created by a concurrent request meanwhile
+            rollup.update(orders=orders)
+
+
+def rollup_rows(orders):
+    """
+    [(day, status, category, orders), ...] of an Order queryset, in one GROUP BY query
+    """
+    rows = (orders.order_by()
+            .annotate(day=TruncDate('date_created'), rollup_status=Coalesce('status', Value('')),
+                      rollup_category=Coalesce('product__category', Value('')))
+            .values_list('day', 'rollup_status', 'rollup_category')
+            .annotate(orders=Count('id')))
+    return list(rows)
+
+
+def rebuild_rollups(start=None, end=None, days=REBUILD_DAYS, log=None):
+    """
+    recounts the rollups of the days start to end(included; default: the first and last days with orders) from the
+    orders, days at a time, each in a transaction. returns the number of rollup rows written
+    """
+    if start is None or end is None:
+        dates = Order.objects.exclude(date_created=None).values_list('date_created', flat=True)
+        first, last = dates.order_by('date_created').first(), dates.order_by('-date_created').first()
+        if first is None:
+            return 0
+        start = start or local_day(first)
+        end = end or local_day(last)
+
+    written = 0
+    day = start
+    while day <= end:
+        last_day = min(day + timedelta(days=days - 1), end)
+        orders = Order.objects.filter(date_created__gte=day_start(day),
+                                      date_created__lt=day_start(last_day + timedelta(days=1)))
+        with transaction.atomic():
+            OrderDailyRollup.objects.filter(day__range=(day, last_day)).delete()
+            rollups = OrderDailyRollup.objects.bulk_create(
+                OrderDailyRollup(day=row_day, status=status, category=category, orders=count)
+                for row_day, status, category, count in rollup_rows(orders))
+        written += len(rollups)
+        if log:
+            log(f'{day} - {last_day}: {len(rollups)} rollup(s)')
+        day = last_day + timedelta(days=1)
+    return written
+
+
+def order_trend(start, end, category=None):
+    """
+    {'days': [date, ...], 'statuses': {status: [orders per day, ...]}, 'totals': {status: orders}} for the days start
+    to end, from the rollups; category: only the orders of that product category
+    """
+    rollups = OrderDailyRollup.objects.filter(day__range=(start, end))
+    if category is not None:
+        rollups = rollups.filter(category=category)
+    rows = rollups.order_by().values_list('day', 'status').annotate(total=Sum('orders'))
+
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    statuses = {status: [0] * len(days) for status, _ in Order.STATUS}
+    for day, status, total in rows:
+        statuses.setdefault(status, [0] * len(days))[(day - start).days] = total
+    return {'days': days, 'statuses': statuses, 'totals': {status: sum(counts) for status, counts in statuses.items()}}
@@ -0,0 +1,219 @@
+"""
+full text search over customers(name, email, phone), products(name, tags, description) and order notes.
+
+Every searchable object has a SearchDocument(title, keywords and body text, weighted in that order) kept up to date
+by the post_save/post_delete/m2m_changed signals(see signals.py); bulk_create() paths call index_objects() themselves
+and 'manage.py rebuild_search_index' (re)indexes everything.
+
+On PostgreSQL the document's `vector` column holds the weighted to_tsvector of its text, with a GIN index, and
+results are ranked by SearchRank(ts_rank). Other databases(SQLite in the tests) use a small inverted index instead:
+one SearchTerm row per word of a document, results ranked by the sum of the matched words' weights.
+
+Results are paginated by page number; the page is capped at MAX_PAGE so OFFSET stays small.
+"""
+import re
+from collections import Counter
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, router, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import Count, F, Sum
+
+from .models import Customer, Order, Product, SearchDocument, SearchTerm
+
+CONFIG = 'english'
+PER_PAGE = 20
+MAX_PAGE = 50
+CHUNK_SIZE = 500  # ids per IN (...) clause, under SQLite's limit of query parameters
+
+# field: (tsvector weight, SearchTerm weight); the SearchTerm weights are ts_rank's defaults for A, B and C
+WEIGHTS = {
+    'title': ('A', 1.0),
+    'keywords': ('B', 0.4),
+    'body': ('C', 0.2),
+}
+
+VECTOR = (SearchVector('title', weight='A', config=CONFIG) +
+          SearchVector('keywords', weight='B', config=CONFIG) +
+          SearchVector('body', weight='C', config=CONFIG))
+
+
+def uses_tsvector():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    """
+    'Ann Smith <ann@example.com>' -> ['ann', 'smith', 'ann', 'example', 'com']
+    """
+    return [token[:100] for token in re.findall(r'\w+', (text or '').lower())]
+
+
+def chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# documents
+def customer_document(customer):
+    return SearchDocument(kind='customer', object_id=customer.pk, label=customer.name or f'Customer #{customer.pk}',
+                          title=customer.name or '',
+                          keywords=' '.join(value for value in (customer.email, customer.phone) if value))
+
+
+def product_document(product):
+    tags = ' '.join(tag.name for tag in product.tags.all() if tag.name)
+    return SearchDocument(kind='product', object_id=product.pk, label=product.name or f'Product #{product.pk}',
+                          title=product.name or '', keywords=tags, body=product.description or '')
+
+
+def order_document(order):
+    return SearchDocument(kind='order', object_id=order.pk, label=f'Order #{order.pk}', body=order.note or '')
+
+
+DOCUMENTS = {
+    'customer': (Customer, customer_document),
+    'product': (Product, product_document),
+    'order': (Order, order_document),
+}
+
+
+def ensure_ids(model, objs):
+    """
+    bulk_create() only sets the primary keys on PostgreSQL. Elsewhere(SQLite), called in the bulk_create's
+    transaction, which holds the database's write lock, the new rows are the ones with the highest ids; outside of
+    one, another insert may have come in between: TransactionManagementError rather than a guess.
+    """
+    missing = [obj for obj in objs if obj.pk is None]
+    if missing:
+        if not transaction.get_connection(router.db_for_write(model)).in_atomic_block:
+            raise TransactionManagementError(
+                f'The ids of bulk created {model.__name__} rows can only be read back in the transaction that '
+                f'inserted them.')
+        ids = sorted(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(missing)])
+        for obj, pk in zip(missing, ids):
+            obj.pk = pk
+
+
+def index_objects(kind, objs, created=False):
+    """
+    (re)creates the search documents of objs, Customer/Product/Order instances of kind; a few queries per call
+    created: the objects were just inserted, so they have no documents to replace yet
+    """
+    model, build = DOCUMENTS[kind]
+    ensure_ids(model, objs)
+    docs = [build(obj) for obj in objs]
+    object_ids = [doc.object_id for doc in docs]
+
+    if not created:
+        unindex(kind, object_ids)
+    SearchDocument.objects.bulk_create(docs)
+
+    for chunk in chunks(object_ids):
+        indexed = SearchDocument.objects.filter(kind=kind, object_id__in=chunk)
+        if uses_tsvector():
+            indexed.update(vector=VECTOR)
+        else:
+            doc_ids = dict(indexed.values_list('object_id', 'id'))
+            SearchTerm.objects.bulk_create([
+                SearchTerm(term=term, document_id=doc_ids[doc.object_id], weight=weight)
+                for doc in docs if doc.object_id in doc_ids
+                for term, weight in document_terms(doc).items()
+            ])
+
+
+def document_terms(doc):
+    """
+    {word: weight} of a document, a word found in several fields adds up their weights
+    """
+    terms = Counter()
+    for field, (_, weight) in WEIGHTS.items():
+        for term in set(tokenize(getattr(doc, field))):
+            terms[term] += weight
+    return terms
+
+
+def unindex(kind, object_ids):
+    for chunk in chunks(object_ids):
+        if not uses_tsvector():
+            SearchTerm.objects.filter(document__kind=kind, document__object_id__in=chunk).delete()
+        SearchDocument.objects.filter(kind=kind, object_id__in=chunk).delete()
+
+
+def rebuild_index(kinds=None, batch_size=1000):
+    """
+    indexes every customer, product and order(or only kinds), batch_size objects at a time. returns {kind: count}
+    """
+    counts = {}
+    for kind in kinds or DOCUMENTS:
+        model, _ = DOCUMENTS[kind]
+        queryset = model.objects.order_by('pk')
+        if kind == 'product':
+            queryset = queryset.prefetch_related('tags')
+
+        counts[kind] = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])  # keyset: no OFFSET
+            if not batch:
+                break
+            index_objects(kind, batch)
+            counts[kind] += len(batch)
+            last_pk = batch[-1].pk
+    return counts
+
+
+# searching
+class SearchPage:
+    def __init__(self, query, number, results, has_next):
+        self.query = query
+        self.number = number
+        self.results = results  # SearchDocuments with a .rank
+        self.has_next = has_next
+        self.has_previous = number > 1
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def search(query, page=1, per_page=PER_PAGE):
+    """
+    returns the SearchPage `page` of the documents matching every word of query, best ranked first
+    """
+    page = min(max(page, 1), MAX_PAGE)
+    start = (page - 1) * per_page
+    stop = start + per_page + 1  # one extra row tells us if there is a next page
+
+    if not tokenize(query):
+        return SearchPage(query, page, [], False)
+
+    if uses_tsvector():
+        search_query = SearchQuery(query, config=CONFIG)
+        results = list(SearchDocument.objects.filter(vector=search_query)
+                       .annotate(rank=SearchRank(F('vector'), search_query))
+                       .order_by('-rank', 'id').defer('vector')[start:stop])
+    else:
+        terms = set(tokenize(query))
+        matches = list(SearchTerm.objects.filter(term__in=terms).values('document')
+                       .annotate(matched=Count('term', distinct=True), rank=Sum('weight'))
+                       .filter(matched=len(terms)).order_by('-rank', 'document')[start:stop])
+        documents = SearchDocument.objects.in_bulk([match['document'] for match in matches])
+        results = []
+        for match in matches:
+            document = documents[match['document']]
+            document.rank = match['rank']
+            results.append(document)
+
+    return SearchPage(query, page, results[:per_page], len(results) > per_page and page < MAX_PAGE)
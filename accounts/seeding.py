@@ -0,0 +1,194 @@
+"""
+synthetic data at production scale for 'manage.py seed_cms' and the benchmarks(see 'manage.py bench_views').
+
+Generates tags, products(with tags), customers(each with a user in the 'customer' group), a few admin users(staff,
+in the 'admin' group) and orders, with a realistic skew:
+    - orders per product and per customer follow a power law(Zipf): a few best sellers and regular customers account
+      for most of the orders, the long tail for the rest
+    - statuses are mostly 'Delivered'(STATUS_WEIGHTS)
+    - date_created is spread over the last `days` days, the business growing towards today(GROWTH), and increases
+      with the id like in production; it is auto_now_add(the insert time), so it is set by an UPDATE after each insert
+
+Rows are inserted with bulk_create(), batch_size rows per transaction, so memory stays flat from 1k to 10M rows;
+the search index is filled batch by batch as the data goes in and the order counters and rollups are rebuilt at the
+end.
+Runs on SQLite and PostgreSQL. random_seed makes a run reproducible.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from .cache import bump_catalogue_version
+from .models import Customer, Order, Product, Tag
+from .search import ensure_ids, index_objects
+from .rollups import local_day, rebuild_rollups
+from .stats import rebuild_order_counters
+
+BATCH_SIZE = 5000
+PASSWORD = 'pass'  # every seeded user's password, for the benchmarks' logins
+
+STATUS_WEIGHTS = {'Pending': 15, 'Out for delivery': 10, 'Delivered': 75}
+PRODUCT_SKEW = 1.1  # Zipf exponents: the higher, the more the orders concentrate on the first products/customers
+CUSTOMER_SKEW = 0.8
+DAYS = 365  # the period of the orders' date_created, up to now
+GROWTH = 2  # orders per day grow with t ** (GROWTH - 1) over the period: the last day is the busiest
+DATES_PER_UPDATE = 400  # 2 query parameters each: under SQLite's limit of 999
+
+FIRST_NAMES = ['Ann', 'Bob', 'Chloe', 'David', 'Emma', 'Femi', 'Grace', 'Hassan', 'Ivy', 'Jack', 'Kemi', 'Liam']
+LAST_NAMES = ['Smith', 'Jones', 'Okafor', 'Brown', 'Taylor', 'Wilson', 'Evans', 'Thomas', 'Adeyemi', 'Walker']
+WORDS = ['ball', 'lamp', 'desk', 'chair', 'kettle', 'tent', 'bike', 'mug', 'rug', 'grill', 'sofa', 'shelf', 'boots']
+
+
+def zipf_weights(count, skew):
+    """
+    cumulative weights of `count` items, the item of rank r weighted 1 / r ** skew
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+class Seeder:
+    def __init__(self, batch_size=BATCH_SIZE, index=True, random_seed=None, log=None, days=DAYS):
+        self.batch_size = batch_size
+        self.days = days  # 0: the orders are dated now
+        self.index = index  # add the rows to the search index
+        self.random = random.Random(random_seed)
+        self.log = log or (lambda message: None)
+        self.password = make_password(PASSWORD)  # hashed once: hashing is slow by design
+        self.created = {'tags': 0, 'products': 0, 'customers': 0, 'admins': 0, 'orders': 0}
+        self.groups = {name: Group.objects.get_or_create(name=name)[0] for name in ('admin', 'customer')}
+
+    def seed(self, customers, products, orders, tags=20, admins=2):
+        """
+        returns {'tags': ..., 'products': ..., 'customers': ..., 'admins': ..., 'orders': ...}, the rows created
+        """
+        tag_ids = self.seed_tags(tags)
+        product_ids = self.seed_products(products, tag_ids)
+        customer_ids = self.seed_users(customers, 'customer')
+        self.seed_users(admins, 'admin')
+        self.seed_orders(orders, customer_ids, product_ids)
+        return self.created
+
+    def seed_tags(self, count):
+        with transaction.atomic():
+            tags = Tag.objects.bulk_create([Tag(name=f'{self.random.choice(WORDS)} {i}') for i in range(count)])
+            ensure_ids(Tag, tags)
+        self.created['tags'] += len(tags)
+        return [tag.pk for tag in tags]
+
+    def seed_products(self, count, tag_ids):
+        product_ids = []
+        categories = [category for category, _ in Product.CATEGORY]
+        for start, size in batches(count, self.batch_size):
+            with transaction.atomic():
+                products = Product.objects.bulk_create([
+                    Product(name=f'{word.title()} {start + i}', price=Decimal(self.random.randint(100, 50000)) / 100,
+                            category=self.random.choice(categories), description=f'A {word} for every home')
+                    for i, word in enumerate(self.random.choices(WORDS, k=size))])
+                ensure_ids(Product, products)
+                Product.tags.through.objects.bulk_create([
+                    Product.tags.through(product_id=product.pk, tag_id=tag_id)
+                    for product in products
+                    for tag_id in set(self.random.sample(tag_ids, min(len(tag_ids), self.random.randint(0, 3))))])
+                if self.index:
+                    batch = Product.objects.filter(pk__range=(products[0].pk, products[-1].pk))
+                    index_objects('product', list(batch.prefetch_related('tags')), created=True)
+            product_ids.extend(product.pk for product in products)
+            self.created['products'] += size
+            self.log(f'products: {self.created["products"]}/{count}')
+        bump_catalogue_version()  # bulk_create() doesn't send the signals that drop the cached catalogue
+        return product_ids
+
+    def seed_users(self, count, role):
+        """
+        users in the group role: customers get a Customer each, admins are staff. returns the Customer ids
+        """
+        customer_ids = []
+        prefix = 'admin' if role == 'admin' else 'customer'
+        first = User.objects.filter(username__startswith=prefix).count()  # seeding again adds new users
+        for start, size in batches(count, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{prefix}{first + start + i}', password=self.password,
+                         email=f'{prefix}{first + start + i}@example.com', is_staff=role == 'admin')
+                    for i in range(size)])
+                ensure_ids(User, users)
+                User.groups.through.objects.bulk_create([
+                    User.groups.through(user_id=user.pk, group_id=self.groups[role].pk) for user in users])
+
+                if role == 'customer':
+                    # bulk_create() doesn't send post_save: the profiles are created here, not by signals.py
+                    customers = Customer.objects.bulk_create([
+                        Customer(user_id=user.pk, email=user.email, phone=f'0{self.random.randrange(10 ** 10):010d}',
+                                 name=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}')
+                        for user in users])
+                    ensure_ids(Customer, customers)
+                    if self.index:
+                        index_objects('customer', customers, created=True)
+                    customer_ids.extend(customer.pk for customer in customers)
+            self.created['customers' if role == 'customer' else 'admins'] += size
+            self.log(f'{prefix}s: {start + size}/{count}')
+        return customer_ids
+
+    def seed_orders(self, count, customer_ids, product_ids):
+        if not (customer_ids and product_ids):
+            return
+        # shuffled, so the best customers and products aren't always the first ids
+        customer_ids, product_ids = customer_ids[:], product_ids[:]
+        self.random.shuffle(customer_ids)
+        self.random.shuffle(product_ids)
+        customer_weights = zipf_weights(len(customer_ids), CUSTOMER_SKEW)
+        product_weights = zipf_weights(len(product_ids), PRODUCT_SKEW)
+        statuses, status_weights = list(STATUS_WEIGHTS), list(accumulate(STATUS_WEIGHTS.values()))
+        now = timezone.now()
+        first, span = now - timedelta(days=self.days), timedelta(days=self.days)
+
+        for start, size in batches(count, self.batch_size):
+            customers = self.random.choices(customer_ids, cum_weights=customer_weights, k=size)
+            products = self.random.choices(product_ids, cum_weights=product_weights, k=size)
+            status = self.random.choices(statuses, cum_weights=status_weights, k=size)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([
+                    Order(customer_id=customers[i], product_id=products[i], status=status[i],
+                          note=f'{self.random.choice(WORDS)} order {start + i}')
+                    for i in range(size)])
+                if self.days:
+                    ensure_ids(Order, orders)
+                    # the inverse of the growth's distribution at evenly spread random points: increasing dates
+                    self.set_dates(orders, [first + span * ((start + i + self.random.random()) / count) ** (1 / GROWTH)
+                                            for i in range(size)])
+                if self.index:
+                    index_objects('order', orders, created=True)
+            self.created['orders'] += size
+            self.log(f'orders: {self.created["orders"]}/{count}')
+
+        # bulk_create() doesn't send the Order signals: recount the customers in a single UPDATE, then the period's
+        # rollups
+        rebuild_order_counters(Customer.objects.filter(pk__range=(min(customer_ids), max(customer_ids))))
+        if count:
+            rebuild_rollups(local_day(first), local_day(timezone.now()))
+
+    @staticmethod
+    def set_dates(orders, dates):
+        """
+        sets the date_created of the inserted orders(in id order, like dates), DATES_PER_UPDATE rows per UPDATE
+        """
+        pairs = list(zip(orders, dates))
+        for start in range(0, len(pairs), DATES_PER_UPDATE):
+            chunk = pairs[start:start + DATES_PER_UPDATE]
+            Order.objects.filter(pk__range=(chunk[0][0].pk, chunk[-1][0].pk)).update(date_created=Case(
+                *[When(pk=order.pk, then=Value(date, output_field=DateTimeField())) for order, date in chunk],
+                default=F('date_created'), output_field=DateTimeField()))
+            for order, date in chunk:
+                order.date_created = date
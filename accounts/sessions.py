@@ -0,0 +1,42 @@
+"""
+expired sessions, deleted in bounded batches.
+
+Django's 'manage.py clearsessions' deletes every expired session in one DELETE: after a busy day that is a long
+statement holding locks on the table every login writes to. clear_expired() deletes them BATCH_SIZE at a time, each
+batch its own short transaction, optionally pausing between batches, and stops after max_batches or max_seconds, so
+a scheduled run('manage.py clear_expired_sessions', e.g. hourly from cron) has a bounded cost; what is left is
+deleted by the next run.
+
+Only the database backed session modes('db', 'cached_db', see settings.SESSION_MODE) store sessions; the cache
+entries of 'cached_db' expire on their own.
+"""
+import time
+
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def clear_expired(batch_size=BATCH_SIZE, max_batches=None, max_seconds=None, pause=0, log=None):
+    """
+    deletes the sessions expired before now, batch_size at a time. returns (sessions deleted, True if none is left)
+    """
+    now = timezone.now()  # sessions expiring while it runs are left for the next run
+    started = time.monotonic()
+    deleted = batches = 0
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+        if keys:
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            batches += 1
+            if log:
+                log(f'batch {batches}: {len(keys)} session(s)')
+        if len(keys) < batch_size:
+            return deleted, True
+        if max_batches is not None and batches >= max_batches:
+            return deleted, False
+        if max_seconds is not None and time.monotonic() - started >= max_seconds:
+            return deleted, False
+        if pause:
+            time.sleep(pause)  # lets the logins waiting on the table through
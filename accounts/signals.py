@@ -1,17 +1,229 @@
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed, pre_delete, post_init, pre_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
 
-from .models import Customer
+from .models import Customer, Order, Product, Tag
+from .decorators import role_cache_key
+from .stats import update_order_counters
+from .rollups import update_rollups
+from .cache import bump_catalogue_version
+from .conditional import bump_data_version
+from . import search
+
+
+_customer_group = {}  # {'id': the 'customer' group's id}, looked up once per process
+
+
+def customer_group_id():
+    """
+    remembered once committed: the group may be created by a transaction(e.g. the first signup) that rolls back
+    """
+    if 'id' in _customer_group:
+        return _customer_group['id']
+    group_id = Group.objects.get_or_create(name='customer')[0].pk
+    transaction.on_commit(lambda: _customer_group.setdefault('id', group_id))
+    return group_id
+
+
+def forget_customer_group(sender=None, **kwargs):
+    """
+    connected to the Group signals of this process; a group deleted by another one shows as an IntegrityError of the
+    signup(see views.register_user)
+    """
+    _customer_group.clear()
 
 
 def customer_profile(sender, instance, created, **kwargs):
+    """
+    a new user joins the 'customer' group and gets a Customer: two INSERTs, in the transaction of the user's INSERT
+    when the caller has one(register_user does)
+    """
     if created:
-        group = Group.objects.get(name='customer')  # assign a new user to the 'customer' group
-        instance.groups.add(group)  # add the users group to Django Group
+        # the through row directly, rather than instance.groups.add(): no SELECT of the existing groups(there are
+        # none) and no m2m_changed, so the role cache entry is cleared here
+        User.groups.through.objects.create(user_id=instance.pk, group_id=customer_group_id())
+        clear_roles([instance.pk])
         Customer.objects.create(user=instance, name=instance.username,
                                 email=instance.email)  # create a Customer from the user object
 
 
 post_save.connect(customer_profile, sender=User)
+post_save.connect(forget_customer_group, sender=Group)
+post_delete.connect(forget_customer_group, sender=Group)
+
+
+def clear_roles(user_ids):
+    cache.delete_many([role_cache_key(user_id) for user_id in user_ids])
+
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    drops the cached roles(see decorators.get_user_roles) of the users whose groups changed
+    user.groups.add()/remove()/clear(): instance is the user; group.user_set...: instance is the group
+    """
+    if not reverse:
+        clear_roles([instance.pk])
+    elif pk_set:
+        clear_roles(pk_set)
+    elif action == 'pre_clear':  # group.user_set.clear(): the users are only known before the clear
+        clear_roles(instance.user_set.values_list('pk', flat=True))
+
+
+def group_changed(sender, instance, **kwargs):
+    """
+    a renamed or deleted group changes the roles of all its users
+    """
+    clear_roles(instance.user_set.values_list('pk', flat=True))
+
+
+m2m_changed.connect(user_groups_changed, sender=User.groups.through)
+post_save.connect(group_changed, sender=Group)
+pre_delete.connect(group_changed, sender=Group)
+
+
+"""
+Order signals: keep the Customer order counters(total_orders, pending_orders, ...) and the daily rollups(see
+rollups.py) up to date. Every save()/delete() of an Order goes through them: the views, the create_order formset and
+the admin. QuerySet.update()/bulk_create() don't send signals; use 'manage.py rebuild_order_counters' and
+'manage.py rebuild_order_rollups' after them.
+"""
+COUNTED_FIELDS = {'customer_id', 'status', 'date_created', 'product_id'}
+
+
+def remember_order(sender, instance, **kwargs):
+    """
+    remembers the (customer, status) the order is counted under and the (date_created, status, product) it is rolled
+    up under, to tell what changed when it is saved/deleted
+    """
+    if instance.pk is None or instance.get_deferred_fields().intersection(COUNTED_FIELDS):
+        instance._counted = instance._rolled_up = None
+    else:
+        instance._counted = (instance.customer_id, instance.status)
+        instance._rolled_up = (instance.date_created, instance.status, instance.product_id)
+
+
+def load_counted_order(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding or instance._counted is not None:
+        return
+    # loaded with .only()/.defer(): read what the order is counted under before it is overwritten
+    row = Order.objects.filter(pk=instance.pk).values_list('customer_id', 'status', 'date_created', 'product_id')
+    row = row.first()
+    if row is not None:
+        customer_id, status, date_created, product_id = row
+        instance._counted, instance._rolled_up = (customer_id, status), (date_created, status, product_id)
+
+
+def count_saved_order(sender, instance, created, raw, **kwargs):
+    if raw:  # loaddata: rebuild the counters afterwards
+        return
+    current = (instance.customer_id, instance.status)
+    previous = None if created else instance._counted
+    if previous != current:
+        changes = [(*current, 1)]
+        if previous:
+            changes.append((*previous, -1))
+        update_order_counters(changes)
+    instance._counted = current
+
+
+def count_deleted_order(sender, instance, **kwargs):
+    counted = instance._counted or (instance.customer_id, instance.status)
+    update_order_counters([(*counted, -1)])
+
+
+def roll_up_saved_order(sender, instance, created, raw, **kwargs):
+    if raw:  # loaddata: rebuild the rollups afterwards
+        return
+    current = (instance.date_created, instance.status, instance.product_id)
+    previous = None if created else instance._rolled_up
+    if previous != current:
+        changes = [(*current, 1)]
+        if previous:
+            changes.append((*previous, -1))
+        update_rollups(changes)
+    instance._rolled_up = current
+
+
+def roll_up_deleted_order(sender, instance, **kwargs):
+    rolled_up = instance._rolled_up or (instance.date_created, instance.status, instance.product_id)
+    update_rollups([(*rolled_up, -1)])
+
+
+post_init.connect(remember_order, sender=Order)
+pre_save.connect(load_counted_order, sender=Order)
+post_save.connect(count_saved_order, sender=Order)
+post_delete.connect(count_deleted_order, sender=Order)
+post_save.connect(roll_up_saved_order, sender=Order)
+post_delete.connect(roll_up_deleted_order, sender=Order)
+
+
+# Product/Tag signals: any change to the catalogue invalidates the cached products and product table(see cache.py)
+for model in (Product, Tag):
+    post_save.connect(bump_catalogue_version, sender=model, dispatch_uid=f'catalogue-save-{model.__name__}')
+    post_delete.connect(bump_catalogue_version, sender=model, dispatch_uid=f'catalogue-delete-{model.__name__}')
+m2m_changed.connect(bump_catalogue_version, sender=Product.tags.through)
+
+# a delete doesn't show in any MAX(updated_at): it changes the ETag of the conditional pages(see conditional.py)
+for model in (Order, Customer, Product):
+    post_delete.connect(bump_data_version, sender=model, dispatch_uid=f'data-delete-{model.__name__}')
+
+
+"""
+search signals: keep the SearchDocuments of customers, products and orders up to date(see search.py)
+"""
+
+
+def index_saved(kind):
+    def handler(sender, instance, created, raw, **kwargs):
+        if not raw:
+            search.index_objects(kind, [instance], created=created)
+    return handler
+
+
+def unindex_deleted(kind):
+    def handler(sender, instance, **kwargs):
+        search.unindex(kind, [instance.pk])
+    return handler
+
+
+for kind, model in (('customer', Customer), ('product', Product), ('order', Order)):
+    post_save.connect(index_saved(kind), sender=model, weak=False, dispatch_uid=f'search-save-{kind}')
+    post_delete.connect(unindex_deleted(kind), sender=model, weak=False, dispatch_uid=f'search-delete-{kind}')
+
+
+def index_product_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    product.tags.add()/remove()/clear(): instance is the product; tag.product_set...: instance is the tag
+    """
+    if not reverse:
+        if action.startswith('post_'):
+            search.index_objects('product', [instance])
+    elif action == 'pre_clear':  # tag.product_set.clear(): the products are only known before the clear
+        instance._product_ids = list(instance.product_set.values_list('pk', flat=True))
+    elif action.startswith('post_'):
+        product_ids = instance._product_ids if action == 'post_clear' else pk_set
+        search.index_objects('product', list(Product.objects.filter(pk__in=product_ids).prefetch_related('tags')))
+
+
+def index_tag_products(sender, instance, **kwargs):
+    """
+    a renamed tag changes the keywords of its products
+    """
+    search.index_objects('product', list(instance.product_set.prefetch_related('tags')))
+
+
+def remember_tag_products(sender, instance, **kwargs):
+    instance._product_ids = list(instance.product_set.values_list('pk', flat=True))
+
+
+def index_untagged_products(sender, instance, **kwargs):
+    search.index_objects('product', list(Product.objects.filter(pk__in=instance._product_ids).prefetch_related('tags')))
+
+
+m2m_changed.connect(index_product_tags, sender=Product.tags.through)
+post_save.connect(index_tag_products, sender=Tag)
+pre_delete.connect(remember_tag_products, sender=Tag)
+post_delete.connect(index_untagged_products, sender=Tag)
@@ -0,0 +1,71 @@
+"""
+serves the collected static files from STATIC_ROOT, for the environments without S3(STATIC_HOSTING = 'local').
+
+Unlike django.views.static.serve(for development), it serves the .br/.gz siblings written at collect time(see
+storage.compress()) to the clients accepting them, with the Cache-Control of storage.cache_control(): a year for the
+hashed names. The ETag is per encoding(size and modification time of the file sent), so a 304 never hands a client
+an encoding it didn't ask for.
+"""
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import COMPRESSED, cache_control
+
+
+def accepted_encodings(header):
+    """
+    'gzip, deflate;q=0.5, br;q=0' -> {'gzip', 'deflate'}
+    """
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.partition(';')
+        quality = params.strip()
+        try:
+            accepted = not quality.startswith('q=') or float(quality[2:]) > 0
+        except ValueError:
+            accepted = False
+        if encoding.strip() and accepted:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+@require_safe
+def serve(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    sent, content_encoding = full_path, None
+    if encoding is None:  # not a .gz file itself
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for extension, name in COMPRESSED.items():
+            if name in accepted and os.path.isfile(full_path + extension):
+                sent, content_encoding = full_path + extension, name
+                break
+
+    stat = os.stat(sent)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    headers = {'ETag': etag, 'Last-Modified': http_date(stat.st_mtime), 'Cache-Control': cache_control(path),
+               'Vary': 'Accept-Encoding'}
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(open(sent, 'rb'), content_type=content_type or 'application/octet-stream')
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,119 @@
+"""
+dashboard statistics: the totals shown on the admin and customer dashboards.
+
+Every number is computed with conditional aggregation (COUNT ... FILTER (WHERE ...)) so a dashboard costs a
+single query, rather than one query per card.
+
+A customer's own totals are not counted at all: they are stored on Customer(total_orders, pending_orders, ...) and
+kept up to date by the Order signals(see signals.py), so customer pages read them for free.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+
+from .models import Customer, Order
+
+
+def status_key(status):
+    """
+    converts an Order status into a context/template friendly key e.g. 'Out for delivery' -> 'out_for_delivery'
+    """
+    return status.lower().replace(' ', '_')
+
+
+def counter_field(status):
+    """
+    the Customer counter of an Order status e.g. 'Out for delivery' -> 'out_for_delivery_orders'
+    """
+    return f'{status_key(status)}_orders'
+
+
+def order_stats(orders=None, include_customers=False):
+    """
+    returns the total number of orders and the number of orders in each status, in one query.
+
+    orders: the queryset to count (defaults to all orders) e.g. customer.order_set.all()
+    include_customers: also count the customers (as a scalar sub-query) for the admin dashboard
+
+    {'total_orders': 10, 'pending': 4, 'out_for_delivery': 2, 'delivered': 4, 'total_customers': 5}
+    """
+    if orders is None:
+        orders = Order.objects.all()
+
+    aggregates = {'total_orders': Count('id')}
+    for status, _ in Order.STATUS:
+        aggregates[status_key(status)] = Count('id', filter=Q(status=status))
+
+    if include_customers:
+        # values() on a constant: one COUNT over all the customers, without a GROUP BY
+        customers = Subquery(Customer.objects.order_by().annotate(all=Value(1, IntegerField())).values('all')
+                             .annotate(total=Count('id')).values('total'), output_field=IntegerField())
+        # aggregate() only takes aggregates: Max() lifts the scalar sub-query into it, and as Max() of no orders is
+        # NULL the sub-query itself is the fallback
+        aggregates['total_customers'] = Coalesce(Max(customers), customers)
+
+    stats = orders.order_by().aggregate(**aggregates)
+    return stats
+
+
+def dashboard_stats():
+    """
+    totals for the admin dashboard: customers, orders, and orders per status
+    """
+    return order_stats(include_customers=True)
+
+
+def customer_stats(customer):
+    """
+    the same totals as order_stats(customer.order_set.all()), read from the customer's counters without a query
+    """
+    stats = {'total_orders': customer.total_orders}
+    for status, _ in Order.STATUS:
+        stats[status_key(status)] = getattr(customer, counter_field(status))
+    return stats
+
+
+def update_order_counters(changes):
+    """
+    applies counter changes with atomic UPDATE ... SET x = x + n queries, one per customer
+
+    changes: iterable of (customer_id, status, +1/-1), e.g. [(1, 'Pending', -1), (1, 'Delivered', 1)]
+    """
+    deltas = Counter()
+    for customer_id, status, delta in changes:
+        if customer_id is None:
+            continue
+        deltas[customer_id, 'total_orders'] += delta
+        if status in dict(Order.STATUS):
+            deltas[customer_id, counter_field(status)] += delta
+
+    updates = {}
+    for (customer_id, field), delta in deltas.items():
+        if delta > 0:
+            updates.setdefault(customer_id, {})[field] = F(field) + delta
+        elif delta < 0:
+            # never below zero(a PositiveIntegerField), even if the counters have drifted
+            updates.setdefault(customer_id, {})[field] = Greatest(F(field) + delta, Value(0))
+
+    for customer_id, fields in updates.items():
+        Customer.objects.filter(pk=customer_id).update(**fields, updated_at=Now())
+
+
+def rebuild_order_counters(customers=None):
+    """
+    recounts the order counters of customers(default: all) from the orders, in a single UPDATE.
+    returns the number of customers updated.
+    """
+    if customers is None:
+        customers = Customer.objects.all()
+
+    def count(**filters):
+        orders = Order.objects.filter(customer=OuterRef('pk'), **filters).order_by().values('customer')
+        orders = orders.annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(orders, output_field=IntegerField()), Value(0))
+
+    counters = {'total_orders': count()}
+    for status, _ in Order.STATUS:
+        counters[counter_field(status)] = count(status=status)
+    return customers.update(**counters, updated_at=Now())  # the pages showing them(see conditional.py)
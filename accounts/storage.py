@@ -0,0 +1,209 @@
+"""
+S3 storages with parallel uploads, and the upload side of 'manage.py collectstatic_parallel'.
+
+Uploading to S3 is mostly waiting on the network, so files are sent MAX_WORKERS at a time from a thread pool
+(save_many()). The storages keep one boto3 session/bucket per thread: boto3 resources must not be shared by threads.
+
+Static files are served under content hashed names(css/custom.3f2a9c1b.css, listed in staticfiles.json), so they can
+be cached for good by browsers and the CDN(cache_control()). collectstatic_parallel builds them locally with
+CompressedManifestStaticFilesStorage in STATICFILES_STAGING_ROOT, then sync_directory() uploads only the files whose
+content changed since the last deploy, according to a local manifest of SHA-256 hashes(UPLOAD_MANIFEST).
+
+The text files also get pre-compressed .gz and .br(if the brotli package is installed) siblings at collect time,
+served as is by accounts/static.py when the app serves its own static files(STATIC_HOSTING = 'local'). S3 can't
+choose an encoding per request, so StaticS3Storage uploads the gzipped content under the original name instead.
+
+Any Django storage works with save_many() and sync_directory(); the tests use FileSystemStorage instead of S3.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+from django.contrib.staticfiles.storage import ManifestFilesMixin, ManifestStaticFilesStorage
+from django.core.files import File
+from storages.backends.s3boto3 import S3Boto3Storage
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 16
+UPLOAD_MANIFEST = '.upload-manifest.json'  # {name: sha256}, in the staging directory
+MANIFEST_LAST = 'staticfiles.json'  # uploaded after the files it lists, so it never points at missing ones
+
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}(\.|$)')  # css/custom.3f2a9c1b8e0d.css(.gz)
+IMMUTABLE = 'public, max-age=31536000, immutable'  # a year: a new content gets a new name
+REVALIDATE = 'public, no-cache'  # the names that don't change with the content: checked with the ETag every time
+
+COMPRESSIBLE = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico', '.eot', '.ttf', '.otf'}
+COMPRESSED = {'.br': 'br', '.gz': 'gzip'}  # extension: Content-Encoding, the preferred first
+
+
+def save(storage, name, content):
+    """
+    storage.save(), replacing an existing file rather than saving under a new name(S3 overwrites by itself)
+    """
+    if not getattr(storage, 'file_overwrite', False) and storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
+
+
+def save_many(storage, files, max_workers=MAX_WORKERS):
+    """
+    saves [(name, content), ...] to storage max_workers at a time; content is a File or a path to a local file.
+    returns the saved names, in the same order
+    """
+    def upload(item):
+        name, content = item
+        if isinstance(content, str):
+            with open(content, 'rb') as file:
+                return save(storage, name, File(file))
+        return save(storage, name, content)
+
+    files = list(files)
+    if len(files) < 2 or max_workers < 2:
+        return [upload(item) for item in files]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        return list(executor.map(upload, files))
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_control(name):
+    return IMMUTABLE if HASHED_NAME.search(posixpath.basename(name)) else REVALIDATE
+
+
+def compress(path):
+    """
+    writes path.gz and path.br next to a text file, unless they are up to date or not smaller than the file.
+    returns the paths written
+    """
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE:
+        return []
+    written = []
+    with open(path, 'rb') as file:
+        content = None
+        for extension, compressor in (('.gz', compress_gzip), ('.br', brotli and brotli.compress)):
+            target = path + extension
+            if not compressor or (os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path)):
+                continue
+            content = file.read() if content is None else content
+            compressed = compressor(content)
+            if len(compressed) >= len(content) * 0.95:  # not worth a second file
+                continue
+            with open(target, 'wb') as output:
+                output.write(compressed)
+            written.append(target)
+    return written
+
+
+def compress_gzip(content):
+    # mtime=0: the same content gives the same bytes, so an unchanged file is not uploaded again
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def sync_directory(source, storage, max_workers=MAX_WORKERS, force=False, dry_run=False, exclude=()):
+    """
+    uploads the files of the local directory source to storage(same relative names), skipping the ones unchanged
+    since the last sync according to source/UPLOAD_MANIFEST and the ones ending with one of exclude.
+    returns (uploaded names, number of unchanged files)
+    """
+    manifest_path = os.path.join(source, UPLOAD_MANIFEST)
+    try:
+        with open(manifest_path) as file:
+            uploaded = {} if force else json.load(file)
+    except (OSError, ValueError):  # first sync, or a damaged manifest: upload everything
+        uploaded = {}
+
+    hashes, changed = {}, []
+    for root, _, names in os.walk(source):
+        for filename in names:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            if name == UPLOAD_MANIFEST or (exclude and name.endswith(tuple(exclude))):
+                continue
+            hashes[name] = file_hash(path)
+            if uploaded.get(name) != hashes[name]:
+                changed.append((name, path))
+
+    if dry_run:
+        return [name for name, _ in changed], len(hashes) - len(changed)
+
+    last = [item for item in changed if item[0] == MANIFEST_LAST]
+    first = [item for item in changed if item[0] != MANIFEST_LAST]
+    save_many(storage, first, max_workers)
+    save_many(storage, last, max_workers)
+
+    with open(manifest_path, 'w') as file:
+        json.dump(hashes, file, indent=0, sort_keys=True)
+    return [name for name, _ in first + last], len(hashes) - len(changed)
+
+
+class ParallelS3Storage(S3Boto3Storage):
+    """
+    S3Boto3Storage that can be used from several threads at once(see save_many())
+    """
+    max_workers = MAX_WORKERS
+
+    @property
+    def bucket(self):
+        # per thread, like the connection S3Boto3Storage already keeps in self._connections
+        bucket = getattr(self._connections, 'bucket', None)
+        if bucket is None:
+            bucket = self._connections.bucket = self.connection.Bucket(self.bucket_name)
+        return bucket
+
+    def save_many(self, files):
+        return save_many(self, files, self.max_workers)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes the pre-compressed siblings of the files it collects
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in {*paths, *self.hashed_files.values()}:
+                compress(self.path(name))
+
+
+class StaticS3Storage(ManifestFilesMixin, ParallelS3Storage):
+    """
+    STATICFILES_STORAGE: static files on S3 under their hashed names(read from the uploaded staticfiles.json);
+    fill it with 'manage.py collectstatic_parallel', not collectstatic
+    """
+    gzip = True  # text files are uploaded gzipped(Content-Encoding: gzip), every browser accepts it
+    precompressed = False  # so the .gz/.br siblings are not uploaded
+
+    def get_object_parameters(self, name):
+        return {**super().get_object_parameters(name), 'CacheControl': cache_control(name)}
+
+    def read_manifest(self):
+        # S3 unreachable or refusing: no manifest rather than a failed page, and no retry on every request
+        try:
+            return super().read_manifest()
+        except (BotoCoreError, ClientError) as error:
+            logger.warning("Couldn't read %s from S3: %s", self.manifest_name, error)
+            return None
+
+    def stored_name(self, name):
+        if not self.hashed_files:  # no manifest: the original names, uploaded next to the hashed copies
+            return name
+        return super().stored_name(name)
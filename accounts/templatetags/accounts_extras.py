@@ -0,0 +1,35 @@
+from django import template
+
+from ..images import FORMATS, SIZES, has_variants, variant_name
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def cursor_url(context, param, cursor):
+    """
+    the current url with `param` set to cursor; keeps the other query string values(filters, other lists' cursors)
+    e.g. {% cursor_url 'orders' orders.next_cursor %}
+    """
+    query = context['request'].GET.copy()
+    query[param] = cursor
+    return '?' + query.urlencode()
+
+
+@register.inclusion_tag('_partials/_profile_picture.html')
+def profile_picture(customer, width=160, css_class='profile_pic'):
+    """
+    the customer's picture displayed `width` CSS pixels wide: the WebP and JPEG variants in srcsets, so the browser
+    downloads the smallest one sharp on its screen, or the original until the variants are generated(see images.py)
+    e.g. {% profile_picture request.user.customer 200 %}
+    """
+    picture = customer.profile_picture
+    context = {'width': width, 'css_class': css_class, 'src': picture.url if picture else None}
+    if has_variants(customer):
+        url = picture.storage.url  # computed, no request to the storage
+        for image_format in FORMATS:
+            context[f'{image_format}_srcset'] = ', '.join(
+                f'{url(variant_name(picture.name, size, image_format))} {size}w' for size in SIZES)
+        size = next((size for size in SIZES if size >= width), SIZES[-1])
+        context['src'] = url(variant_name(picture.name, size, 'jpeg'))
+    return context
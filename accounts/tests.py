@@ -1,3 +1,1495 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+import shutil
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import EndpointConnectionError
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.models import Count, Sum
+from django.db.transaction import TransactionManagementError
+from django.http import Http404
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from . import urls
+
+from . import asgi
+from . import concurrent
+from . import instrumentation
+from . import static as static_files
+from .cache import cache_stats, cached_products, catalogue_version
+from .asgi import WsgiToAsgi
+from .db import routers
+from .db.pool import ConnectionPool, PooledConnectionMixin, PoolTimeout, close_pools, db_stats
+from .db.routers import replica_stats
+from .decorators import LOCAL_ROLE_CACHE_TIMEOUT, ROLE_CACHE_TIMEOUT, get_user_roles, role_cache_timeout
+from .forms import create_orders
+from .images import variant_name
+from . import jobs
+from .models import Customer, Job, Order, OrderDailyRollup, Product, SearchDocument, Tag
+from .nplusone import NPlusOneDetector, NPlusOneError, NPlusOneMiddleware, NPlusOneWarning, query_repeats
+from .pagination import PER_PAGE, paginate
+from .rollups import day_start
+from .search import ensure_ids, search
+from .signals import customer_group_id, forget_customer_group
+from .stats import customer_stats, dashboard_stats, order_stats
+from .storage import ParallelS3Storage, StaticS3Storage, cache_control, save_many
+
+
+class StatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.create(name='customer')
+        cls.user = User.objects.create_user(username='ann', password='pass', email='ann@example.com')
+        cls.customer = cls.user.customer
+        Customer.objects.create(name='bob')
+        cls.product = Product.objects.create(name='Ball', price=10, category='Outdoor')
+        for status in ['Pending', 'Pending', 'Out for delivery', 'Delivered']:
+            Order.objects.create(customer=cls.customer, product=cls.product, status=status)
+        Order.objects.create(product=cls.product, status='Delivered')  # order without a customer
+
+    def test_dashboard_stats_single_query(self):
+        with self.assertNumQueries(1):
+            stats = dashboard_stats()
+        self.assertEqual(stats, {'total_customers': 2, 'total_orders': 5, 'pending': 2,
+                                 'out_for_delivery': 1, 'delivered': 2})
+
+    def test_order_stats_for_customer(self):
+        with self.assertNumQueries(1):
+            stats = order_stats(self.customer.order_set.all())
+        self.assertEqual(stats, {'total_orders': 4, 'pending': 2, 'out_for_delivery': 1, 'delivered': 1})
+
+    def test_dashboard_stats_without_orders(self):
+        Order.objects.all().delete()
+        with self.assertNumQueries(1):
+            stats = dashboard_stats()
+        self.assertEqual(stats['total_customers'], 2)
+        self.assertEqual(stats['total_orders'], 0)
+
+
+class ViewTestCase(TestCase):
+    """
+    creates the 'admin' and 'customer' groups, an admin user and a customer user (with a Customer profile)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.create(name='customer')
+        admin_group = Group.objects.create(name='admin')
+
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.admin.groups.set([admin_group])
+        cls.user = User.objects.create_user(username='ann', password='pass', email='ann@example.com')
+        cls.customer = cls.user.customer
+        cls.product = Product.objects.create(name='Ball', price=10, category='Outdoor')
+
+    def setUp(self):
+        cache.clear()  # cached roles are keyed by user id, and ids are reused between tests
+
+    def add_orders(self, count, customer=None):
+        for i in range(count):
+            user = User.objects.create_user(username=f'user{Order.objects.count()}', password='pass')
+            Order.objects.create(customer=customer or user.customer, note=f'note {i}',
+                                 product=Product.objects.create(name=f'Product {i}', category='Indoor'))
+
+
+class QueryCountTests(ViewTestCase):
+    """
+    every listing view issues the same number of queries however many rows it renders
+    """
+
+    def assertConstantQueries(self, num, url, customer=None):
+        self.client.get(url)  # warm up the cached roles
+        for _ in range(2):
+            self.add_orders(3, customer=customer)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_home(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(9, reverse('home'))  # 4: the page's ETag(see conditional.py)
+
+    def test_products(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(7, reverse('products'))  # new products: a cache miss every time
+
+    def test_customer(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(9, reverse('customer', args=[self.customer.id]), customer=self.customer)
+
+    def test_user_page(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(7, reverse('user_page'), customer=self.customer)
+
+    def test_update_order(self):
+        self.client.force_login(self.admin)
+        order = Order.objects.create(customer=self.customer, product=self.product)
+        self.assertConstantQueries(5, reverse('update_order', args=[order.id]))
+
+    def test_delete_order(self):
+        self.client.force_login(self.admin)
+        order = Order.objects.create(customer=self.customer, product=self.product)
+        self.assertConstantQueries(3, reverse('delete_order', args=[order.id]))
+
+
+class PaginationTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            Order.objects.create(customer=self.customer, product=self.product, note=f'note {i}')
+        # rows sharing a date_created are ordered by id
+        Order.objects.filter(id__in=Order.objects.values('id')[:4]).update(date_created=timezone.now())
+        self.expected = list(Order.objects.order_by('-date_created', '-id'))
+
+    def test_walk_forwards_and_backwards(self):
+        pages = [paginate(Order.objects.all(), per_page=5)]
+        while pages[-1].next_cursor:
+            pages.append(paginate(Order.objects.all(), pages[-1].next_cursor, per_page=5))
+
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual([order for page in pages for order in page], self.expected)
+        self.assertIsNone(pages[0].previous_cursor)
+
+        previous = paginate(Order.objects.all(), pages[2].previous_cursor, per_page=5)
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        first = paginate(Order.objects.all(), previous.previous_cursor, per_page=5)
+        self.assertEqual(first.object_list, pages[0].object_list)
+        self.assertIsNone(first.previous_cursor)
+
+    def test_rows_without_date_skipped(self):
+        undated = Order.objects.create(customer=self.customer, product=self.product, note='undated')
+        Order.objects.filter(pk=undated.pk).update(date_created=None)  # sorted first by PostgreSQL, last by SQLite
+        self.assertEqual(paginate(Order.objects.all(), per_page=20).object_list, self.expected)
+        pages = [paginate(Order.objects.all(), per_page=6)]
+        while pages[-1].next_cursor:
+            pages.append(paginate(Order.objects.all(), pages[-1].next_cursor, per_page=6))
+        self.assertEqual([order for page in pages for order in page], self.expected)
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = paginate(Order.objects.all(), 'not-a-cursor', per_page=5)
+        self.assertEqual(page.object_list, self.expected[:5])
+
+    def test_view_keeps_filters_in_cursor_links(self):
+        self.add_orders(PER_PAGE, customer=self.customer)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('customer', args=[self.customer.id]), {'status': 'Pending'})
+
+        page = response.context['customer_orders']
+        self.assertEqual(len(page), PER_PAGE)
+        self.assertContains(response, f'?status=Pending&amp;orders={page.next_cursor}')
+
+
+class RoleTests(ViewTestCase):
+    def test_roles_cached_per_request_and_per_user(self):
+        request = RequestFactory().get('/')
+        request.user = self.admin
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_roles(request), {'admin'})
+            get_user_roles(request)
+
+        request = RequestFactory().get('/')
+        request.user = self.admin
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_roles(request), {'admin'})
+
+    def test_roles_cached_briefly_per_process(self):
+        self.assertEqual(role_cache_timeout(), LOCAL_ROLE_CACHE_TIMEOUT)  # LocMemCache: a revocation isn't seen
+        shared = {**settings.CACHES, 'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                 'LOCATION': tempfile.gettempdir()}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(role_cache_timeout(), ROLE_CACHE_TIMEOUT)
+
+    def test_cache_cleared_when_groups_change(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('products')).content,
+                         b'Oops, you are not authorized to view this page.')
+
+        # a user in several groups is allowed in through any of them
+        Group.objects.get(name='admin').user_set.add(self.user)
+        self.assertEqual(self.client.get(reverse('products')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('user_page')).status_code, 200)
+
+        self.user.groups.remove(Group.objects.get(name='admin'))
+        self.assertEqual(self.client.get(reverse('products')).content,
+                         b'Oops, you are not authorized to view this page.')
+
+
+class IndexTests(TestCase):
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    def test_order_hot_paths_use_indexes(self):
+        self.assertUsesIndex(Order.objects.filter(customer_id=1, status='Pending'), 'order_customer_status_idx')
+        self.assertUsesIndex(Order.objects.filter(customer_id=1).order_by('-date_created', '-id'),
+                             'order_customer_created_idx')
+        self.assertUsesIndex(Order.objects.filter(status='Pending', date_created__gte=timezone.now()),
+                             'order_status_created_idx')
+        self.assertUsesIndex(Order.objects.order_by('-date_created', '-id')[:26], 'order_created_id_idx')
+
+
+class OrderCounterTests(ViewTestCase):
+    def assertCounters(self, customer, **expected):
+        customer.refresh_from_db()
+        self.assertEqual(customer_stats(customer), expected)
+        self.assertEqual(order_stats(customer.order_set.all()), expected)
+
+    def test_counters_follow_order_changes(self):
+        order = Order.objects.create(customer=self.customer, product=self.product)
+        Order.objects.create(customer=self.customer, product=self.product, status='Delivered')
+        self.assertCounters(self.customer, total_orders=2, pending=1, out_for_delivery=0, delivered=1)
+
+        order.status = 'Out for delivery'
+        order.save()
+        self.assertCounters(self.customer, total_orders=2, pending=0, out_for_delivery=1, delivered=1)
+
+        # an order loaded without its status still moves the right counters
+        order = Order.objects.only('id').get(pk=order.pk)
+        order.status = 'Delivered'
+        order.save()
+        self.assertCounters(self.customer, total_orders=2, pending=0, out_for_delivery=0, delivered=2)
+
+        other = Customer.objects.create(name='bob')
+        order.customer = other
+        order.save()
+        self.assertCounters(self.customer, total_orders=1, pending=0, out_for_delivery=0, delivered=1)
+        self.assertCounters(other, total_orders=1, pending=0, out_for_delivery=0, delivered=1)
+
+        Order.objects.filter(customer=other).delete()
+        self.assertCounters(other, total_orders=0, pending=0, out_for_delivery=0, delivered=0)
+
+    def test_counters_follow_saves_of_one_instance(self):
+        order = Order.objects.create(customer=self.customer, product=self.product)
+        order.status = 'Out for delivery'
+        order.save()
+        order.status = 'Delivered'
+        order.save()
+        self.assertCounters(self.customer, total_orders=1, pending=0, out_for_delivery=0, delivered=1)
+
+        # changed through another instance, then reloaded
+        other = Order.objects.get(pk=order.pk)
+        other.status = 'Pending'
+        other.save()
+        order.refresh_from_db()
+        order.status = 'Out for delivery'
+        order.save()
+        self.assertCounters(self.customer, total_orders=1, pending=0, out_for_delivery=1, delivered=0)
+
+        other.refresh_from_db(fields=['status'])
+        other.status = 'Delivered'
+        other.save()
+        self.assertCounters(self.customer, total_orders=1, pending=0, out_for_delivery=0, delivered=1)
+
+    def test_counters_follow_views(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('create_order', args=[self.customer.id]), {
+            'order_set-TOTAL_FORMS': 2, 'order_set-INITIAL_FORMS': 0,
+            'order_set-0-product': self.product.id, 'order_set-0-status': 'Pending', 'order_set-0-note': 'a',
+            'order_set-1-product': self.product.id, 'order_set-1-status': 'Delivered', 'order_set-1-note': 'b',
+        })
+        self.assertCounters(self.customer, total_orders=2, pending=1, out_for_delivery=0, delivered=1)
+
+        order = Order.objects.get(status='Pending')
+        self.client.post(reverse('update_order', args=[order.id]), {
+            'customer': self.customer.id, 'product': self.product.id, 'status': 'Delivered', 'note': 'a'})
+        self.assertCounters(self.customer, total_orders=2, pending=0, out_for_delivery=0, delivered=2)
+
+        self.client.post(reverse('delete_order', args=[order.id]))
+        self.assertCounters(self.customer, total_orders=1, pending=0, out_for_delivery=0, delivered=1)
+
+    def test_rebuild_repairs_drift(self):
+        Order.objects.create(customer=self.customer, product=self.product)
+        Customer.objects.update(total_orders=42, pending_orders=0, delivered_orders=7)
+
+        call_command('rebuild_order_counters', stdout=StringIO())
+        self.assertCounters(self.customer, total_orders=1, pending=1, out_for_delivery=0, delivered=0)
+
+
+class CreateOrderTests(ViewTestCase):
+    def post_orders(self, lines, **extra):
+        data = {'order_set-TOTAL_FORMS': len(lines), 'order_set-INITIAL_FORMS': 0}
+        for i, (product, status) in enumerate(lines):
+            data.update({f'order_set-{i}-product': product, f'order_set-{i}-status': status,
+                         f'order_set-{i}-note': f'line {i}'})
+        data.update(extra)
+        return self.client.post(reverse('create_order', args=[self.customer.id]), data)
+
+    def test_bulk_create_constant_queries(self):
+        self.client.force_login(self.admin)
+        self.post_orders([(self.product.id, 'Delivered')])  # warm up the cached roles, create the day's rollup
+
+        for lines in (2, 20):
+            # session, user, customer, products, then SAVEPOINT, INSERT, counters UPDATE, rollup UPDATE, search
+            # index(4 on SQLite), RELEASE
+            with self.assertNumQueries(13):
+                response = self.post_orders([(self.product.id, 'Delivered')] * lines)
+            self.assertRedirects(response, '/', fetch_redirect_response=False)
+
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 23)
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.total_orders, self.customer.delivered_orders), (23, 23))
+        self.assertEqual(OrderDailyRollup.objects.get(status='Delivered', category='Outdoor').orders, 23)
+
+    def test_invalid_line_saves_nothing(self):
+        self.client.force_login(self.admin)
+        response = self.post_orders([(self.product.id, 'Pending'), (self.product.id + 100, 'Pending')])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['formset'].errors[1]['product'])
+        self.assertFalse(Order.objects.exists())
+
+
+class CreateOrdersTransactionTests(TransactionTestCase):
+    """
+    create_orders() called outside of a transaction
+    """
+    def test_all_or_nothing(self):
+        customer = Customer.objects.create(name='Ann')
+        product = Product.objects.create(name='Ball', price=10, category='Outdoor')
+        orders = [Order(customer=customer, product=product, status='Pending') for _ in range(2)]
+        with mock.patch('accounts.forms.search.index_objects', side_effect=DatabaseError('index')), \
+                self.assertRaises(DatabaseError):
+            create_orders(orders)
+        customer.refresh_from_db()
+        self.assertEqual((Order.objects.count(), customer.total_orders), (0, 0))  # nothing half done
+
+
+class ExportTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        Order.objects.create(customer=self.customer, product=self.product, status='Pending', note='first')
+        Order.objects.create(customer=self.customer, product=self.product, status='Delivered', note='second')
+
+    def test_csv_export_is_filtered_and_streamed(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export_orders'), {'status': 'Pending'})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(line.decode() for line in response.streaming_content))
+        self.assertEqual([(row['note'], row['product'], row['customer']) for row in rows], [('first', 'Ball', 'ann')])
+
+    def test_ndjson_export(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export_orders'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['status'] for row in rows], ['Pending', 'Delivered'])
+        self.assertEqual(rows[0]['price'], '10.00')
+
+    def test_invalid_export(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('export_orders'), {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_orders'), {'start_date': 'soon'}).status_code, 400)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_orders', '--format=ndjson', '--filter', 'note=SEC', stdout=out)
+        self.assertEqual([json.loads(line)['note'] for line in out.getvalue().splitlines()], ['second'])
+
+
+class ImportTests(TestCase):
+    def write_csv(self, header, rows):
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+        self.addCleanup(os.remove, file.name)
+        with file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+        return file.name
+
+    def test_import_with_bad_rows(self):
+        customers = self.write_csv(['name', 'email', 'phone'], [
+            ['Ann', 'ann@example.com', '0123'],
+            ['', 'nameless@example.com', ''],  # rejected
+            ['Bob', 'bob@example.com', ''],
+        ])
+        products = self.write_csv(['name', 'price', 'category', 'description', 'tags'], [
+            ['Ball', '9.99', 'Outdoor', '', 'Sports;Kids'],
+            ['Lamp', 'cheap', 'Indoor', '', ''],  # rejected
+            ['Desk', '120', 'Indoor', 'Oak', 'Kids'],
+        ])
+        orders = self.write_csv(['customer', 'product', 'status', 'note'],
+                                [['ann@example.com', 'Ball', 'Delivered', 'first']] * 5 + [
+                                    ['bob@example.com', 'Lamp', 'Pending', ''],  # rejected: unknown product
+                                    ['bob@example.com', 'Desk', 'Lost', ''],  # rejected: unknown status
+                                    ['bob@example.com', 'Desk', '', ''],
+                                ])
+
+        err = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_cms', customers=customers, products=products, orders=orders, batch_size=100,
+                         stdout=StringIO(), stderr=err)
+
+        self.assertLess(len(queries), 45)  # per batch, not per row
+        self.assertEqual(err.getvalue().count('\n'), 4)
+        self.assertIn(":8: unknown status 'Lost'", err.getvalue())
+
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(set(Product.objects.get(name='Ball').tags.values_list('name', flat=True)), {'Sports', 'Kids'})
+        ann = Customer.objects.get(email='ann@example.com')
+        self.assertEqual((ann.total_orders, ann.delivered_orders), (5, 5))
+        self.assertEqual(Customer.objects.get(email='bob@example.com').pending_orders, 1)
+
+    def test_import_refreshes_cached_catalogue(self):
+        cache.clear()
+        self.assertEqual(cached_products(), [])
+        products = self.write_csv(['name', 'price', 'category'], [['Ball', '9.99', 'Outdoor']])
+        call_command('import_cms', products=products, stdout=StringIO())
+        self.assertEqual([product.name for product in cached_products()], ['Ball'])
+
+    def test_finished_when_a_file_is_missing(self):
+        cache.clear()
+        self.assertEqual(cached_products(), [])
+        products = self.write_csv(['name', 'price', 'category'], [['Ball', '9.99', 'Outdoor']])
+        with self.assertRaises(CommandError):
+            call_command('import_cms', products=products, orders='missing.csv', stdout=StringIO())
+        # the products imported before the missing file are committed, and the cached catalogue follows them
+        self.assertEqual([product.name for product in cached_products()], ['Ball'])
+
+    def test_duplicates_are_rejected(self):
+        Customer.objects.create(name='Ann', email='ann@example.com')
+        customers = self.write_csv(['name', 'email'], [['Ann', 'ann@example.com'], ['Cat', 'cat@example.com'],
+                                                       ['Cat', 'cat@example.com']])
+        err = StringIO()
+        call_command('import_cms', customers=customers, stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue().count('already exists'), 2)
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class CatalogueCacheTests(ViewTestCase):
+    def test_product_table_cached_until_catalogue_changes(self):
+        self.client.force_login(self.admin)
+        url = reverse('products')
+        self.client.get(url)  # miss: renders and caches the table
+
+        with self.assertNumQueries(5):  # session, user and the ETag's MAX(updated_at) and versions only
+            response = self.client.get(url)
+        self.assertContains(response, 'Ball')
+
+        product = Product.objects.create(name='Lamp', price=20, category='Indoor')
+        self.assertContains(self.client.get(url), 'Lamp')
+
+        product.tags.add(Tag.objects.create(name='Light'))
+        self.assertEqual(cached_products()[-1].tags.all()[0].name, 'Light')
+
+        product.delete()
+        self.assertNotContains(self.client.get(url), 'Lamp')
+
+        stats = cache_stats()['products_table']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+        self.assertEqual(stats['hit_rate'], 0.25)
+
+    def test_version_shared_through_database(self):
+        version = catalogue_version()
+        cache.clear()  # another worker's cache: the same version
+        self.assertEqual(catalogue_version(), version)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.create(name='Lamp', price=20, category='Indoor')
+            Customer.objects.create(user=None, name='x', email='x', phone='x', total_orders=None)
+        self.assertEqual(catalogue_version(), version)  # rolled back with the change
+        Product.objects.create(name='Lamp', price=20, category='Indoor')
+        self.assertGreater(catalogue_version(), version)
+
+        err = StringIO()
+        call_command('cache_stats', stdout=StringIO(), stderr=err)
+        self.assertIn('local to each process', err.getvalue())
+
+
+class SearchTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lamp = Product.objects.create(name='Desk lamp', price=20, category='Indoor', description='Brass lamp')
+        self.lamp.tags.add(Tag.objects.create(name='Lighting'))
+        Order.objects.create(customer=self.customer, product=self.lamp, note='leave lamp at the door')
+
+    def labels(self, query, **kwargs):
+        return [result.label for result in search(query, **kwargs)]
+
+    def test_ranked_across_kinds(self):
+        # title matches rank above keyword and body matches
+        self.assertEqual(self.labels('lamp'), ['Desk lamp', f'Order #{Order.objects.get().pk}'])
+        self.assertEqual(self.labels('lighting'), ['Desk lamp'])
+        self.assertEqual(self.labels('ann@example.com'), ['ann'])
+        self.assertEqual(self.labels('lamp door'), [f'Order #{Order.objects.get().pk}'])
+        self.assertEqual(self.labels(''), [])
+
+    def test_index_follows_changes(self):
+        self.lamp.name = 'Floor light'
+        self.lamp.save()
+        self.assertEqual(self.labels('desk'), [])
+        self.assertEqual(self.labels('floor'), ['Floor light'])
+
+        Tag.objects.filter(name='Lighting').get().delete()
+        self.assertEqual(self.labels('lighting'), [])
+
+        Order.objects.all().delete()
+        self.assertEqual(self.labels('door'), [])
+
+    def test_pagination_and_view(self):
+        for i in range(5):
+            Product.objects.create(name=f'Lamp {i}', category='Indoor', price=1)
+        first, second = search('lamp', per_page=4), search('lamp', page=2, per_page=4)
+        self.assertTrue(first.has_next)
+        self.assertEqual(len(first) + len(second), 7)
+        self.assertFalse(second.has_next)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('search'), {'q': 'lamp', 'page': 'x'})
+        self.assertContains(response, 'Desk lamp')
+
+    def test_ids_read_back_in_transaction_only(self):
+        tags = [Tag(name='Sports'), Tag(name='Kids')]
+        with transaction.atomic():
+            Tag.objects.bulk_create(tags)
+            ensure_ids(Tag, tags)
+        self.assertEqual([tag.name for tag in Tag.objects.filter(pk__in=[tag.pk for tag in tags])], ['Sports', 'Kids'])
+
+        with mock.patch.object(connection, 'in_atomic_block', False), self.assertRaises(TransactionManagementError):
+            ensure_ids(Tag, [Tag(name='Outdoor')])
+        ensure_ids(Tag, tags)  # ids already set: nothing to read back
+
+    def test_rebuild_index(self):
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.labels('lighting'), ['Desk lamp'])
+
+
+class InstrumentationTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        instrumentation.reset()
+
+    def test_server_timing(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'total', 'db', 'tpl'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+
+        stats = instrumentation.summarize()['accounts.views.home']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries']['p50'], len(queries))
+        self.assertEqual(stats['size']['p99'], len(response.content))
+        self.assertGreater(stats['template']['p50'], 0)
+
+    def test_other_views_not_instrumented(self):
+        response = self.client.get('/admin/login/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.summarize(), {})
+
+    def test_metrics_staff_only(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('user_page'))
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'not authorized')
+
+        self.client.force_login(self.admin)
+        summary = self.client.get(reverse('metrics')).json()
+        self.assertEqual(summary['accounts.views.user_page']['requests'], 1)
+        self.assertEqual(set(summary['accounts.views.user_page']['total']), {'p50', 'p95', 'p99'})
+
+    def test_perf_stats_reads_published_samples(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('products'))
+        with mock.patch('accounts.instrumentation.worker_id', return_value='web-1:42'):
+            instrumentation.publish()
+        instrumentation.reset()  # as seen from another process: only the cache
+
+        out = StringIO()
+        call_command('perf_stats', stdout=out)
+        self.assertIn('accounts.views.products (1 requests)', out.getvalue())
+
+
+class NPlusOneTests(ViewTestCase):
+    """
+    every URL of accounts/urls.py, rendering more rows than the threshold, without repeated queries
+    """
+    THRESHOLD = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        tags = [Tag.objects.create(name=f'Tag {i}') for i in range(2)]
+        for i in range(cls.THRESHOLD * 2):
+            user = User.objects.create_user(username=f'user{i}', password='pass')
+            product = Product.objects.create(name=f'Product {i}', price=i, category='Indoor')
+            product.tags.set(tags)
+            for customer in (user.customer, cls.customer):
+                cls.order = Order.objects.create(customer=customer, product=product, note=f'note {i}')
+
+    def urls(self):
+        """
+        {url name: (user, url)}
+        """
+        admin, customer = self.admin, self.user
+        return {
+            'home': (admin, reverse('home')),
+            'products': (admin, reverse('products')),
+            'customer': (admin, reverse('customer', args=[self.customer.id])),
+            'user_page': (customer, reverse('user_page')),
+            'account': (customer, reverse('account')),
+            'create_order': (admin, reverse('create_order', args=[self.customer.id])),
+            'update_order': (admin, reverse('update_order', args=[self.order.id])),
+            'delete_order': (admin, reverse('delete_order', args=[self.order.id])),
+            'export_orders': (admin, reverse('export_orders')),
+            'search': (admin, reverse('search') + '?q=note'),
+            'metrics': (admin, reverse('metrics')),
+            'db_metrics': (admin, reverse('db_metrics')),
+            'order_reports': (admin, reverse('order_reports')),
+            'api_root': (admin, reverse('api_root')),
+            'api_collection': (admin, reverse('api_collection', args=['products']) + '?include=tags'),
+            'api_item': (admin, reverse('api_item', args=['orders', self.order.id]) + '?include=product'),
+            'register': (None, reverse('register')),
+            'logout': (customer, reverse('logout')),
+            'login': (None, reverse('login')),
+            'password_reset': (None, reverse('password_reset')),
+            'password_reset_done': (None, reverse('password_reset_done')),
+            'password_reset_confirm': (None, reverse('password_reset_confirm', args=['MQ', 'set-password'])),
+            'password_reset_complete': (None, reverse('password_reset_complete')),
+        }
+
+    def test_every_url(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(set(self.urls()), names)  # a new URL needs adding here
+
+        for name, (user, url) in self.urls().items():
+            with self.subTest(name):
+                self.client.logout()
+                if user:
+                    self.client.force_login(user)
+                with NPlusOneDetector(threshold=self.THRESHOLD, action='raise'):
+                    response = self.client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400)
+
+    def test_reports_template_line(self):
+        template = engines['django'].from_string('{% for order in orders %}\n{{ order.product.name }}\n{% endfor %}')
+        with self.assertRaisesMessage(NPlusOneError, 'line 2: {{ order.product.name }}'):
+            with NPlusOneDetector(threshold=self.THRESHOLD, action='raise'):
+                template.render({'orders': Order.objects.all()})
+
+    def test_warn(self):
+        with self.assertWarnsRegex(NPlusOneWarning, r'4 runs\(more than 3\)'):
+            with NPlusOneDetector(threshold=self.THRESHOLD, action='warn'):
+                for order in Order.objects.all():
+                    order.customer.name
+
+    def test_per_view_limits(self):
+        @query_repeats(threshold=100)
+        def view(request):
+            pass
+
+        request = RequestFactory().get('/')
+        request._nplusone = NPlusOneDetector(threshold=self.THRESHOLD)
+        NPlusOneMiddleware(None).process_view(request, login_required(view), (), {})
+        self.assertEqual(request._nplusone.threshold, 100)
+
+
+class SeedTests(TestCase):
+    def test_seed_cms(self):
+        cache.clear()
+        cached_products()
+        call_command('seed_cms', orders=300, customers=30, products=25, tags=5, admins=1, batch_size=100, seed=1,
+                     stdout=StringIO())
+
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertEqual(Customer.objects.filter(user__groups__name='customer').count(), 30)
+        self.assertTrue(User.objects.get(username='admin0').check_password('pass'))
+        self.assertEqual(sum(Customer.objects.values_list('total_orders', flat=True)), 300)
+        self.assertEqual(SearchDocument.objects.filter(kind='order').count(), 300)
+        self.assertEqual(len(cached_products()), 25)  # seeded after the empty catalogue was cached
+
+        # skewed: the best selling product has far more than its 1/25th share of the orders
+        top = Order.objects.values('product').annotate(total=Count('id')).order_by('-total')[0]['total']
+        self.assertGreater(top, 300 / 25 * 3)
+
+        # dated over the last year(--days), more recently, in id order; the rollups count them on their days
+        dates = list(Order.objects.order_by('pk').values_list('date_created', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreater(dates[-1] - dates[0], timedelta(days=300))
+        middle = timezone.now() - timedelta(days=365 / 2)
+        self.assertGreater(sum(date > middle for date in dates), 300 * 0.7)
+        self.assertEqual(OrderDailyRollup.objects.filter(day__lt=timezone.localdate(middle)).aggregate(
+            total=Sum('orders'))['total'], sum(date < day_start(timezone.localdate(middle)) for date in dates))
+
+    def test_bench_views(self):
+        call_command('seed_cms', orders=100, seed=1, stdout=StringIO())
+        out = StringIO()
+        call_command('bench_views', requests=2, warmup=0, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['views']), {pattern.name for pattern in urls.urlpatterns})
+        self.assertEqual(report['rows']['orders'], 100)
+        for name, result in report['views'].items():
+            self.assertLess(result['status'], 400, name)
+            self.assertEqual(set(result['latency_ms']), {'p50', 'p95', 'p99', 'mean'})
+
+
+class PooledSQLiteDatabaseWrapper(PooledConnectionMixin, SQLiteDatabaseWrapper):
+    pass
+
+
+class ConnectionPoolTests(TestCase):
+    def wrapper(self, **settings):
+        """
+        a pooled/health checked connection to a temporary SQLite file, under its own alias
+        """
+        file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        settings_dict = {**connection.settings_dict, 'NAME': file.name, 'CONN_MAX_AGE': 0,
+                         'CONN_HEALTH_CHECKS': True, 'POOL': None, **settings}
+        wrapper = PooledSQLiteDatabaseWrapper(settings_dict, alias=self.id())
+        self.addCleanup(close_pools)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pool_reuses_connections(self):
+        wrapper = self.wrapper(POOL={'MAX_SIZE': 2})
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()  # back to the pool
+        wrapper.ensure_connection()
+
+        self.assertIs(wrapper.connection, raw)
+        stats = db_stats()[self.id()]
+        self.assertEqual((stats['checkouts'], stats['connections'], stats['in_use']), (2, 1, 1))
+
+    def test_health_check_replaces_dead_connection(self):
+        wrapper = self.wrapper(CONN_MAX_AGE=600)
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        raw.close()  # dropped by the server between two requests
+        wrapper.close_if_unusable_or_obsolete()  # request finished
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIsNot(wrapper.connection, raw)
+        self.assertEqual(db_stats()[self.id()], {'connections': 2, 'reconnections': 1})
+
+    def test_pool_waits_then_times_out(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        connection_ = pool.checkout(mock.Mock)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(mock.Mock)
+
+        pool.timeout = 5
+        threading.Timer(0.05, pool.checkin, [connection_]).start()
+        self.assertIs(pool.checkout(mock.Mock), connection_)  # waited for it
+        self.assertEqual({key: pool.stats[key] for key in ('checkouts', 'connections', 'waits', 'timeouts')},
+                         {'checkouts': 3, 'connections': 1, 'waits': 2, 'timeouts': 1})
+
+    def test_pool_discards_broken_and_old_connections(self):
+        pool = ConnectionPool(max_size=2, max_age=60)
+        first = pool.checkout(mock.Mock)
+        pool.checkin(first)
+        second = pool.checkout(mock.Mock, check=lambda connection: False)  # failed health check: reconnected
+        self.assertIsNot(second, first)
+        first.close.assert_called_once()
+
+        pool.max_age = 0
+        pool.checkin(second)  # too old to be reused
+        second.close.assert_called_once()
+        self.assertEqual(pool.snapshot()['size'], 0)
+        self.assertEqual((pool.stats['reconnections'], pool.stats['discarded']), (1, 1))
+
+
+class SignupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.create(name='customer')
+
+    def test_register_queues_welcome_email(self):
+        response = self.client.post(reverse('register'), {'username': 'ann', 'email': 'ann@example.com',
+                                                          'password1': 'Secret-123', 'password2': 'Secret-123'})
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+        user = User.objects.get(username='ann')
+        self.assertEqual(user.customer.email, 'ann@example.com')
+        self.assertEqual(list(user.groups.values_list('name', flat=True)), ['customer'])
+        self.assertEqual(mail.outbox, [])  # not sent during the request
+        self.assertEqual(Job.objects.get().task, 'send_email')
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+        self.assertEqual(mail.outbox[0].to, ['ann@example.com'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_password_reset_queued(self):
+        User.objects.create_user(username='ann', password='pass', email='ann@example.com')
+        self.client.post(reverse('password_reset'), {'email': 'ann@example.com'})
+        self.assertEqual(mail.outbox, [])
+
+        jobs.run_pending()
+        self.assertIn('reset', mail.outbox[0].subject.lower())
+
+    def test_failed_job_retried_then_given_up(self):
+        job = jobs.enqueue('send_email', max_attempts=2, subject='Hi', message='Hi', recipient_list=['a@example.com'])
+        with mock.patch('accounts.jobs.send_mail', side_effect=OSError('SMTP down')):
+            self.assertEqual(jobs.run_pending(), (0, 1))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.last_error), ('pending', 1, 'OSError: SMTP down'))
+            self.assertGreater(job.run_at, timezone.now())  # backing off
+            self.assertEqual(jobs.run_pending(), (0, 0))
+
+            Job.objects.update(run_at=timezone.now())
+            self.assertEqual(jobs.run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+
+def image_file(size=(800, 600), image_format='PNG', mode='RGBA'):
+    output = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(output, image_format)
+    return output.getvalue()
+
+
+class CustomerGroupTests(TransactionTestCase):
+    """
+    committed transactions: the group's id is remembered on commit
+    """
+    def setUp(self):
+        forget_customer_group()  # the tables are flushed between the tests, without the Group signals
+
+    def test_profile_without_group_lookup(self):
+        customer_group_id()  # looked up once per process
+        with CaptureQueriesContext(connection) as queries:
+            User.objects.create_user(username='bob', password='pass')
+        self.assertFalse([query for query in queries if 'FROM "auth_group"' in query['sql']])
+        self.assertEqual(User.objects.get(username='bob').groups.get().name, 'customer')
+
+    def test_rolled_back_group_forgotten(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='bob', password='pass')  # creates the group
+            User.objects.create_user(username='bob', password='pass')
+        self.assertFalse(Group.objects.exists())
+        User.objects.create_user(username='ann', password='pass')
+        self.assertEqual(User.objects.get(username='ann').groups.get().name, 'customer')
+
+    def test_signup_after_group_deleted_elsewhere(self):
+        customer_group_id()
+        Group.objects.all()._raw_delete(connection.alias)  # by another process: no signal here
+        response = self.client.post(reverse('register'), {'username': 'ann', 'email': '', 'password1': 'Secret-123',
+                                                          'password2': 'Secret-123'})
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertEqual(User.objects.get(username='ann').groups.get().name, 'customer')
+
+
+class ImageVariantTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root,
+                                     DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_upload_queues_variants(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('ann.png', image_file(), content_type='image/png')
+        response = self.client.post(reverse('account'), {'name': 'Ann', 'phone': '0123', 'email': 'ann@example.com',
+                                                         'profile_picture': upload})
+        self.assertEqual(response.status_code, 200)
+        name = Customer.objects.get(pk=self.customer.pk).profile_picture.name
+        self.assertNotContains(response, 'image/webp')  # the original until the job ran
+        self.assertEqual(Job.objects.get().task, 'image_variants')
+
+        self.assertEqual(jobs.run_pending(), (1, 0))
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).picture_variants_of, name)
+        with default_storage.open(variant_name(name, 160, 'webp')) as file:
+            self.assertEqual(Image.open(file).size, (160, 120))
+        with default_storage.open(variant_name(name, 64, 'jpeg')) as file:
+            self.assertEqual(Image.open(file).format, 'JPEG')
+
+        response = self.client.get(reverse('account'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'src="{default_storage.url(variant_name(name, 400, "jpeg"))}"')
+
+    def test_backfill(self):
+        self.customer.profile_picture.save('old.jpg', ContentFile(image_file(mode='RGB', image_format='JPEG')))
+        out = StringIO()
+        call_command('generate_image_variants', self.customer.pk, stdout=out)
+        self.assertIn('1 picture(s)', out.getvalue())
+        self.assertTrue(default_storage.exists('variants/old_400.webp'))
+
+        call_command('generate_image_variants', self.customer.pk, stdout=out)  # nothing missing anymore
+        self.assertIn('0 picture(s)', out.getvalue())
+
+
+class StaticUploadTests(TestCase):
+    def setUp(self):
+        self.source, self.staging, self.target = (tempfile.mkdtemp() for _ in range(3))
+        for directory in (self.source, self.staging, self.target):
+            self.addCleanup(shutil.rmtree, directory)
+        os.makedirs(os.path.join(self.source, 'css'))
+        self.write('css/custom.css', 'body { background: url("../img/logo.png"); }')
+        os.makedirs(os.path.join(self.source, 'img'))
+        self.write('img/logo.png', 'png')
+        # the bucket: a local directory
+        settings = override_settings(STATICFILES_DIRS=[self.source], STATICFILES_STAGING_ROOT=self.staging,
+                                     STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+                                     STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+                                     STATIC_ROOT=self.target)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, name, content):
+        with open(os.path.join(self.source, name), 'w') as file:
+            file.write(content)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collectstatic_parallel', *args, stdout=out, verbosity=2)
+        return out.getvalue()
+
+    def test_uploads_changed_files_only(self):
+        out = self.collect()
+        # the 2 originals, their hashed copies(2 for the CSS: before and after its urls are rewritten), the manifest
+        self.assertIn('Uploaded: 6 file(s), 0 unchanged', out)
+        with open(os.path.join(self.target, 'staticfiles.json')) as file:
+            hashed = json.load(file)['paths']['css/custom.css']
+        self.assertRegex(hashed, r'^css/custom\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.target, hashed)) as file:
+            self.assertRegex(file.read(), r'logo\.[0-9a-f]{12}\.png')
+
+        self.assertIn('Uploaded: 0 file(s), 6 unchanged', self.collect())
+        self.assertIn('To upload: 6 file(s)', self.collect('--dry-run', '--force'))
+
+        self.write('css/custom.css', 'body { color: red; }')
+        os.utime(os.path.join(self.source, 'css/custom.css'), (2 ** 31, 2 ** 31))  # collectstatic compares mtimes
+        out = self.collect()
+        self.assertIn('Uploaded: 3 file(s), 4 unchanged', out)  # the old hashed copies stay, for cached pages
+        self.assertTrue(out.splitlines()[-2].endswith('staticfiles.json'))  # last, after the files it lists
+
+    def test_save_many_replaces(self):
+        storage = FileSystemStorage(location=self.target)
+        storage.save('a.txt', ContentFile(b'old'))
+        files = [(f'{name}.txt', ContentFile(name.encode())) for name in 'abcdef']
+        self.assertEqual(save_many(storage, files, max_workers=4), [name for name, _ in files])
+        with storage.open('a.txt') as file:
+            self.assertEqual(file.read(), b'a')
+
+    def test_compressed_at_collect_time(self):
+        css = 'body { background: url("../img/logo.png"); }\n' + '.row { margin: 0 auto; }\n' * 200
+        self.write('css/custom.css', css)
+        self.collect()
+        with open(os.path.join(self.staging, 'staticfiles.json')) as file:
+            hashed = json.load(file)['paths']['css/custom.css']
+        with open(os.path.join(self.staging, hashed), 'rb') as file, \
+                open(os.path.join(self.staging, hashed + '.gz'), 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), file.read())
+        self.assertFalse(os.path.exists(os.path.join(self.staging, 'img/logo.png.gz')))  # not a text file
+        self.assertTrue(os.path.exists(os.path.join(self.target, hashed + '.gz')))
+
+        self.assertEqual(cache_control(hashed), 'public, max-age=31536000, immutable')
+        self.assertEqual(cache_control(hashed + '.gz'), 'public, max-age=31536000, immutable')
+        self.assertEqual(cache_control('css/custom.css'), 'public, no-cache')
+
+    def test_local_serving(self):
+        self.write('css/custom.css', '.row { margin: 0 auto; }\n' * 200)
+        self.collect()
+        with open(os.path.join(self.staging, 'staticfiles.json')) as file:
+            hashed = json.load(file)['paths']['css/custom.css']
+        factory = RequestFactory()
+        with override_settings(STATIC_ROOT=self.staging):
+            response = static_files.serve(factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate, br;q=0'), hashed)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'.row { margin: 0 auto; }\n' * 200)
+            etag = response['ETag']
+
+            request = factory.get('/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+            response = static_files.serve(request, hashed)
+            self.assertEqual(response.status_code, 304)
+            response = static_files.serve(factory.get('/', HTTP_IF_NONE_MATCH=etag), hashed)  # no gzip: another ETag
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertNotEqual(response['ETag'], etag)
+            response.close()
+
+            with self.assertRaises(Http404):
+                static_files.serve(factory.get('/'), '../' + os.path.basename(self.source) + '/css/custom.css')
+
+    def test_s3_manifest_unreachable(self):
+        error = EndpointConnectionError(endpoint_url='https://bucket.s3.amazonaws.com')
+        with mock.patch.object(ParallelS3Storage, '_open', side_effect=error) as s3_open, \
+                override_settings(DEBUG=False), self.assertLogs('accounts.storage', 'WARNING'):
+            storage = StaticS3Storage()
+            self.assertEqual(storage.hashed_files, {})
+            self.assertTrue(storage.url('css/custom.css').endswith('/css/custom.css'))  # the original name
+        self.assertEqual(s3_open.call_count, 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(ViewTestCase):
+    """
+    a second SQLite database as the replica: migrated like the primary but not replicated, so the rows a page shows
+    tell which database it read
+    """
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3',
+                                            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3')}
+        connections.ensure_defaults('replica')
+        connections.prepare_test_settings('replica')
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        super().setUp()
+        routers.reset()
+        self.addCleanup(routers.reset)
+        # bulk_create(): no signals, which would write to the primary
+        User.objects.using('replica').bulk_create([User(pk=self.user.pk, username='ann')])
+        Customer.objects.using('replica').bulk_create([Customer(pk=self.customer.pk, user_id=self.user.pk,
+                                                                email='ann@replica.example')])
+        Product.objects.using('replica').bulk_create([Product(pk=self.product.pk, name='Ball', category='Outdoor')])
+        Order.objects.using('replica').bulk_create([Order(customer_id=self.customer.pk, product_id=self.product.pk,
+                                                          note='replicated')])
+        Customer.objects.filter(pk=self.customer.pk).update(email='ann@primary.example')
+        self.order = Order.objects.create(customer=self.customer, product=self.product, note='primary')
+        self.client.force_login(self.admin)
+
+    def test_read_only_views_read_replica(self):
+        response = self.client.get(reverse('customer', args=[self.customer.pk]))
+        self.assertContains(response, 'ann@replica.example')
+        self.assertEqual(replica_stats()['replicas']['replica']['healthy'], True)
+        self.assertGreater(replica_stats()['reads']['replica'], 0)
+
+        response = self.client.get(reverse('export_orders'))  # read while streamed
+        self.assertIn('replicated', b''.join(response.streaming_content).decode())
+
+        response = self.client.get(reverse('delete_order', args=[self.order.pk]))  # not a read-only view
+        self.assertContains(response, 'Ball')
+
+    def test_one_replica_per_request(self):
+        with mock.patch('accounts.middleware.choose_replica', wraps=routers.choose_replica) as choose, \
+                CaptureQueriesContext(connections['replica']) as queries:
+            self.assertContains(self.client.get(reverse('customer', args=[self.customer.pk])), 'ann@replica.example')
+        self.assertEqual(choose.call_count, 1)  # for all of the page's reads
+        self.assertGreater(len(queries), 2)
+        self.assertEqual(replica_stats()['reads'], {'replica': 1})
+
+    def test_reads_after_write_use_primary(self):
+        response = self.client.post(reverse('delete_order', args=[self.order.pk]))
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], routers.PIN_SECONDS)
+        self.assertContains(self.client.get(reverse('customer', args=[self.customer.pk])), 'ann@primary.example')
+
+        del self.client.cookies[routers.PIN_COOKIE]  # expired
+        self.assertContains(self.client.get(reverse('customer', args=[self.customer.pk])), 'ann@replica.example')
+
+    def test_failover_to_primary(self):
+        url = reverse('customer', args=[self.customer.pk])
+        with mock.patch('accounts.db.routers.replica_lag', return_value=60):
+            self.assertContains(self.client.get(url), 'ann@primary.example')
+        self.assertEqual(replica_stats()['replicas']['replica']['error'], 'lagging')
+
+        routers.reset()
+        with mock.patch('accounts.db.routers.replica_lag', side_effect=OperationalError('connection refused')):
+            self.assertContains(self.client.get(url), 'ann@primary.example')
+        self.assertEqual(replica_stats()['replicas']['replica']['error'], 'OperationalError: connection refused')
+        self.assertGreater(replica_stats()['reads']['primary'], 0)
+
+
+class RollupTests(ViewTestCase):
+    def rollups(self):
+        return {(rollup.status, rollup.category): rollup.orders
+                for rollup in OrderDailyRollup.objects.filter(day=timezone.localdate()) if rollup.orders}
+
+    def test_signals_keep_rollups(self):
+        indoor = Product.objects.create(name='Lamp', category='Indoor')
+        order = Order.objects.create(customer=self.customer, product=self.product, status='Pending')
+        Order.objects.create(customer=self.customer, product=indoor, status='Pending')
+        self.assertEqual(self.rollups(), {('Pending', 'Outdoor'): 1, ('Pending', 'Indoor'): 1})
+
+        order.status = 'Delivered'
+        order.save()
+        self.assertEqual(self.rollups(), {('Delivered', 'Outdoor'): 1, ('Pending', 'Indoor'): 1})
+
+        order = Order.objects.only('id').get(pk=order.pk)  # deferred fields: read back before the save
+        order.product = indoor
+        order.save()
+        self.assertEqual(self.rollups(), {('Delivered', 'Indoor'): 1, ('Pending', 'Indoor'): 1})
+
+        order.delete()
+        self.assertEqual(self.rollups(), {('Pending', 'Indoor'): 1})
+
+    def test_rebuild(self):
+        Order.objects.create(customer=self.customer, product=self.product, status='Pending')
+        Order.objects.bulk_create([Order(customer=self.customer, product=self.product, status='Delivered'),
+                                   Order(customer=self.customer, status=None)])  # no signals
+        OrderDailyRollup.objects.create(day=timezone.localdate() - timedelta(days=400), status='Pending', orders=3)
+        today = timezone.localdate().isoformat()
+
+        out = StringIO()
+        call_command('rebuild_order_rollups', '--start', today, '--end', today, stdout=out)
+        self.assertIn('Rebuilt 3 rollup row(s)', out.getvalue())
+        self.assertEqual(self.rollups(), {('Pending', 'Outdoor'): 1, ('Delivered', 'Outdoor'): 1, ('', ''): 1})
+        self.assertEqual(OrderDailyRollup.objects.count(), 4)  # outside the range: kept
+
+        call_command('rebuild_order_rollups', stdout=out)  # from the first order to the last
+        self.assertEqual(OrderDailyRollup.objects.count(), 4)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_order_rollups', '--start', today, '--end', '2020-01-01')
+
+    def test_report(self):
+        self.client.force_login(self.admin)
+        for status in ('Pending', 'Delivered', 'Delivered'):
+            Order.objects.create(customer=self.customer, product=self.product, status=status)
+        OrderDailyRollup.objects.create(day=timezone.localdate() - timedelta(days=3), status='Pending',
+                                        category='Indoor', orders=4)
+
+        with self.assertNumQueries(4):  # session, user, roles, rollups
+            response = self.client.get(reverse('order_reports'))
+        self.assertEqual(response.context['total'], 7)
+        self.assertEqual(len(response.context['days']), 30)
+        self.assertEqual(response.context['days'][-1]['total'], 3)
+        self.assertContains(response, 'title="Delivered: 2"')
+
+        response = self.client.get(reverse('order_reports'), {'category': 'Outdoor'})
+        self.assertEqual(response.context['total'], 3)
+        response = self.client.get(reverse('order_reports'), {'start': '2020-01-01'})
+        self.assertFalse(response.context['form'].is_valid())  # more than a year
+
+
+class ConditionalGetTests(ViewTestCase):
+    def revalidate(self, url, response, **extra):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+
+    def test_unchanged_page_not_modified(self):
+        self.client.force_login(self.admin)
+        url = reverse('home')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(6):  # session, user, three MAX(updated_at), data version: no lists, no rendering
+            not_modified = self.revalidate(url, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertIn('private', not_modified['Cache-Control'])
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_changes_change_etag(self):
+        self.client.force_login(self.admin)
+        url = reverse('customer', args=[self.customer.id])
+        response = self.client.get(url)
+
+        order = Order.objects.create(customer=self.customer, product=self.product)
+        changed = self.revalidate(url, response)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(self.revalidate(url, changed).status_code, 304)
+
+        order.delete()  # the latest updated_at may not change: the data version does
+        cache.clear()  # in the database: seen by a worker with a cache of its own too
+        deleted = self.revalidate(url, changed)
+        self.assertEqual(deleted.status_code, 200)
+        self.assertNotEqual(deleted['ETag'], changed['ETag'])
+
+        Product.objects.filter(pk=self.product.pk).update(name='Bat', updated_at=timezone.now())
+        self.assertContains(self.revalidate(url, deleted), 'Bat')
+
+    def test_products_etag_shared_by_workers(self):
+        self.client.force_login(self.admin)
+        url = reverse('products')
+        response = self.client.get(url)
+        cache.clear()  # another worker: its own cache, the same ETag
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        Product.objects.create(name='Lamp', price=20, category='Indoor')  # by another worker
+        changed = self.revalidate(url, response)
+        self.assertContains(changed, 'Lamp')
+        self.assertEqual(self.revalidate(url, changed).status_code, 304)
+
+    def test_etag_per_user_and_role(self):
+        url = reverse('products')
+        self.client.force_login(self.admin)
+        response = self.client.get(url)
+
+        other = User.objects.create_user(username='bob', password='pass')
+        other.groups.add(Group.objects.get(name='admin'))
+        self.client.force_login(other)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        self.admin.groups.add(Group.objects.get(name='customer'))
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_pending_messages_rendered(self):
+        self.client.force_login(self.user)
+        url = reverse('user_page')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        with mock.patch('accounts.conditional.messages.get_messages', return_value=['Profile Updated.']):
+            self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class SessionTests(ViewTestCase):
+    def login_and_dashboard(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('login'), {'username': 'admin', 'password': 'pass'}, follow=True)
+        self.assertContains(response, 'You are now logged in.')
+        return [query['sql'] for query in captured if 'django_session' in query['sql']]
+
+    def test_signed_cookies_store_nothing(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            self.assertEqual(self.login_and_dashboard(), [])
+            self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertFalse(Session.objects.exists())
+
+    def test_cached_db_reads_from_cache(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
+            queries = self.login_and_dashboard()
+            self.assertTrue(queries)  # written through
+            self.assertFalse([sql for sql in queries if sql.startswith('SELECT "django_session"."session_key"')])
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(reverse('home'))
+            self.assertFalse([query for query in captured if 'django_session' in query['sql']])
+
+    def test_clear_expired_sessions(self):
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([Session(session_key=f'expired{i}', session_data='', expire_date=expired)
+                                     for i in range(5)])
+        Session.objects.create(session_key='current', session_data='', expire_date=timezone.now() + timedelta(days=1))
+
+        out = StringIO()
+        call_command('clear_expired_sessions', batch_size=2, max_batches=2, stdout=out)
+        self.assertIn('Deleted 4 expired session(s), stopped', out.getvalue())
+        call_command('clear_expired_sessions', batch_size=2, stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current'])
+
+    def test_bench_sessions(self):
+        out = StringIO()
+        call_command('bench_sessions', rounds=2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['db', 'cached_db', 'signed_cookies'])
+        self.assertIn('session queries/round=0', lines[-1])
+
+
+class ApiTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+
+    def test_list_constant_queries(self):
+        url = reverse('api_collection', args=['orders']) + '?include=customer,product'
+        self.client.get(url)  # warm up the cached roles
+        for _ in range(2):
+            self.add_orders(3)
+            # session, user, the orders, their customers, products and the products' tags
+            with self.assertNumQueries(6):
+                response = self.client.get(url)
+        data = response.json()['data']
+        self.assertEqual(len(data), 6)
+        self.assertEqual(data[0]['product']['name'], 'Product 0')
+        self.assertEqual(data[0]['product']['tags'], [])
+        self.assertEqual(data[0]['customer']['total_orders'], 1)
+
+    def test_sparse_fields_and_pagination(self):
+        self.add_orders(3, customer=self.customer)
+        url = reverse('api_collection', args=['orders'])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, {'fields': 'status', 'limit': 2, 'customer': self.customer.pk})
+        self.assertNotIn('"note"', captured[-1]['sql'])
+        body = response.json()
+        self.assertEqual(body['data'][0], {'id': Order.objects.order_by('pk')[0].pk, 'status': 'Pending'})
+        self.assertEqual(len(self.client.get(body['next']).json()['data']), 1)
+
+        self.assertEqual(self.client.get(url, {'status': 'Delivered'}).json()['data'], [])
+        response = self.client.get(url, {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json()['errors'])
+
+    def test_create_update_delete(self):
+        tag = Tag.objects.create(name='Sale')
+        url = reverse('api_collection', args=['products'])
+        response = self.send('post', url, {'name': 'Lamp', 'price': '20.50', 'category': 'Indoor', 'tags': [tag.pk]})
+        self.assertEqual(response.status_code, 201)
+        product = response.json()['data']
+        self.assertEqual((product['price'], product['tags']), ('20.50', [tag.pk]))
+
+        item = reverse('api_item', args=['products', product['id']])
+        response = self.send('patch', item, {'price': '25'})
+        self.assertEqual(response.json()['data']['price'], '25.00')
+        self.assertEqual(response.json()['data']['tags'], [tag.pk])  # kept
+        self.assertEqual(self.send('patch', item, {'category': 'Garden'}).status_code, 400)
+
+        self.assertEqual(self.client.delete(item).status_code, 204)
+        self.assertEqual(self.client.get(item).status_code, 404)
+        self.assertEqual(self.client.post(url, {'name': 'Lamp'}).status_code, 415)
+
+    def test_admins_only(self):
+        url = reverse('api_collection', args=['customers'])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_batch(self):
+        url = reverse('api_root')
+        self.assertIn('orders', self.client.get(url).json()['resources'])
+        order = Order.objects.create(customer=self.customer, product=self.product, status='Pending')
+
+        def post(lines):
+            operations = [{'resource': 'orders', 'data': {'customer': self.customer.pk, 'product': self.product.pk,
+                                                           'status': 'Delivered', 'note': 'batch'}}] * lines
+            operations.append({'resource': 'orders', 'id': order.pk, 'data': {'note': f'{lines} lines'}})
+            with CaptureQueriesContext(connection) as captured:
+                response = self.send('post', url, {'operations': operations})
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(response.json()['data']), lines + 1)
+            return len(captured)
+
+        post(1)  # creates the day's rollup
+        self.assertEqual(post(2), post(20))
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.total_orders, self.customer.delivered_orders), (24, 23))
+        self.assertEqual(Order.objects.get(pk=order.pk).note, '20 lines')
+        self.assertEqual(OrderDailyRollup.objects.get(status='Delivered', category='Outdoor').orders, 23)
+
+        operations = [{'resource': 'tags', 'data': {'name': 'New'}},
+                      {'resource': 'orders', 'data': {'customer': self.customer.pk, 'product': 0}}]
+        response = self.send('post', url, {'operations': operations})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']['operations']), ['1'])
+        self.assertFalse(Tag.objects.exists())
+
+
+# pinned: the pages rendered by the ASGI application must not read the static files manifest from S3
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AsgiTests(TestCase):
+    @staticmethod
+    def wsgi_application(environ, start_response):
+        start_response('201 Created', [('Content-Type', 'text/plain')])
+        body = environ['wsgi.input'].read()
+        path = environ['PATH_INFO'].encode('latin-1').decode()  # PEP 3333: bytes as latin-1
+        yield f"{environ['REQUEST_METHOD']} {path}?{environ['QUERY_STRING']} ".encode()
+        yield f"{environ['HTTP_X_TAGS']} {environ['CONTENT_LENGTH']} ".encode()
+        yield body
+
+    def call(self, application, scope, body_chunks=(b'',)):
+        messages = []
+        received = [{'type': 'http.request', 'body': chunk, 'more_body': more}
+                    for chunk, more in zip(body_chunks, [True] * (len(body_chunks) - 1) + [False])]
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            messages.append(message)
+        asyncio.run(application(scope, receive, send))
+        return messages
+
+    def test_wsgi_application_served(self):
+        scope = {'type': 'http', 'method': 'POST', 'path': '/orders/é', 'query_string': b'status=Pending',
+                 'headers': [(b'x-tags', b'a'), (b'x-tags', b'b'), (b'content-length', b'6')]}
+        messages = self.call(WsgiToAsgi(self.wsgi_application, threads=2), scope, [b'ab', b'cdef'])
+
+        self.assertEqual(messages[0], {'type': 'http.response.start', 'status': 201,
+                                       'headers': [(b'content-type', b'text/plain')]})
+        body = b''.join(message['body'] for message in messages[1:])
+        self.assertEqual(body, 'POST /orders/é?status=Pending a,b 6 abcdef'.encode())
+        self.assertEqual(len(messages), 5)  # streamed: a message per chunk, and the end
+        self.assertFalse(messages[-1].get('more_body'))
+
+    def test_cookie_headers_joined(self):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/',
+                 'headers': [(b'cookie', b'csrftoken=x'), (b'cookie', b'sessionid=y'), (b'accept', b'text/html'),
+                             (b'accept', b'*/*')]}
+        request = WSGIRequest(asgi.environ(scope))
+        self.assertEqual(request.COOKIES, {'csrftoken': 'x', 'sessionid': 'y'})
+        self.assertEqual(request.META['HTTP_ACCEPT'], 'text/html,*/*')
+
+    def test_django_view(self):
+        from cms.asgi import application
+
+        scope = {'type': 'http', 'method': 'GET', 'path': reverse('login'), 'headers': [(b'host', b'testserver')]}
+        messages = self.call(application, scope)  # no session: no query in the server thread
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn(b'login', b''.join(message.get('body', b'') for message in messages[1:]).lower())
+
+    def test_bench_asgi(self):
+        out = StringIO()
+        call_command('bench_asgi', 'login', latency=0, clients=2, requests=4, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:2] for line in lines],
+                         [['wsgi', 'concurrent_queries=0'], ['asgi', 'concurrent_queries=0'],
+                          ['wsgi', 'concurrent_queries=4'], ['asgi', 'concurrent_queries=4']])
+
+
+class ConcurrentQueryTests(SimpleTestCase):
+    databases = {'default'}  # outside a transaction: the threads' connections see the tables
+
+    def test_gather(self):
+        route = routers.Route()
+        routers.current_route.set(route)
+        self.addCleanup(routers.current_route.set, None)
+
+        def slow(value):
+            time.sleep(0.2)
+            return value, threading.current_thread().name, routers.current_route.get()
+
+        with override_settings(CONCURRENT_QUERIES=2):
+            start = time.perf_counter()
+            results = concurrent.gather(lambda: slow(1), lambda: slow(2), lambda: slow(3))
+            self.assertLess(time.perf_counter() - start, 0.5)  # side by side
+        self.assertEqual([value for value, _, _ in results], [1, 2, 3])
+        self.assertTrue(results[1][1].startswith('queries'))
+        self.assertTrue(all(result[2] is route for result in results))  # the request's context
+
+        with override_settings(CONCURRENT_QUERIES=2), self.assertRaises(Http404):
+            concurrent.gather(lambda: None, lambda: get_object_or_404(Customer, pk=0))
+
+    def test_sequential_in_transaction(self):
+        with override_settings(CONCURRENT_QUERIES=2), transaction.atomic():
+            names = concurrent.gather(lambda: threading.current_thread().name, lambda: threading.current_thread().name)
+        self.assertEqual(set(names), {threading.current_thread().name})
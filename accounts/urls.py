@@ -1,7 +1,8 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 
-from . import views
+from . import api, views
+from .forms import QueuedPasswordResetForm
 
 urlpatterns = [
 
@@ -14,13 +15,25 @@ urlpatterns = [
     path('create_order/<int:pk>', views.create_order, name='create_order'),
     path('update_order/<int:pk>', views.update_order, name='update_order'),
     path('delete_order/<int:pk>', views.delete_order, name='delete_order'),
+    path('orders/export/', views.export_orders, name='export_orders'),  # ?format=csv|ndjson&status=...
+    path('search/', views.search_view, name='search'),  # ?q=...&page=...
+    path('reports/orders/', views.order_reports, name='order_reports'),  # ?start=&end=&category=, from the rollups
+    path('metrics/', views.metrics, name='metrics'),  # p50/p95/p99 per view, JSON
+    path('metrics/db/', views.db_metrics, name='db_metrics'),  # connection and pool counters, JSON
+
+    # JSON API(see api.py)
+    path('api/', api.root, name='api_root'),  # GET: the resources, POST: a batch
+    path('api/<str:resource>/', api.collection, name='api_collection'),  # ?fields=&include=&after=&limit=
+    path('api/<str:resource>/<int:pk>/', api.item, name='api_item'),
 
     path('register/', views.register_user, name='register'),
     path('logout/', views.logout_user, name='logout'),
     path('login/', views.login_user, name='login'),
 
     # submit email form
-    path('password_reset/', auth_views.PasswordResetView.as_view(), name='password_reset'),
+    # the email is sent in the background(see jobs.py)
+    path('password_reset/', auth_views.PasswordResetView.as_view(form_class=QueuedPasswordResetForm),
+         name='password_reset'),
 
     # Sent email message successfully
     path('password_reset/done/', auth_views.PasswordResetDoneView.as_view(), name='password_reset_done'),
@@ -1,59 +1,78 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.forms import inlineformset_factory
 from django.contrib import messages, auth
 from django.contrib.auth.models import User  # user model
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
 
 from .models import *
-from .forms import OrderModelForm, CreateUserForm, CustomerForm
+from .forms import OrderModelForm, CreateUserForm, CustomerForm, OrderFormSet, OrderLineForm, OrderTrendForm
 from .filters import OrderFilter
 from .decorators import unauthenticated_user, allowed_users, admin_only
-from django.core.mail import send_mail
+from .stats import customer_stats, dashboard_stats, status_key
+from .pagination import paginate
+from .export import FORMATS, export_lines, filter_orders
+from .cache import cached_products_table
+from .search import search
+from .instrumentation import summarize
+from .db.pool import db_stats
+from .db.routers import replica_stats
+from .jobs import enqueue
+from .signals import forget_customer_group
+from .rollups import order_trend
+from .concurrent import gather
+from .conditional import (conditional_page, customer_fingerprint, dashboard_fingerprint, products_fingerprint,
+                          user_page_fingerprint)
 
 
 # classes for the url pattern
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['admin'])
 @admin_only
+@conditional_page(dashboard_fingerprint)
 def home(request):
-    orders = Order.objects.all()
-    customers = Customer.objects.all()
+    # select_related: load the related rows in the same query, instead of one query per row in the template
+    orders = Order.objects.select_related('product', 'customer__user')
+    customers = Customer.objects.select_related('user')
 
-    total_customers = customers.count()  # returns the total number of customers
-    total_orders = orders.count()  # returns the total number of orders
-    delivered = orders.filter(status='Delivered').count()  # returns total number of orders that have been 'Delivered'
-    pending = orders.filter(status='Pending').count()  # returns the total number of orders that are 'Pending'
+    # total customers, total orders and orders per status('Pending', 'Delivered', ...) in a single query, and the two
+    # keyset paginated lists(?orders=<cursor>&customers=<cursor>): independent, run side by side(see concurrent.py)
+    stats, orders_page, customers_page = gather(dashboard_stats,
+                                                lambda: paginate(orders, request.GET.get('orders')),
+                                                lambda: paginate(customers, request.GET.get('customers')))
 
     context = {
-        'orders': orders,
-        'customers': customers,
-        'total_customers': total_customers,
-        'total_orders': total_orders,
-        'delivered': delivered,
-        'pending': pending,
+        'orders': orders_page,
+        'customers': customers_page,
+        'stats': stats,
     }
     return render(request, 'accounts/dashboard.html', context)
 
 
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['admin'])
+@conditional_page(products_fingerprint)
 def products(request):
-    products = Product.objects.all()
-    context = {'products': products}
+    # the product table is rendered once per catalogue change and then served from the cache
+    # of the catalogue version of the page's ETag(see conditional.products_fingerprint)
+    context = {'products_table': cached_products_table(getattr(request, 'catalogue_version', None))}
     return render(request, 'accounts/products.html', context)
 
 
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['admin'])
+@conditional_page(customer_fingerprint)
 def customer(request, pk):
-    customer = get_object_or_404(Customer, id=pk)  # get a single customer
-
-    customer_orders = customer.order_set.all()  # retrieves all orders made by a single customer
-    count_customer_orders = customer_orders.count()  # total orders for a single customer
-
+    # retrieves all orders made by a single customer
+    customer_orders = Order.objects.filter(customer=pk).select_related('product', 'customer__user')
     order_filter = OrderFilter(request.GET, queryset=customer_orders)  # creates an object of django-filters
-    customer_orders = order_filter.qs
+
+    # the customer and the page of their orders: independent, run side by side(see concurrent.py)
+    customer, customer_orders = gather(lambda: get_object_or_404(Customer, id=pk),
+                                       lambda: paginate(order_filter.qs, request.GET.get('orders')))
+    count_customer_orders = customer.total_orders  # total orders for a single customer(a stored counter)
 
     context = {'single_customer': customer,
                'customer_orders': customer_orders,
@@ -66,20 +85,28 @@ def customer(request, pk):
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['admin'])
 def create_order(request, pk):
-    order_form_set = inlineformset_factory(Customer, Order, fields=('product', 'status', 'note'))
+    # OrderFormSet: loads the products once for all the forms, saves the orders with a single bulk_create()
+    order_form_set = inlineformset_factory(Customer, Order, form=OrderLineForm, formset=OrderFormSet,
+                                           fields=('product', 'status', 'note'))
     # pk is passed because orders are created from the customers page
-    customer = Customer.objects.get(id=pk)
-    # queryset=Order.objects.none(): hides initial data
-    formset = order_form_set(queryset=Order.objects.none(), instance=customer)
+    customer = get_object_or_404(Customer, id=pk)
     # order_form = OrderModelForm(initial={'customer': customer})  # recall that the form is sent as method="post"
     if request.method == 'POST':
-        formset = order_form_set(request.POST, instance=customer)
+        formset = order_form_set(request.POST, queryset=Order.objects.none(), instance=customer)
         if formset.is_valid():
-            formset.save()
-            messages.success(request, f'Successfully created an order!')
+            orders = formset.save()  # one transaction: the INSERT and the customer's order counters
+
+            if not orders:
+                messages.warning(request, 'No order was entered.')
+                return render(request, 'accounts/order_form.html', {'formset': formset})
+
+            messages.success(request, f'Successfully created {len(orders)} order(s)!')
             # cus_id = request.POST['customer']
             # return redirect('/customer/'+cus_id)  # redirect to customers detail page
             return redirect('/')  # redirect to dashboard(home)
+    else:
+        # queryset=Order.objects.none(): hides initial data
+        formset = order_form_set(queryset=Order.objects.none(), instance=customer)
 
     context = {'formset': formset}
     return render(request, 'accounts/order_form.html', context)
@@ -88,7 +115,8 @@ def create_order(request, pk):
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['admin'])
 def update_order(request, pk):
-    order_instance = Order.objects.get(id=pk)  # retrieve details belong to a single customer
+    # retrieve details belong to a single customer
+    order_instance = Order.objects.select_related('product', 'customer__user').get(id=pk)
     # order_form = OrderModelForm(instance=order_instance)  # prefill in the form with the customers orders
     order_form = OrderModelForm(instance=order_instance)  # prefill in the form with the customers orders
 
@@ -108,7 +136,7 @@ def update_order(request, pk):
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['admin'])
 def delete_order(request, pk):
-    delete_item = Order.objects.get(id=pk)
+    delete_item = Order.objects.select_related('product', 'customer__user').get(id=pk)
     if request.method == "POST":
         delete_item.delete()
         messages.info(request,
@@ -119,6 +147,85 @@ def delete_order(request, pk):
     return render(request, 'accounts/delete.html', context)
 
 
+@login_required(login_url='login')
+@allowed_users(allowed_roles=['admin'])
+def search_view(request):
+    """
+    ranked full text search over customers, products and order notes: ?q=<words>&page=<number>
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+
+    context = {'query': query, 'results': search(query, page)}
+    return render(request, 'accounts/search.html', context)
+
+
+@login_required(login_url='login')
+@allowed_users(allowed_roles=['admin'])
+def export_orders(request):
+    """
+    streams the orders as CSV or NDJSON(?format=ndjson), filtered like the customer page e.g. ?status=Pending
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest(f"Unknown format '{export_format}', use one of: {', '.join(FORMATS)}")
+
+    order_filter = filter_orders(request.GET)
+    if not order_filter.is_valid():
+        return HttpResponseBadRequest(order_filter.errors.as_text())
+
+    lines = export_lines(order_filter.qs, export_format)  # a generator: rows are read and sent chunk by chunk
+    response = StreamingHttpResponse(lines, content_type=FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+    return response
+
+
+@login_required(login_url='login')
+@allowed_users(allowed_roles=['admin'])
+def order_reports(request):
+    """
+    orders per day and status over a period(?start=&end=&category=), read from the daily rollups: a few hundred
+    rows whatever the number of orders
+    """
+    form = OrderTrendForm(request.GET)
+    context = {'form': form}
+    if form.is_valid():
+        trend = order_trend(form.cleaned_data['start'], form.cleaned_data['end'], form.cleaned_data['category'])
+        totals = [sum(counts) for counts in zip(*trend['statuses'].values())]
+        highest = max(totals, default=0) or 1
+        # a row per day: its total, and a bar segment per status, as a percentage of the busiest day
+        context['days'] = [
+            {'day': day, 'total': total,
+             'segments': [(status_key(status), status, counts[index], 100 * counts[index] / highest)
+                          for status, counts in trend['statuses'].items() if counts[index]]}
+            for index, (day, total) in enumerate(zip(trend['days'], totals))]
+        context['totals'] = [(status_key(status), status, count) for status, count in trend['totals'].items()]
+        context['total'] = sum(totals)
+    return render(request, 'accounts/reports.html', context)
+
+
+@login_required(login_url='login')
+@allowed_users(allowed_roles=['admin'])
+def metrics(request):
+    """
+    p50/p95/p99 of the request time, queries, query time, template time and response size of each view
+    """
+    return JsonResponse(summarize())
+
+
+@login_required(login_url='login')
+@allowed_users(allowed_roles=['admin'])
+def db_metrics(request):
+    """
+    this worker's database connection counters: connections opened, reconnections and, when pooled, checkouts, waits;
+    under 'replicas', the reads sent to each replica and their health
+    """
+    return JsonResponse({**db_stats(), 'replicas': replica_stats()})
+
+
 @unauthenticated_user
 def register_user(request):
     if request.method == 'POST':
@@ -143,7 +250,22 @@ def register_user(request):
                     return redirect('register')
                 else:
                     # ***** register user
-                    User.objects.create_user(username=username, password=password, email=email)
+                    # one transaction: the user, its group and Customer(signals.customer_profile) and the email job
+                    for attempt in range(2):
+                        try:
+                            with transaction.atomic():
+                                User.objects.create_user(username=username, password=password, email=email)
+                                if email:
+                                    # sent by 'manage.py run_jobs', not while the visitor waits
+                                    enqueue('send_email', subject='Welcome to CMS',
+                                            message=f'Hi {username}, your account has been created. You can now '
+                                                    f'log in.',
+                                            recipient_list=[email])
+                            break
+                        except IntegrityError:
+                            if attempt:
+                                raise
+                            forget_customer_group()  # its cached id: the group was deleted by another process
 
                     messages.success(request,
                                      "Registration successful. Please login")
@@ -191,17 +313,15 @@ def logout_user(request):
 
 @login_required(login_url='login')
 @allowed_users(allowed_roles=['customer'])
+@conditional_page(user_page_fingerprint)
 def user_page(request):
-    orders = request.user.customer.order_set.all()  # get all others relevant to a specific customer from the User model
+    # get all others relevant to a specific customer from the User model
+    orders = request.user.customer.order_set.select_related('product', 'customer__user')
 
-    total_orders = orders.count()  # returns the total number of orders
-    delivered = orders.filter(status='Delivered').count()  # returns total number of orders that have been 'Delivered'
-    pending = orders.filter(status='Pending').count()  # returns the total number of orders that are 'Pending'
+    stats = customer_stats(request.user.customer)  # total orders and orders per status, from the stored counters
 
-    context = {'orders': orders,
-               'total_orders': total_orders,
-               'delivered': delivered,
-               'pending': pending,
+    context = {'orders': paginate(orders, request.GET.get('orders')),
+               'stats': stats,
                }
     return render(request, 'accounts/user.html', context)
 
@@ -216,7 +336,11 @@ def account_settings(request):
     if request.method == 'POST':
         form = CustomerForm(request.POST, request.FILES, instance=current_customer)  # request.FILES: for files
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                customer = form.save()
+                if 'profile_picture' in form.changed_data and customer.profile_picture:
+                    # resized in the background(see images.py); the original is shown until then
+                    enqueue('image_variants', customer_id=customer.pk, picture=customer.profile_picture.name)
             messages.success(request, f"Profile Updated.")
 
     context = {'form': form}
@@ -0,0 +1,19 @@
+"""
+ASGI config for cms project.
+
+It exposes the ASGI callable as a module-level variable named ``application``, for an ASGI server e.g.
+uvicorn cms.asgi:application
+
+Django 2.2 has no ASGI handler of its own: the WSGI application is served through accounts.asgi.WsgiToAsgi, which
+runs the requests in a thread pool.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from accounts.asgi import WsgiToAsgi
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cms.settings')
+
+application = WsgiToAsgi(get_wsgi_application())
@@ -1,6 +1,7 @@
 import os
 
 from django.contrib.messages import constants as messages  # import Django flash messages
+from django.core.exceptions import ImproperlyConfigured
 #  Python provides a mail sending interface via the smtplib module
 
 from my_settings import Configure
@@ -45,20 +46,33 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.PerformanceMiddleware',  # first: its timings include the other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if DEBUG:
+    # N+1 queries in a request: a warning on the dev server, an error in the tests(see accounts/nplusone.py)
+    MIDDLEWARE.insert(1, 'accounts.nplusone.NPlusOneMiddleware')
+
+NPLUSONE_THRESHOLD = 5  # times the same statement may run in one request
+NPLUSONE_ACTION = 'warn'
+
+TEST_RUNNER = 'accounts.nplusone.NPlusOneTestRunner'
+
 ROOT_URLCONF = 'cms.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times the rendering for the PerformanceMiddleware
+        'BACKEND': 'accounts.instrumentation.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,17 +100,76 @@ WSGI_APPLICATION = 'cms.wsgi.application'
 # }
 
 # PostgreSQL configuration
+# connections are reused across requests(a new TLS connection to RDS per request dominates cheap pages) and pinged
+# before reuse; set db_pool in my_settings.Configure e.g. {'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_AGE': 600} to share a
+# pool of connections between the threads of a threaded WSGI server instead(see accounts/db/pool.py)
+DB_POOL = getattr(Configure, 'db_pool', None)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'accounts.db.postgresql',  # django.db.backends.postgresql with health checks and the pool
         'NAME': 'postgres',
         'USER': 'postgres',
         'PASSWORD': Configure.postgres,
         'HOST': 'cms-db.caxfwbgqaxyz.eu-west-2.rds.amazonaws.com',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else getattr(Configure, 'conn_max_age', 600),  # pooled: returned per request
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': DB_POOL,
     }
 }
 
+# read replicas(hosts in my_settings.Configure.replica_hosts) for the GET requests of the read-only views; writes, and
+# the reads that follow a write, stay on the primary(see accounts/db/routers.py)
+for number, host in enumerate(getattr(Configure, 'replica_hosts', []), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host, 'OPTIONS': {'connect_timeout': 2},
+                                     'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['accounts.db.routers.ReplicaRouter']
+REPLICA_VIEWS = ['home', 'products', 'customer', 'user_page', 'export_orders', 'order_reports']
+
+# threads running the independent queries of the read views side by side, on connections of their own; 0: one after
+# the other(see accounts/concurrent.py)
+CONCURRENT_QUERIES = getattr(Configure, 'concurrent_queries', 0)
+
+# Cache  https://docs.djangoproject.com/en/2.2/topics/cache/
+# local memory by default(and in the tests): one cache per worker process, its entries invalidated by versions kept in
+# the database(see accounts/cache.py); set cache_backend/cache_location in my_settings.Configure to share the cache
+# between workers e.g. 'django.core.cache.backends.memcached.MemcachedCache' with '127.0.0.1:11211', or
+# 'django_redis.cache.RedisCache' with 'redis://127.0.0.1:6379/1' (requires django-redis)
+CACHES = {
+    'default': {
+        'BACKEND': getattr(Configure, 'cache_backend', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': getattr(Configure, 'cache_location', ''),
+    },
+    # the sessions of SESSION_MODE 'cached_db': a cache on the web server itself(e.g. a local memcached) saves the
+    # round trip to the database server; it must still be shared by the workers of that server
+    'sessions': {
+        'BACKEND': getattr(Configure, 'session_cache_backend',
+                           getattr(Configure, 'cache_backend', 'django.core.cache.backends.locmem.LocMemCache')),
+        'LOCATION': getattr(Configure, 'session_cache_location', getattr(Configure, 'cache_location', '')),
+    },
+}
+
+# Sessions  https://docs.djangoproject.com/en/2.2/topics/http/sessions/
+# SESSION_MODE(my_settings.Configure.session_mode):
+#   'db': a session SELECT per request(and an UPDATE when it changes)
+#   'cached_db': read from the 'sessions' cache, written through to the database(the default with a shared cache: a
+#                local memory cache per worker would keep serving a session another worker logged out)
+#   'signed_cookies': the session in a cookie signed with SECRET_KEY, no storage at all; a logout only drops the
+#                     browser's copy, and the cookie is sent with every request(keep the session small)
+# expired sessions of 'db'/'cached_db' are deleted by 'manage.py clear_expired_sessions'(see accounts/sessions.py)
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_MODE = getattr(Configure, 'session_mode', 'cached_db' if hasattr(Configure, 'cache_backend') else 'db')
+if SESSION_MODE not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"session_mode must be one of {', '.join(SESSION_ENGINES)}, not '{SESSION_MODE}'")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+SESSION_CACHE_ALIAS = 'sessions'
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -148,6 +221,8 @@ USE_TZ = True
 # MEDIA_ROOT = os.path.join(BASE_DIR, 'cms/static/img')
 
 # message config  https://docs.djangoproject.com/en/2.2/ref/contrib/messages/
+# kept in a cookie until shown: no session write for the messages of the login/logout redirects
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
 MESSAGE_TAGS = {
     messages.ERROR: 'alert-danger',  # value is equal to the bootstrap class of 'alert-danger'
     messages.SUCCESS: 'alert-success',
@@ -170,7 +245,7 @@ AWS_ACCESS_KEY_ID = Configure.access_key
 AWS_SECRET_ACCESS_KEY = Configure.secret_key
 AWS_STORAGE_BUCKET_NAME = Configure.bucket_name
 AWS_S3_CUSTOM_DOMAIN = '%s.s3.amazonaws.com' % AWS_STORAGE_BUCKET_NAME
-AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
+AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}  # media; static files: see accounts.storage.cache_control
 AWS_DEFAULT_ACL = 'public-read'  # None
 
 AWS_LOCATION = 'static'
@@ -178,10 +253,21 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'cms/static')
 ]
 
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-
-STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-STATIC_URL = 'https://%s/%s/' % (AWS_S3_CUSTOM_DOMAIN, AWS_LOCATION)
+# S3 storages that upload several files at a time; static files are served under hashed names, uploaded by
+# 'manage.py collectstatic_parallel' from STATICFILES_STAGING_ROOT(see accounts/storage.py)
+DEFAULT_FILE_STORAGE = 'accounts.storage.ParallelS3Storage'
+
+STATICFILES_STAGING_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# 's3', or 'local' for the environments without S3: 'manage.py collectstatic' into STATIC_ROOT, served by the app with
+# the pre-compressed files and long cache headers(see accounts/static.py)
+STATIC_HOSTING = getattr(Configure, 'static_hosting', 's3')
+if STATIC_HOSTING == 'local':
+    STATICFILES_STORAGE = 'accounts.storage.CompressedManifestStaticFilesStorage'
+    STATIC_ROOT = STATICFILES_STAGING_ROOT
+    STATIC_URL = '/static/'
+else:
+    STATICFILES_STORAGE = 'accounts.storage.StaticS3Storage'
+    STATIC_URL = 'https://%s/%s/' % (AWS_S3_CUSTOM_DOMAIN, AWS_LOCATION)
 
 MEDIA_URL = '/media/'
 
@@ -14,16 +14,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from accounts import static as static_files
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('accounts.urls'))
 
 ]
 
+if settings.STATIC_HOSTING == 'local':
+    urlpatterns.insert(0, re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), static_files.serve))
+
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # required for media files to show on the website
\ No newline at end of file